@@ -0,0 +1,6 @@
+# ASGI entry point, e.g. hypercorn asgi:app
+from backend.aio import create_app
+
+from config import DevelopmentConfig
+
+app = create_app(DevelopmentConfig)
@@ -6,10 +6,13 @@ from config import config_dict
 from flask_migrate import Migrate
 
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from backend.database import RoutingSession
 
 load_dotenv()
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 # migrate = Migrate()
 
 def create_app(config):
@@ -21,14 +24,30 @@ def create_app(config):
     # config[config_name].init_app(app)
     # app.config.from_pyfile("../config.py")
 
+    # JSON encoder for responses: default (stdlib json) or orjson
+    if app.config.get('JSON_PROVIDER') == 'orjson':
+        from backend.json_provider import OrjsonProvider
+        app.json = OrjsonProvider(app)
+
 
-    # initialise database
+    # initialise database, with the pool and timeout settings of the config
+    from backend import database
+    database.configure(app)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            database.init_app(app, engine)
 
 
     # For all endpoints
     CORS(app)
 
+    # behind PROXY_FIX_X_FOR proxies (Heroku's router is one), take the
+    # client address from X-Forwarded-For
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app,
+                                x_for=app.config['PROXY_FIX_X_FOR'])
+
     # after a request is received this method is run. Sets CORS headers on the response.
     @app.after_request
     def after_request(response):
@@ -38,66 +57,61 @@ def create_app(config):
     # allow models to be accessed
     from backend import models
 
+    # per-route timings, /metrics endpoint and Server-Timing header
+    from backend import instrumentation
+    instrumentation.init_app(app)
+
+    # route anonymous reads to the read replica, if one is configured
+    from backend import replica
+    replica.init_app(app)
+
+    # cache for the public read endpoints, invalidated on commit
+    from backend import cache
+    cache.init_app(app)
+
+    # rate and concurrency limits of the expensive endpoints
+    from backend.api import admission
+    admission.init_app(app)
+
+    # change events pushed to GET /api/events
+    from backend import events
+    events.init_app(app)
+
     # register bluprint to access endpoints
     from backend.api import api_blueprint
     app.register_blueprint(api_blueprint, url_prefix='/api')
 
+    # Flask cli command to bulk load groups and catalog data
+    from backend.importer import geocode_command, import_command
+    app.cli.add_command(import_command)
+    app.cli.add_command(geocode_command)
+
+    # Flask cli command to export the group directory as NDJSON
+    from backend.export import export_command
+    app.cli.add_command(export_command)
+
+    # Flask cli command to refresh the precomputed demand statistics
+    from backend.stats import refresh_stats_command
+    app.cli.add_command(refresh_stats_command)
+
+    # Flask cli command to compact the change log
+    from backend.changes import compact_changes_command
+    app.cli.add_command(compact_changes_command)
+
     # Flask cli command to seed the database
     @app.cli.command('initdb')
     def initdb_command():
+        from backend import fixtures
 
-        groups = [models.Group(name='British Heart Foundation',
-                               description='Your donations are hugely '
-                                           'appreciated and help us fund '
-                                           'life saving research. Please '
-                                           'donate via the handy donation '
-                                           'drop point in store.',
-                               address='Guiness Trust, King\'s Road',
-                               city='London',
-                               county='Greater London',
-                               postcode='SW10 0TT',
-                               email='info@bhf.org.uk'),
-                  models.Group(name='Trussel Trust Leeds',
-                               description='Your foodbank relies on your '
-                                          'goodwill and support.',
-                               address='Unit 3, Burley Hill',
-                               city='Leeds',
-                               county='West Yorkshire',
-                               postcode='LS4 2PU',
-                               email='info@foodbank.or.uk'),
-                  models.Group(name='Leeds Community Centre',
-                               description='Our mission is to provide a hub '
-                                           'for the whole community to take '
-                                           'part in a range of positive '
-                                           'activities.',
-                               address='48 Bilton Lane',
-                               city='Leeds',
-                               county='West Yorkshire',
-                               postcode='LS1 3DD',
-                               email='info@community.org.uk')]
-
-        categories = [models.Category(name='Books'),
-                      models.Category(name='Clothes'),
-                      models.Category(name='Food'),
-                      models.Category(name='Stationary')]
-
-        items = [models.Item(name='Fiction', category_id=1),
-                 models.Item(name='Non-Fiction', category_id=1),
-                 models.Item(name='Wooly Jumpers', category_id=2),
-                 models.Item(name='Tinned Fruit', category_id=3),
-                 models.Item(name='UHT Milk', category_id=3),
-                 models.Item(name='Dried Rice', category_id=3),
-                 models.Item(name='Craft Materials', category_id=4),
-                 models.Item(name='Whiteboard Pens', category_id=4),]
-
-        items_requested = [models.ItemRequested(item_id=1, group_id=1),
-                           models.ItemRequested(item_id=2, group_id=1),
-                           models.ItemRequested(item_id=3, group_id=1),
-                           models.ItemRequested(item_id=4, group_id=2),
-                           models.ItemRequested(item_id=5, group_id=2),
-                           models.ItemRequested(item_id=6, group_id=2),
-                           models.ItemRequested(item_id=7, group_id=3),
-                           models.ItemRequested(item_id=2, group_id=3),]
+        groups = [models.Group(**group) for group in fixtures.GROUPS]
+
+        categories = [models.Category(name=name)
+                      for name in fixtures.CATEGORIES]
+
+        items = [models.Item(**item) for item in fixtures.ITEMS]
+
+        items_requested = [models.ItemRequested(**item_requested)
+                           for item_requested in fixtures.ITEMS_REQUESTED]
 
 
         db.session.add_all(groups)
@@ -106,5 +120,9 @@ def create_app(config):
         db.session.add_all(items_requested)
         db.session.commit()
 
+    # Flask cli command to generate a large synthetic dataset
+    from backend.generator import generate_command
+    app.cli.add_command(generate_command)
+
     return app
 
@@ -0,0 +1,51 @@
+"""
+ASGI variant of the API, served by Quart on an async database driver
+(asyncpg on Postgres). It uses the models, queries and auth rules of the
+sync app, so one worker can keep many requests waiting on the database or
+on Auth0 at once.
+"""
+from quart import Quart, g
+
+
+def create_app(config):
+
+    app = Quart(__name__)
+    app.config.from_object(config)
+
+    from backend.aio import database
+    engine = database.create_engine(app.config)
+    app.extensions['async_engine'] = engine
+    app.extensions['async_sessionmaker'] = database.create_sessionmaker(engine)
+
+    @app.teardown_appcontext
+    async def close_session(exception):
+        session = g.pop('db_session', None)
+        if session is not None:
+            await session.close()
+
+    @app.after_serving
+    async def dispose_engine():
+        await engine.dispose()
+
+    # CORS headers for all endpoints, as set by the sync app
+    @app.after_request
+    async def after_request(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, DELETE, PATCH, OPTIONS')
+        return response
+
+    # writes drop the changed groups from the sync app's shared cache
+    if app.config.get('RESPONSE_CACHE_BACKEND') == 'redis':
+        from backend.cache import RedisBackend, ResponseCache
+        app.extensions['response_cache'] = ResponseCache(
+            RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL']))
+
+    # the rate and concurrency limits of the sync app
+    from backend.api import admission
+    admission.init_app(app)
+
+    from backend.aio.routes import api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    return app
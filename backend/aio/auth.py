@@ -0,0 +1,36 @@
+import asyncio
+from functools import wraps
+
+from quart import request
+
+from backend.api import auth
+from backend.api.auth import check_permissions, parse_auth_header
+
+
+async def verify_token(token):
+    """
+    Returns the verified payload of the token. A token in the token cache
+    is served straight away; otherwise the signature check, and any JWKS
+    fetch it needs, run on a worker thread so they do not block the event
+    loop.
+    """
+    payload = auth.token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    return await asyncio.to_thread(auth.verify_decode_jwt, token)
+
+
+# Decorator for routes, with the same rules as backend.api.auth
+def requires_auth(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            token = parse_auth_header(request.headers.get('Authorization'))
+            payload = await verify_token(token)
+            check_permissions(permission, payload)
+
+            return await f(payload, *args, **kwargs)
+
+        return wrapper
+    return requires_auth_decorator
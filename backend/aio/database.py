@@ -0,0 +1,112 @@
+from uuid import uuid4
+
+from quart import current_app, g
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from backend.database import timeout_settings
+from backend.models import CHANGED_GROUPS, track_group_changes
+
+# async drivers for the databases the sync app runs on
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+# pool options of SQLALCHEMY_ENGINE_OPTIONS that also apply to the async
+# engine
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle',
+                'pool_pre_ping')
+
+
+def async_url(url):
+    """
+    Returns the database url with the async driver of its database, e.g.
+    postgresql+asyncpg:// for postgresql:// or postgresql+psycopg2://.
+    """
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def engine_options(config):
+    """
+    Options for create_async_engine: the pool settings of the sync engine
+    and, on Postgres, the connection timeouts.
+
+    asyncpg prepares every statement and caches it per connection. Through
+    PgBouncer in transaction pooling mode the next transaction may run on
+    a different server connection, so with DB_PGBOUNCER both statement
+    caches are turned off and prepared statements get unique names. The
+    timeouts are then set per transaction (see create_engine).
+    """
+    options = {name: value for name, value in
+               (config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}).items()
+               if name in POOL_OPTIONS}
+
+    url = async_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'postgresql':
+        return url, options
+
+    connect_args = {}
+    if config.get('DB_PGBOUNCER'):
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+        connect_args['statement_cache_size'] = 0
+        connect_args['prepared_statement_name_func'] = \
+            lambda: f'__asyncpg_{uuid4()}__'
+    else:
+        connect_args['server_settings'] = {
+            name: str(value) for name, value in timeout_settings(config)}
+
+    options['connect_args'] = connect_args
+    return url, options
+
+
+def create_engine(config):
+    """Creates the async engine for the configured database."""
+    url, options = engine_options(config)
+    engine = create_async_engine(url, **options)
+
+    settings = timeout_settings(config)
+    if config.get('DB_PGBOUNCER') and settings \
+            and engine.dialect.name == 'postgresql':
+        # one statement each, as asyncpg prepares them
+        statements = [f'SET LOCAL {name} = {value}'
+                      for name, value in settings]
+
+        @event.listens_for(engine.sync_engine, 'begin')
+        def set_transaction_timeouts(conn):
+            for statement in statements:
+                conn.exec_driver_sql(statement)
+
+    return engine
+
+
+class TrackedSession(Session):
+    """
+    Session under each AsyncSession. Records, versions and logs changed
+    groups like the sessions of the sync app.
+    """
+
+
+track_group_changes(TrackedSession)
+
+
+@event.listens_for(TrackedSession, 'after_commit')
+@event.listens_for(TrackedSession, 'after_soft_rollback')
+def forget_changed_groups(session, *args):
+    session.info.pop(CHANGED_GROUPS, None)
+
+
+def create_sessionmaker(engine):
+    # rows are serialized after the commit, so keep them loaded
+    return async_sessionmaker(engine, expire_on_commit=False,
+                              sync_session_class=TrackedSession)
+
+
+def get_session():
+    """The AsyncSession of the current request, created on first use."""
+    if 'db_session' not in g:
+        g.db_session = current_app.extensions['async_sessionmaker']()
+    return g.db_session
@@ -0,0 +1,695 @@
+from functools import wraps
+
+from quart import Blueprint, current_app, jsonify, request
+from sqlalchemy import delete, exists, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import NotFound, MethodNotAllowed, BadRequest, \
+    UnprocessableEntity, TooManyRequests, ServiceUnavailable
+
+from backend.api.admission import admit, client_key
+from backend.api.auth import AuthError
+from backend.api.conditional import listing_etag, set_validators, \
+    validator_columns
+from backend.api.pagination import ESTIMATED_ROWS, TOTAL_MODES, \
+    decode_cursor, encode_cursor
+from backend.api.routes import ITEMS_PER_PAGE, get_bulk_item_ids, \
+    get_representation
+from backend.models import Category, Group, Item, ItemRequested, \
+    insert_ignoring_conflicts, record_changes
+from .auth import requires_auth
+from .database import get_session
+
+api_blueprint = Blueprint('api_blueprint', __name__)
+
+
+async def format_rows(session, rows, item_ids=None,
+                      fields=Group.DEFAULT_FIELDS, include_items=True):
+    """Group.format_rows on the async session."""
+    requested = None
+    if include_items:
+        requested = []
+        if rows:
+            requested = await session.execute(Group.requested_items_select(
+                [row.id for row in rows], item_ids))
+
+    return Group.format_listing(rows, requested, fields)
+
+
+def admitted(name):
+    """
+    backend.api.admission.admitted for the async views: the same rate
+    limit and concurrency slots, taken in a worker thread as the limiter
+    may wait on Redis. Views of this app return whole responses, so the
+    slot is released when the view returns.
+    """
+    def admitted_decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('admission')
+            if limiter is None:
+                return await f(*args, **kwargs)
+
+            handle = await current_app.ensure_async(admit)(
+                limiter, name, current_app.config, client_key(request))
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                if handle is not None:
+                    await current_app.ensure_async(limiter.release)(
+                        name, handle)
+
+        return wrapper
+    return admitted_decorator
+
+
+async def not_modified(etag, last_modified):
+    """backend.api.conditional.not_modified for the async views."""
+    response = set_validators(current_app.response_class(), etag,
+                              last_modified)
+    await response.make_conditional(request)
+
+    if response.status_code == 304:
+        return response
+    return None
+
+
+async def total_groups(session, total):
+    """
+    The total_groups of a listing for the total request argument, see
+    get_groups in backend.api.routes.
+    """
+    if total == 'estimate' and session.bind.dialect.name == 'postgresql':
+        estimate = (await session.execute(
+            ESTIMATED_ROWS,
+            {'table': f'"{Group.__tablename__}"'})).scalar()
+        if estimate is not None and estimate >= 0:
+            return estimate
+
+    if total == 'none':
+        return None
+
+    return (await session.execute(
+        select(func.count()).select_from(Group))).scalar()
+
+
+async def invalidate_groups(group_ids):
+    """
+    Drops the responses of the changed groups from the sync app's shared
+    response cache, if it uses one.
+    """
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None and group_ids:
+        await current_app.ensure_async(cache.invalidate_groups)(
+            list(group_ids))
+
+
+###### READ / GET Group and Item details - ANY USER (No login needed) ######
+
+@api_blueprint.route('/groups')
+@admitted('read')
+async def get_groups():
+    """
+    Retrieves all groups, ordered by county, then city, by page number or
+    cursor. Same arguments, responses and validators as get_groups in
+    backend.api.routes.
+    """
+    cursor = request.args.get('cursor')
+    total = request.args.get('total',
+                             'exact' if cursor is None else 'none')
+
+    if total not in TOTAL_MODES:
+        raise BadRequest('Request is not valid')
+
+    fields, include_items = get_representation(request.args)
+    session = get_session()
+    query = (Group.listing_select(fields)
+             .add_columns(*validator_columns())
+             .order_by(Group.county, Group.city, Group.id))
+
+    if cursor is not None:
+        return await get_groups_by_cursor(session, query, cursor, total,
+                                          fields, include_items)
+
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        raise NotFound('Groups not found')
+
+    rows = (await session.execute(
+        query.limit(ITEMS_PER_PAGE)
+        .offset((page - 1) * ITEMS_PER_PAGE))).all()
+
+    if not rows and page > 1:
+        raise NotFound('Groups not found')
+
+    count = await total_groups(session, total)
+
+    # answer revalidations before reading the requested items
+    etag = listing_etag(rows, count)
+    last_modified = rows[0].last_modified if rows else None
+    response = await not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    return set_validators(jsonify(
+        {
+            'success': True,
+            'groups': await format_rows(session, rows, fields=fields,
+                                        include_items=include_items),
+            'total_groups': count,
+        }
+    ), etag, last_modified)
+
+
+async def get_groups_by_cursor(session, query, cursor, total, fields,
+                               include_items):
+    """
+    Retrieves the page of groups following the cursor.
+
+    :param query: listing query in county, city, id order
+    :param cursor: cursor returned with the previous page, or empty for
+    the first page
+    :param total: one of TOTAL_MODES
+    :param fields: fields of each group, from Group.FIELDS
+    :param include_items: whether to add the requested items
+    """
+    if cursor:
+        try:
+            county, city, id = decode_cursor(cursor, str, str, int)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+
+        query = query.where(tuple_(Group.county, Group.city, Group.id) >
+                            tuple_(county, city, id))
+
+    # fetch one extra row to find out if there is a next page
+    rows = (await session.execute(query.limit(ITEMS_PER_PAGE + 1))).all()
+
+    if not rows:
+        raise NotFound('Groups not found')
+
+    next_cursor = None
+    if len(rows) > ITEMS_PER_PAGE:
+        rows = rows[:ITEMS_PER_PAGE]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.county, last.city, last.id])
+
+    response = {
+        'success': True,
+        'next_cursor': next_cursor,
+    }
+    if total != 'none':
+        response['total_groups'] = await total_groups(session, total)
+
+    etag = listing_etag(rows, response.get('total_groups'), next_cursor)
+    last_modified = rows[0].last_modified
+    conditional = await not_modified(etag, last_modified)
+    if conditional is not None:
+        return conditional
+
+    response['groups'] = await format_rows(session, rows, fields=fields,
+                                           include_items=include_items)
+    return set_validators(jsonify(response), etag, last_modified)
+
+
+@api_blueprint.route('/groups/<int:id>')
+@admitted('read')
+async def get_group_by_id(id):
+    """
+    Retrieves the specified group and items requested by that group.
+
+    :param id: Group id
+
+    :returns 200 and group, with an ETag and Last-Modified; 304 if not
+    modified, 400 if fields or include are not valid, 404 if not found.
+    """
+    fields, include_items = get_representation(request.args)
+    session = get_session()
+    rows = (await session.execute(
+        Group.listing_select(fields)
+        .add_columns(Group.version, Group.updated_at)
+        .where(Group.id == id))).all()
+
+    if not rows:
+        raise NotFound('Group not found')
+
+    # answer revalidations before reading the requested items
+    etag = f'{id}.{rows[0].version}'
+    response = await not_modified(etag, rows[0].updated_at)
+    if response is not None:
+        return response
+
+    group, = await format_rows(session, rows, fields=fields,
+                               include_items=include_items)
+    return set_validators(jsonify(
+        {
+            'success': True,
+            'group': group,
+        }
+    ), etag, rows[0].updated_at)
+
+
+@api_blueprint.route('/items/<int:id>/groups')
+@admitted('read')
+async def get_groups_requesting_item(id):
+    """
+    Retrieves the groups that have requested the specified item. Same
+    arguments and responses as in backend.api.routes.
+
+    :param id: Item id
+    """
+    session = get_session()
+    item = (await session.execute(
+        select(Item.id, Item.name, Item.category_id)
+        .where(Item.id == id))).one_or_none()
+    if item is None:
+        raise NotFound('Item not found')
+
+    fields, include_items = get_representation(request.args)
+    query = (Group.listing_select(fields)
+             .join(ItemRequested, ItemRequested.group_id == Group.id)
+             .where(ItemRequested.item_id == id))
+
+    response = await get_requesting_groups(session, query, [id], fields,
+                                           include_items)
+    response['item'] = {'id': item.id, 'name': item.name,
+                        'category_id': item.category_id}
+    return jsonify(response)
+
+
+@api_blueprint.route('/categories/<int:id>/groups')
+@admitted('read')
+async def get_groups_requesting_category(id):
+    """
+    Retrieves the groups that have requested any item in the specified
+    category. Same arguments and responses as in backend.api.routes.
+
+    :param id: Category id
+    """
+    session = get_session()
+    category = (await session.execute(
+        select(Category.id, Category.name)
+        .where(Category.id == id))).one_or_none()
+    if category is None:
+        raise NotFound('Category not found')
+
+    item_ids = (await session.execute(
+        select(Item.id).where(Item.category_id == id))).scalars().all()
+
+    fields, include_items = get_representation(request.args)
+    query = Group.listing_select(fields).where(
+        exists().where(ItemRequested.group_id == Group.id,
+                       ItemRequested.item_id.in_(item_ids)))
+
+    response = await get_requesting_groups(session, query, item_ids, fields,
+                                           include_items)
+    response['category'] = {'id': category.id, 'name': category.name}
+    return jsonify(response)
+
+
+async def get_requesting_groups(session, query, item_ids, fields,
+                                include_items):
+    """
+    Filters the groups selected by query by the county and city request
+    arguments and returns the page following the cursor argument.
+
+    :param query: Group.listing_select() of the groups requesting the items
+    :param item_ids: ids of the items the groups are listed for
+    :param fields: fields of each group, from Group.FIELDS
+    :param include_items: whether to add the requested items
+    :returns: response dict with the groups and next_cursor
+    """
+    cursor = request.args.get('cursor')
+
+    if cursor:
+        try:
+            after, = decode_cursor(cursor, int)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+        query = query.where(Group.id > after)
+
+    for argument in ('county', 'city'):
+        value = request.args.get(argument)
+        if value:
+            query = query.where(getattr(Group, argument) == value)
+
+    # fetch one extra row to find out if there is a next page
+    rows = (await session.execute(
+        query.order_by(Group.id).limit(ITEMS_PER_PAGE + 1))).all()
+
+    next_cursor = None
+    if len(rows) > ITEMS_PER_PAGE:
+        rows = rows[:ITEMS_PER_PAGE]
+        next_cursor = encode_cursor([rows[-1].id])
+
+    groups = await format_rows(session, rows, item_ids, fields,
+                               include_items)
+    for row, group in zip(rows, groups):
+        group['id'] = row.id
+
+    return {
+        'success': True,
+        'groups': groups,
+        'next_cursor': next_cursor,
+    }
+
+
+#######  UPDATE/PATCH Group contact details - Logged in Admin only ######
+
+@api_blueprint.route('/groups/<int:id>', methods=['PATCH'])
+@admitted('write')
+@requires_auth('patch:group_email')
+async def update_group_by_id(jwt, id):
+    """
+    Updates the email address of the specified group.
+
+    :param jwt: JWT token must have patch:group_email permission
+    :param id: Group Id
+
+    :returns: 200 and id of updated group, 404 if group not found, 422 if
+    the email is empty.
+    """
+    session = get_session()
+    try:
+        body = await request.get_json()
+        email = body.get('email')
+
+        if email == "":
+            raise ValueError('Empty email')
+
+        updated = (await session.execute(
+            update(Group).where(Group.id == id).values(email=email)
+            .returning(Group.id))).scalar()
+        if updated is None:
+            raise LookupError('No such group')
+        record_changes(session.sync_session, 'group', 'update', id)
+        await session.commit()
+
+    except ValueError as e:
+        print(e)
+        raise UnprocessableEntity('Email address is required')
+
+    except Exception as e:
+        print(e)
+        await session.rollback()
+        raise NotFound('Group not found')
+
+    await invalidate_groups([id])
+    return jsonify(
+        {
+            'id': id,
+            'success': True
+        }
+    )
+
+
+######  DELETE items - Logged in Group or Admin ######
+
+@api_blueprint.route('/groups/<int:id>/items/<int:item_id>', methods=[
+    'DELETE'])
+@admitted('write')
+@requires_auth('delete:item_requested')
+async def delete_requested_item_by_id(jwt, id, item_id):
+    """
+    Deletes the specified group's requested item.
+
+    :param jwt: Jwt must have delete:group_items permission.
+    :param id: Group Id
+    :param item_id: Item Id to be deleted from the group's requested items
+
+    :returns: 200 OK and deleted item_id if successful; 404 if item id not
+    found.
+    """
+    session = get_session()
+    deleted = (await session.execute(
+        delete(ItemRequested)
+        .where(ItemRequested.group_id == id,
+               ItemRequested.item_id == item_id)
+        .returning(ItemRequested.id))).scalar()
+    if deleted is not None:
+        record_changes(session.sync_session, 'item_requested', 'delete', id,
+                       [item_id])
+    await session.commit()
+
+    if deleted is None:
+        raise NotFound('Item not found')
+
+    await invalidate_groups([id])
+    return jsonify(
+        {
+            'success': True,
+            'deleted_item': item_id
+        }
+    )
+
+
+######  CREATE Group - for logged in ADMIN Role only ######
+
+@api_blueprint.route('/groups', methods=['POST'])
+@admitted('write')
+@requires_auth('post:group')
+async def create_item(jwt):
+    """
+    Create a new group. Requires Group data in the request body.
+
+    :param jwt: Must have post:group permissions.
+
+    :return: 201 if created, 422 if request body cannot be processed,
+    400 if request is in any other way invalid.
+    """
+    session = get_session()
+    try:
+        body = await request.get_json()
+
+        new_group = Group(name=body.get('name'),
+                          description=body.get('description'),
+                          address=body.get('address'),
+                          city=body.get('city'),
+                          county=body.get('county'),
+                          postcode=body.get('postcode'),
+                          email=body.get('email'))
+
+        if new_group.address == "":
+            raise ValueError("Empty String")
+
+        session.add(new_group)
+        await session.commit()
+
+    except ValueError as e:
+        print(e)
+        raise UnprocessableEntity("Cannot create group with the request "
+                                  "data")
+    except Exception as e:
+        print(e)
+        await session.rollback()
+        raise BadRequest("Request is not valid")
+
+    await invalidate_groups([new_group.id])
+    return jsonify(
+        {
+            'success': True,
+        }
+    ), 201
+
+
+###### CREATE/POST item_requested - add item to group's requested items -
+# logged in group only ######
+@api_blueprint.route('/groups/<int:id>/items', methods=['POST'])
+@admitted('write')
+@requires_auth('post:item_requested')  # must have group owner role
+async def update_items(jwt, id):
+    """
+    Adds an item to the specified group, or several with item_ids. Same
+    responses as update_items in backend.api.routes.
+
+    :param jwt: Jwt must have post:group_items permission.
+    :param id: Group Id
+    """
+    session = get_session()
+    body = await request.get_json(silent=True)
+
+    if isinstance(body, dict) and 'item_ids' in body:
+        item_ids = get_bulk_item_ids(body)
+
+        try:
+            results = await add_many(session, id, item_ids)
+        except (IntegrityError, LookupError) as e:
+            print(e)
+            await session.rollback()
+            raise NotFound('Group not found')
+
+        return jsonify(
+            {
+                'success': True,
+                'group_id': id,
+                'results': [{'item_id': item_id, 'status': status}
+                            for item_id, status in results.items()],
+            }
+        ), 201
+
+    try:
+        created = await add_one(session, id, body.get('item_id'))
+
+    except Exception as e:
+        print(e)
+        await session.rollback()
+        raise BadRequest('Request is not valid')
+
+    return jsonify(
+        {
+            'success': True,
+            'group_id': id,
+            'status': 'created' if created else 'already_requested',
+        }
+    ), 201
+
+
+async def add_one(session, group_id, item_id):
+    """ItemRequested.add_one on the async session."""
+    created = (await session.execute(
+        insert_ignoring_conflicts(ItemRequested, ['group_id', 'item_id'],
+                                  session.bind.dialect.name)
+        .values(group_id=group_id, item_id=item_id)
+        .returning(ItemRequested.item_id))).scalar()
+
+    if created is not None:
+        record_changes(session.sync_session, 'item_requested', 'insert',
+                       group_id, [item_id])
+    await session.commit()
+
+    if created is not None:
+        await invalidate_groups([group_id])
+    return created is not None
+
+
+async def add_many(session, group_id, item_ids):
+    """ItemRequested.add_many on the async session."""
+    known = ItemRequested.known_items((await session.execute(
+        ItemRequested.known_items_select(group_id, item_ids))).all())
+    rows = [{'group_id': group_id, 'item_id': item_id}
+            for item_id in item_ids if item_id in known]
+
+    created = set()
+    if rows:
+        created = set((await session.execute(
+            insert_ignoring_conflicts(ItemRequested, ['group_id', 'item_id'],
+                                      session.bind.dialect.name)
+            .values(rows)
+            .returning(ItemRequested.item_id))).scalars())
+    if created:
+        record_changes(session.sync_session, 'item_requested', 'insert',
+                       group_id, sorted(created))
+    await session.commit()
+
+    if created:
+        await invalidate_groups([group_id])
+
+    return {item_id: 'created' if item_id in created
+            else 'already_requested' if item_id in known
+            else 'not_found'
+            for item_id in item_ids}
+
+
+@api_blueprint.route('/groups/<int:id>/items', methods=['DELETE'])
+@admitted('write')
+@requires_auth('delete:item_requested')
+async def delete_requested_items(jwt, id):
+    """
+    Deletes several of the specified group's requested items in one
+    statement. Same responses as in backend.api.routes.
+
+    :param jwt: Jwt must have delete:group_items permission.
+    :param id: Group Id
+    """
+    session = get_session()
+    item_ids = get_bulk_item_ids(await request.get_json(silent=True))
+
+    deleted = set((await session.execute(
+        delete(ItemRequested)
+        .where(ItemRequested.group_id == id,
+               ItemRequested.item_id.in_(item_ids))
+        .returning(ItemRequested.item_id))).scalars())
+    if deleted:
+        record_changes(session.sync_session, 'item_requested', 'delete', id,
+                       sorted(deleted))
+    await session.commit()
+
+    if deleted:
+        await invalidate_groups([id])
+
+    return jsonify(
+        {
+            'success': True,
+            'group_id': id,
+            'results': [{'item_id': item_id,
+                         'status': 'deleted' if item_id in deleted
+                         else 'not_found'}
+                        for item_id in item_ids],
+        }
+    )
+
+
+################## ERROR HANDLING  ############################
+
+
+@api_blueprint.app_errorhandler(NotFound)
+async def not_found(e):
+    return jsonify(
+        {
+            'success': False,
+            "error": NotFound.code,
+            "message": e.description,
+        }), 404
+
+
+@api_blueprint.errorhandler(BadRequest)
+async def bad_request(e):
+    return jsonify({
+        "success": False,
+        "error": BadRequest.code,
+        "message": e.description
+    }), 400
+
+
+@api_blueprint.errorhandler(TooManyRequests)
+@api_blueprint.errorhandler(ServiceUnavailable)
+async def shed_load(e):
+    """
+    Receives the rate limit and busy errors and propagates the response,
+    telling the client when to retry
+    """
+    response = jsonify({
+        "success": False,
+        "error": e.code,
+        "message": e.description
+    })
+    response.status_code = e.code
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@api_blueprint.errorhandler(UnprocessableEntity)
+async def unprocessable(e):
+    return jsonify({
+        "success": False,
+        "error": UnprocessableEntity.code,
+        "message": e.description
+    }), 422
+
+
+@api_blueprint.app_errorhandler(MethodNotAllowed)
+async def method_not_allowed(e):
+    return jsonify(
+        {
+            "success": False,
+            "error": MethodNotAllowed.code,
+            "message": e.description,
+        })
+
+
+@api_blueprint.errorhandler(AuthError)
+async def handle_auth_error(e):
+    response = jsonify(e.error)
+    response.status_code = e.status_code
+    return response
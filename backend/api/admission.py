@@ -0,0 +1,296 @@
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from . import auth
+
+# seconds a client is asked to wait when a route class is saturated
+BUSY_RETRY_AFTER = 1
+
+# seconds after which a slot not released by a crashed worker is reclaimed
+SLOT_TIMEOUT = 60
+
+# seconds between two refreshes of the slot of a streamed response, so
+# long exports keep it past SLOT_TIMEOUT
+SLOT_REFRESH = SLOT_TIMEOUT / 3
+
+
+class MemoryLimiter:
+    """
+    Concurrency slots and token buckets of one worker. Limits apply to
+    each gunicorn worker separately.
+    """
+
+    def __init__(self, max_clients=10000):
+        self.max_clients = max_clients
+        self._running = {}
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, name, limit):
+        """
+        Takes one of the limit slots of a route class.
+
+        :returns: a handle for release(), or None if all slots are taken
+        """
+        with self._lock:
+            if self._running.get(name, 0) >= limit:
+                return None
+            self._running[name] = self._running.get(name, 0) + 1
+            return name
+
+    def release(self, name, handle):
+        with self._lock:
+            self._running[name] -= 1
+
+    def refresh(self, name, handle):
+        # slots of one worker are released by it, never reclaimed
+        pass
+
+    def take(self, client, rate, burst):
+        """
+        Takes a token from the client's bucket, which holds up to burst
+        tokens and gains rate tokens per second.
+
+        :returns: 0 if a token was taken, else the seconds until one is
+        available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# KEYS[1] sorted set of running requests; ARGV now, timeout, limit, handle
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1] - ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS[1] bucket hash; ARGV now, rate, burst
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or tonumber(ARGV[1])
+tokens = math.min(burst, tokens + (ARGV[1] - updated) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisLimiter:
+    """
+    Concurrency slots and token buckets shared by all workers, each
+    checked by one script run in Redis. While Redis cannot be reached,
+    every request is admitted. Requires the redis package.
+    """
+
+    def __init__(self, url, prefix='chipin:admission:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.errors = redis.RedisError
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def acquire(self, name, limit):
+        handle = uuid.uuid4().hex
+        try:
+            if not self._acquire(keys=[self.prefix + 'running:' + name],
+                                 args=[time.time(), SLOT_TIMEOUT, limit,
+                                       handle]):
+                return None
+        except self.errors as e:
+            print(e)
+        return handle
+
+    def release(self, name, handle):
+        try:
+            self.client.zrem(self.prefix + 'running:' + name, handle)
+        except self.errors as e:
+            # the slot is reclaimed after SLOT_TIMEOUT
+            print(e)
+
+    def refresh(self, name, handle):
+        """Restarts the timeout of a slot still in use."""
+        key = self.prefix + 'running:' + name
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.zadd(key, {handle: time.time()}, xx=True)
+            pipeline.expire(key, SLOT_TIMEOUT)
+            pipeline.execute()
+        except self.errors as e:
+            print(e)
+
+    def take(self, client, rate, burst):
+        try:
+            return float(self._take(keys=[self.prefix + 'bucket:' + client],
+                                    args=[time.time(), rate, burst]))
+        except self.errors as e:
+            print(e)
+            return 0
+
+
+def init_app(app):
+    """
+    Creates the limiter configured by ADMISSION_BACKEND: memory (default),
+    redis, or none to admit every request.
+    """
+    backend_name = app.config.get('ADMISSION_BACKEND', 'memory')
+
+    if backend_name == 'none':
+        return
+    if backend_name == 'redis':
+        limiter = RedisLimiter(app.config['ADMISSION_REDIS_URL'])
+    else:
+        limiter = MemoryLimiter()
+
+    app.extensions['admission'] = limiter
+
+
+def client_key(current_request=request):
+    """
+    The JWT sub of the caller if its token has already been verified, else
+    its address, which is the one forwarded by the proxy when
+    PROXY_FIX_X_FOR is set. Unverified tokens are not decoded, so they
+    cannot be used to pick another client's bucket.
+
+    :param current_request: the Flask request, or that of the ASGI app
+    """
+    auth_header = current_request.headers.get('Authorization')
+    if auth_header:
+        try:
+            payload = auth.token_cache.peek(
+                auth.parse_auth_header(auth_header))
+        except auth.AuthError:
+            payload = None
+        if payload is not None and payload.get('sub'):
+            return 'sub:' + payload['sub']
+    return 'ip:' + str(current_request.remote_addr)
+
+
+def admit(limiter, name, config, client):
+    """
+    Takes a token from the client's bucket and a slot of a class of
+    routes.
+
+    :returns: a handle for limiter.release(), or None if the class has no
+    concurrency limit
+    :raises TooManyRequests: if the client has used up its rate limit
+    :raises ServiceUnavailable: if all slots of the class are taken
+    """
+    wait = limiter.take(client, config.get('RATE_LIMIT_PER_SECOND', 10),
+                        config.get('RATE_LIMIT_BURST', 50))
+    if wait:
+        raise TooManyRequests('Too many requests',
+                              retry_after=math.ceil(wait))
+
+    limit = config.get('ADMISSION_CONCURRENCY', {}).get(name)
+    if limit is None:
+        return None
+
+    handle = limiter.acquire(name, limit)
+    if handle is None:
+        raise ServiceUnavailable('Server is busy',
+                                 retry_after=BUSY_RETRY_AFTER)
+    return handle
+
+
+def release_once(limiter, name, handle):
+    """Releases a slot on the first call only."""
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            limiter.release(name, handle)
+    return release
+
+
+def released_after(chunks, release, refresh):
+    """
+    Yields the chunks of a body, calling refresh every SLOT_REFRESH
+    seconds, then calls release.
+    """
+    refreshed = time.monotonic()
+    try:
+        for chunk in chunks:
+            if time.monotonic() - refreshed >= SLOT_REFRESH:
+                refresh()
+                refreshed = time.monotonic()
+            yield chunk
+    finally:
+        release()
+
+
+def admitted(name):
+    """
+    Decorator rejecting requests to a class of routes straight away when
+    the client has used up its rate limit (429), or when the class already
+    runs ADMISSION_CONCURRENCY[name] requests (503), rather than letting
+    them queue for a database connection. The slot is held until a
+    streamed response is closed. Place it under cached_response, so cached
+    responses are served regardless, and above requires_auth.
+    """
+    def admitted_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('admission')
+            if limiter is None:
+                return f(*args, **kwargs)
+
+            handle = admit(limiter, name, current_app.config, client_key())
+            if handle is None:
+                return f(*args, **kwargs)
+
+            try:
+                response = f(*args, **kwargs)
+            except Exception:
+                limiter.release(name, handle)
+                raise
+
+            # a streamed body is produced after the view returns
+            if isinstance(response, Response) and response.is_streamed:
+                release = release_once(limiter, name, handle)
+                response.response = released_after(
+                    response.response, release,
+                    lambda: limiter.refresh(name, handle))
+                response.call_on_close(release)
+            else:
+                limiter.release(name, handle)
+            return response
+
+        return wrapper
+    return admitted_decorator
@@ -1,16 +1,27 @@
-import json
 from flask import request
 from functools import wraps
-from urllib.request import urlopen
 import os
 from dotenv import load_dotenv
 from jose import jwt, exceptions
+from backend.instrumentation import timed
+from .jwks import JWKSKeyStore, JWKSUnavailable
+from .token_cache import VerifiedTokenCache
 
 load_dotenv()
 
 AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
 ALGORITHMS = [os.getenv("ALGORITHMS")]
 API_AUDIENCE = os.getenv("API_AUDIENCE")
+# can be pointed at a local stand-in for the Auth0 key set, e.g. in tests
+JWKS_URL = os.getenv("JWKS_URL",
+                     f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# signing keys are cached in-process rather than fetched on every request
+jwks_store = JWKSKeyStore(JWKS_URL)
+
+# decoded payloads of verified tokens, dropped when their key is rotated out
+token_cache = VerifiedTokenCache(int(os.getenv("TOKEN_CACHE_SIZE", 1024)))
+jwks_store.add_listener(token_cache.retain_kids)
 
 ## AuthError Exception
 '''
@@ -30,8 +41,14 @@ def get_token_auth_header():
     :return
         Auth Token if found or 401
        """
-    auth_header = request.headers.get('Authorization', None)
+    return parse_auth_header(request.headers.get('Authorization', None))
+
+
+def parse_auth_header(auth_header):
+    """Returns the bearer token of an Authorization header value, or 401
 
+    :param auth_header: the header value, None if it was not sent
+    """
     if not auth_header:
         raise AuthError({
             'code': 'authorization_header_missing',
@@ -88,12 +105,15 @@ def check_permissions(permission, payload):
 
 def verify_decode_jwt(token):
     """
-    Checks token is valid
+    Checks token is valid. Tokens that have already been verified are served
+    from the token cache until they expire.
     :param token:
     :return:
     """
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -102,15 +122,23 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        key = jwks_store.get_key(unverified_header['kid'])
+    except JWKSUnavailable as e:
+        print(e)
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -120,6 +148,7 @@ def verify_decode_jwt(token):
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
+            token_cache.put(token, payload, rsa_key['kid'])
             return payload
 
         except exceptions.ExpiredSignatureError:
@@ -152,9 +181,10 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with timed('auth'):
+                token = get_token_auth_header()
+                payload = verify_decode_jwt(token)
+                check_permissions(permission, payload)
 
             return f(payload, *args, **kwargs)
 
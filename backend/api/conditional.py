@@ -0,0 +1,58 @@
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import func, select
+
+from backend.models import Group
+
+
+def validator_columns():
+    """
+    Columns to add to a Group.listing_select() for the validators: the
+    version of each group, and the time any group was last changed, read
+    once from the updated_at index.
+    """
+    return (Group.version,
+            Group.updated_at,
+            select(func.max(Group.updated_at)).scalar_subquery()
+            .label('last_modified'))
+
+
+def listing_etag(rows, *extra):
+    """
+    Strong entity tag of a page of groups, changing whenever a group on it
+    changes or the page holds other groups.
+
+    :param rows: rows selected with validator_columns()
+    :param extra: other values in the response, e.g. the total
+    """
+    versions = ','.join(f'{row.id}.{row.version}' for row in rows)
+    data = f'{versions}|{extra!r}'.encode()
+    return hashlib.sha1(data).hexdigest()[:24]
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Sets ETag and Last-Modified on a response. Clients are asked to
+    revalidate before reusing it.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    """
+    Returns a 304 response if the If-None-Match or If-Modified-Since header
+    of the request matches the validators, or None if the response has to
+    be sent.
+    """
+    response = set_validators(current_app.response_class(), etag,
+                              last_modified)
+    response.make_conditional(request)
+
+    if response.status_code == 304:
+        return response
+    return None
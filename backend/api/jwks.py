@@ -0,0 +1,137 @@
+import json
+import re
+import threading
+import time
+from urllib.request import urlopen
+
+# Cache-Control directive giving the lifetime of the key set in seconds
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+class JWKSUnavailable(Exception):
+    """Raised when no key set has ever been fetched and the fetch fails."""
+
+
+class JWKSKeyStore:
+    """
+    In-process cache of the signing keys published at a JWKS url.
+
+    Keys are indexed by kid and kept for the lifetime given by the
+    Cache-Control max-age of the response (or default_ttl if none is sent).
+    Shortly before the keys expire they are refreshed on a background
+    thread, so requests only block on the network for the very first fetch.
+    An unknown kid forces a refresh, at most once per min_refresh_interval.
+    If a refresh fails the previous keys keep being served.
+
+    Callables registered with add_listener are called with the set of kids
+    after every successful fetch.
+    """
+
+    def __init__(self, url, default_ttl=600, min_refresh_interval=30,
+                 refresh_ahead=60, timeout=5, clock=time.monotonic):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self.clock = clock
+
+        self._keys = {}
+        self._loaded = False
+        self._expires_at = 0
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._background = None
+        self._listeners = []
+
+    def get_key(self, kid):
+        """
+        Returns the JWK with the given kid, or None if the key set does not
+        contain it.
+
+        :raises JWKSUnavailable: if no key set could ever be fetched
+        """
+        now = self.clock()
+
+        if not self._loaded or now >= self._expires_at:
+            self._refresh()
+        elif now >= self._expires_at - self.refresh_ahead:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._loaded:
+            # the key may have been rotated in since the last fetch
+            self._refresh()
+            key = self._keys.get(kid)
+
+        return key
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def kids(self):
+        """Returns the kids of the keys currently held."""
+        return set(self._keys)
+
+    def clear(self):
+        """Drops all keys so the next lookup fetches the key set again."""
+        with self._lock:
+            self._keys = {}
+            self._loaded = False
+            self._expires_at = 0
+            self._last_attempt = None
+
+    def _refresh(self):
+        """
+        Fetches the key set unless another fetch was attempted within
+        min_refresh_interval. Failures leave the current keys in place.
+        """
+        with self._lock:
+            now = self.clock()
+            if (self._last_attempt is not None
+                    and now - self._last_attempt < self.min_refresh_interval):
+                if not self._loaded:
+                    raise JWKSUnavailable(f'Unable to fetch {self.url}')
+                return
+            self._last_attempt = now
+
+            try:
+                keys, ttl = self._fetch()
+            except Exception as e:
+                print(e)
+                if not self._loaded:
+                    raise JWKSUnavailable(f'Unable to fetch {self.url}') \
+                        from e
+                return
+
+            self._keys = keys
+            self._loaded = True
+            self._expires_at = self.clock() + ttl
+
+        for listener in self._listeners:
+            listener(set(keys))
+
+    def _refresh_in_background(self):
+        if self._background is not None and self._background.is_alive():
+            return
+        if (self._last_attempt is not None and self.clock()
+                - self._last_attempt < self.min_refresh_interval):
+            return
+        self._background = threading.Thread(target=self._refresh,
+                                            daemon=True)
+        self._background.start()
+
+    def _fetch(self):
+        """
+        :return: the keys indexed by kid, and their lifetime in seconds
+        """
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+            cache_control = response.headers.get('Cache-Control', '')
+
+        keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+
+        match = MAX_AGE_PATTERN.search(cache_control)
+        ttl = int(match.group(1)) if match else self.default_ttl
+
+        return keys, ttl
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+
+from sqlalchemy import func, select, text
+
+from backend import db
+
+# accepted values of the `total` request argument
+TOTAL_MODES = ('exact', 'estimate', 'none')
+
+# planner's row estimate of a table, -1 if it has never been analyzed
+ESTIMATED_ROWS = text('SELECT reltuples::bigint FROM pg_class '
+                      'WHERE oid = to_regclass(:table)')
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of the last row on a page as an opaque cursor.
+
+    :param values: list of JSON serializable values
+    """
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decodes a cursor created by encode_cursor.
+
+    :param cursor: the opaque cursor
+    :param types: the type, or tuple of types, of each value the cursor
+    must hold. Booleans are not accepted as ints.
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Malformed cursor') from e
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Malformed cursor')
+
+    for value, value_type in zip(values, types):
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise ValueError('Malformed cursor')
+
+    return values
+
+
+def estimated_total(model):
+    """
+    Returns the planner's row estimate for the model's table. This reads
+    Postgres statistics instead of counting the rows, so it is cheap but
+    only as fresh as the last ANALYZE. Falls back to an exact count on
+    other databases, or when the table has not been analyzed yet.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            ESTIMATED_ROWS, {'table': f'"{model.__tablename__}"'}).scalar()
+
+        if estimate is not None and estimate >= 0:
+            return estimate
+
+    return db.session.execute(
+        select(func.count()).select_from(model)).scalar()
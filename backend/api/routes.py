@@ -1,78 +1,658 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request, stream_with_context
+from sqlalchemy import exists, func, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from . import api_blueprint
-from backend.models import Group, ItemRequested
+from backend import db
+from backend import events
+from backend.cache import cached_response
+from backend.changes import CHANGES_LIMIT, MAX_CHANGES_LIMIT, \
+    changes_since, compacted_through, latest_token
+from backend.export import export_groups, gzipped
+from backend.instrumentation import timed
+from backend.replica import replica_read
+from backend.search import query_words, search_groups
+from backend.stats import DIMENSIONS, current_demand
+from backend.models import Category, Group, Item, ItemRequested
+from .admission import admitted
 from .auth import requires_auth, AuthError
+from .conditional import listing_etag, not_modified, set_validators, \
+    validator_columns
+from .pagination import TOTAL_MODES, decode_cursor, encode_cursor, \
+    estimated_total
 from werkzeug.exceptions import NotFound, MethodNotAllowed, BadRequest, \
-    UnprocessableEntity
+    Gone, ServiceUnavailable, TooManyRequests, UnprocessableEntity
 
 # Constant for pagination
 ITEMS_PER_PAGE = 5
 
+# Maximum number of item ids accepted by the bulk item endpoints
+MAX_BULK_ITEMS = 100
+
+# Longest search query accepted, in characters
+MAX_QUERY_LENGTH = 200
+
+# Most weeks of trend returned by the statistics endpoint
+MAX_STATS_WEEKS = 104
+
+# Defaults and limits of the nearby groups search
+NEARBY_RADIUS_KM = 10
+MAX_NEARBY_RADIUS_KM = 200
+NEARBY_LIMIT = 10
+MAX_NEARBY_LIMIT = 50
+
 
 ###### READ / GET Group and Item details - ANY USER (No login needed) ######
 
+@api_blueprint.route('/health')
+def health():
+    """
+    Tells load balancers the worker is up. It is never rate limited and
+    does not use the database, so it answers while the API sheds load.
+
+    :returns: 200
+    """
+    return jsonify({'success': True})
+
+
 @api_blueprint.route('/groups')
+@cached_response('groups')
+@admitted('read')
+@replica_read
 def get_groups():
     """
     Retrieves all groups from the database, ordered by county,
     then city. Results are paginated in groups of 5. If a request argument
     for page number is not included, page will start at 1.
 
+    If a cursor argument is included (empty for the first page), keyset
+    pagination is used instead of page numbers and the response includes
+    a next_cursor for the following page, or null on the last page.
+
+    The total argument controls total_groups: exact (default for page
+    numbers), estimate (from Postgres statistics) or none (default for
+    cursors).
+
+    The fields argument limits each group to the listed fields, and
+    include=items_requested adds its requested items, which are otherwise
+    left out when fields is given (see get_representation). The other
+    group endpoints take the same arguments.
+
+    Responses carry an ETag and Last-Modified. A request whose
+    If-None-Match or If-Modified-Since matches is answered with 304 before
+    the requested items are read.
+
     :returns 200, list of groups and total number of groups if successful.
-    404 if no groups found.
+    304 if not modified. 400 if the cursor, total, fields or include
+    argument is not valid. 404 if no groups found.
     """
+    cursor = request.args.get('cursor')
+    total = request.args.get('total',
+                             'exact' if cursor is None else 'none')
+
+    if total not in TOTAL_MODES:
+        raise BadRequest('Request is not valid')
+
+    fields, include_items = get_representation(request.args)
+
+    if cursor is not None:
+        return get_groups_by_cursor(cursor, total, fields, include_items)
+
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        raise NotFound('Groups not found')
+
     # returns all group records, ordered by county, then city
     try:
-        groups_query = (Group.query.order_by(Group.county, Group.city)
-                        .paginate(per_page=ITEMS_PER_PAGE,
-                                  page=request.args.get('page', 1,
-                                                        type=int)))
+        rows = db.session.execute(
+            Group.listing_select(fields)
+            .add_columns(*validator_columns())
+            .order_by(Group.county, Group.city, Group.id)
+            .limit(ITEMS_PER_PAGE)
+            .offset((page - 1) * ITEMS_PER_PAGE)).all()
+
+        if not rows and page > 1:
+            raise NotFound('Groups not found')
+
+        if total == 'exact':
+            total_groups = db.session.execute(
+                select(func.count()).select_from(Group)).scalar()
+        elif total == 'estimate':
+            total_groups = estimated_total(Group)
+        else:
+            total_groups = None
+
+        # answer revalidations before reading the requested items
+        etag = listing_etag(rows, total_groups)
+        last_modified = rows[0].last_modified if rows else None
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+
+        requested = Group.requested_items(rows,
+                                          include_items=include_items)
+        with timed('serialize'):
+            groups = Group.format_listing(rows, requested, fields)
+
+            return set_validators(jsonify(
+                {
+                    'success': True,
+                    'groups': groups,
+                    'total_groups': total_groups,
+                }
+            ), etag, last_modified)
+
+    except Exception as e:
+        print(e)
+        raise NotFound('Groups not found')
 
-        # format items in paginate object
-        groups = [group.format() for group in groups_query]
+
+def get_groups_by_cursor(cursor, total, fields, include_items):
+    """
+    Retrieves the page of groups following the cursor, ordered by county,
+    city and id so the page can be found with an index seek rather than an
+    OFFSET.
+
+    :param cursor: cursor returned with the previous page, or empty for
+    the first page
+    :param total: one of TOTAL_MODES
+    :param fields: fields of each group, from Group.FIELDS
+    :param include_items: whether to add the requested items
+    """
+    groups_query = (Group.listing_select(fields)
+                    .add_columns(*validator_columns())
+                    .order_by(Group.county, Group.city, Group.id))
+
+    if cursor:
+        try:
+            county, city, id = decode_cursor(cursor, str, str, int)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+
+        groups_query = groups_query.where(
+            tuple_(Group.county, Group.city, Group.id) >
+            tuple_(county, city, id))
+
+    # fetch one extra row to find out if there is a next page
+    rows = db.session.execute(
+        groups_query.limit(ITEMS_PER_PAGE + 1)).all()
+
+    if not rows:
+        raise NotFound('Groups not found')
+
+    next_cursor = None
+    if len(rows) > ITEMS_PER_PAGE:
+        rows = rows[:ITEMS_PER_PAGE]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.county, last.city, last.id])
+
+    response = {
+        'success': True,
+        'next_cursor': next_cursor,
+    }
+
+    if total == 'exact':
+        response['total_groups'] = db.session.execute(
+            select(func.count()).select_from(Group)).scalar()
+    elif total == 'estimate':
+        response['total_groups'] = estimated_total(Group)
+
+    etag = listing_etag(rows, response.get('total_groups'), next_cursor)
+    last_modified = rows[0].last_modified
+    conditional = not_modified(etag, last_modified)
+    if conditional is not None:
+        return conditional
+
+    requested = Group.requested_items(rows, include_items=include_items)
+    with timed('serialize'):
+        response['groups'] = Group.format_listing(rows, requested, fields)
+        return set_validators(jsonify(response), etag, last_modified)
+
+
+@api_blueprint.route('/groups/export')
+@admitted('export')
+def export_group_directory():
+    """
+    Streams every group with its requested items as NDJSON, one group per
+    line in id order, gzipped if the client accepts it. An interrupted
+    export can be resumed with the after argument, the id of the last
+    group received.
+
+    :returns: 200 and the groups, 400 if after is not valid.
+    """
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            after = int(after)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+
+    chunks = export_groups(after)
+    headers = {'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzipped(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return current_app.response_class(stream_with_context(chunks),
+                                      mimetype='application/x-ndjson',
+                                      headers=headers)
+
+
+@api_blueprint.route('/groups/nearby')
+@cached_response('groups')
+@admitted('search')
+@replica_read
+def get_nearby_groups():
+    """
+    Retrieves the groups closest to a location, nearest first, with their
+    distance in kilometres. A group is located at the centroid of its
+    postcode.
+
+    Request arguments are lat and lng (required), radius in kilometres
+    (default 10, at most 200) and limit (default 10, at most 50). fields
+    and include select the representation as for get_groups; without
+    fields, latitude and longitude are added to the default fields.
+
+    :returns: 200 and list of groups within the radius, 400 if the
+    arguments are not valid.
+    """
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', NEARBY_RADIUS_KM, type=float)
+    limit = request.args.get('limit', NEARBY_LIMIT, type=int)
+
+    if lat is None or lng is None or not -90 <= lat <= 90 \
+            or not -180 <= lng <= 180 \
+            or not 0 < radius <= MAX_NEARBY_RADIUS_KM \
+            or not 0 < limit <= MAX_NEARBY_LIMIT:
+        raise BadRequest('Request is not valid')
+
+    fields, include_items = get_representation(request.args)
+    if 'fields' not in request.args:
+        # nearby groups are located by default
+        fields += ('latitude', 'longitude')
+    distances = dict(Group.nearest(lat, lng, radius, limit))
+
+    rows = []
+    if distances:
+        rows = db.session.execute(
+            Group.listing_select(fields)
+            .where(Group.id.in_(distances))).all()
+        rows.sort(key=lambda row: (distances[row.id], row.id))
+
+    requested = Group.requested_items(rows, include_items=include_items)
+    with timed('serialize'):
+        groups = Group.format_listing(rows, requested, fields)
+        for row, group in zip(rows, groups):
+            group['distance_km'] = round(distances[row.id], 2)
 
         return jsonify(
             {
                 'success': True,
                 'groups': groups,
-                'total_groups': groups_query.total,
             }
         )
 
-    except Exception as e:
-        print(e)
-        raise NotFound('Groups not found')
+
+@api_blueprint.route('/search')
+@cached_response('groups')
+@admitted('search')
+@replica_read
+def search():
+    """
+    Searches groups by name, description, place and the names and
+    categories of their requested items. Groups matching more of the
+    words of the query come first. Results are paginated in groups of 5
+    with a cursor, as for get_groups.
+
+    :returns: 200, list of groups and next_cursor (null on the last page).
+    400 if the query or cursor is not valid.
+    """
+    q = request.args.get('q', '')
+    cursor = request.args.get('cursor')
+
+    if not query_words(q) or len(q) > MAX_QUERY_LENGTH:
+        raise BadRequest('Request is not valid')
+
+    fields, include_items = get_representation(request.args)
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, int, int)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+
+    # fetch one extra row to find out if there is a next page
+    rows = search_groups(q, after, ITEMS_PER_PAGE + 1, fields)
+
+    next_cursor = None
+    if len(rows) > ITEMS_PER_PAGE:
+        rows = rows[:ITEMS_PER_PAGE]
+        next_cursor = encode_cursor([rows[-1].rank, rows[-1].id])
+
+    requested = Group.requested_items(rows, include_items=include_items)
+    with timed('serialize'):
+        return jsonify(
+            {
+                'success': True,
+                'groups': Group.format_listing(rows, requested, fields),
+                'next_cursor': next_cursor,
+            }
+        )
 
 
 @api_blueprint.route('/groups/<int:id>')
+@cached_response('group:{id}')
+@admitted('read')
+@replica_read
 def get_group_by_id(id):
     """
     Retrieves the specified group and items requested by that group.
+    Takes the fields and include arguments of get_groups.
 
     :param id: Group id
 
-    :returns 200 and group; 404 if not found.
+    :returns 200 and group, with an ETag and Last-Modified; 304 if not
+    modified, 400 if fields or include are not valid, 404 if not found.
+    """
+    fields, include_items = get_representation(request.args)
+
+    rows = db.session.execute(
+        Group.listing_select(fields)
+        .add_columns(Group.version, Group.updated_at)
+        .where(Group.id == id)).all()
+    if not rows:
+        raise NotFound('Group not found')
+
+    # answer revalidations before reading the requested items
+    etag = f'{id}.{rows[0].version}'
+    response = not_modified(etag, rows[0].updated_at)
+    if response is not None:
+        return response
+
+    requested = Group.requested_items(rows, include_items=include_items)
+    with timed('serialize'):
+        group, = Group.format_listing(rows, requested, fields)
+
+        return set_validators(jsonify(
+            {
+                'success': True,
+                'group': group,
+            }
+        ), etag, rows[0].updated_at)
+
+
+@api_blueprint.route('/items/<int:id>/groups')
+@cached_response('groups')
+@admitted('read')
+@replica_read
+def get_groups_requesting_item(id):
+    """
+    Retrieves the groups that have requested the specified item, ordered
+    by group id and paginated in groups of 5 with a cursor. Each group
+    only lists its request for this item.
+
+    :param id: Item id
+
+    :returns: 200, the item, list of groups and next_cursor (null on the
+    last page). 400 if the cursor is not valid, 404 if the item is not
+    found.
     """
+    # columns only, as Item eagerly joins every request for it
+    item = db.session.execute(
+        select(Item.id, Item.name, Item.category_id)
+        .where(Item.id == id)).one_or_none()
+    if item is None:
+        raise NotFound('Item not found')
+
+    fields, include_items = get_representation(request.args)
+    query = (Group.listing_select(fields)
+             .join(ItemRequested, ItemRequested.group_id == Group.id)
+             .where(ItemRequested.item_id == id))
+
+    response = get_requesting_groups(query, [id], fields, include_items)
+    response['item'] = {'id': item.id, 'name': item.name,
+                        'category_id': item.category_id}
+
+    with timed('serialize'):
+        return jsonify(response)
+
+
+@api_blueprint.route('/categories/<int:id>/groups')
+@cached_response('groups')
+@admitted('read')
+@replica_read
+def get_groups_requesting_category(id):
+    """
+    Retrieves the groups that have requested any item in the specified
+    category, ordered by group id and paginated in groups of 5 with a
+    cursor. Each group only lists its requests for items in the category.
+
+    :param id: Category id
+
+    :returns: 200, the category, list of groups and next_cursor (null on
+    the last page). 400 if the cursor is not valid, 404 if the category is
+    not found.
+    """
+    category = db.session.execute(
+        select(Category.id, Category.name)
+        .where(Category.id == id)).one_or_none()
+    if category is None:
+        raise NotFound('Category not found')
+
+    item_ids = db.session.execute(
+        select(Item.id).where(Item.category_id == id)).scalars().all()
+
+    fields, include_items = get_representation(request.args)
+    query = Group.listing_select(fields).where(
+        exists().where(ItemRequested.group_id == Group.id,
+                       ItemRequested.item_id.in_(item_ids)))
+
+    response = get_requesting_groups(query, item_ids, fields, include_items)
+    response['category'] = {'id': category.id, 'name': category.name}
+
+    with timed('serialize'):
+        return jsonify(response)
+
+
+def get_requesting_groups(query, item_ids, fields, include_items):
+    """
+    Filters the groups selected by query by the county and city request
+    arguments and returns the page following the cursor argument.
+
+    :param query: Group.listing_select() of the groups requesting the items
+    :param item_ids: ids of the items the groups are listed for
+    :param fields: fields of each group, from Group.FIELDS
+    :param include_items: whether to add the requested items
+    :returns: response dict with the groups and next_cursor
+    """
+    cursor = request.args.get('cursor')
+
+    if cursor:
+        try:
+            after, = decode_cursor(cursor, int)
+        except ValueError as e:
+            print(e)
+            raise BadRequest('Request is not valid')
+        query = query.where(Group.id > after)
+
+    for argument in ('county', 'city'):
+        value = request.args.get(argument)
+        if value:
+            query = query.where(getattr(Group, argument) == value)
+
+    # fetch one extra row to find out if there is a next page
+    rows = db.session.execute(
+        query.order_by(Group.id).limit(ITEMS_PER_PAGE + 1)).all()
+
+    next_cursor = None
+    if len(rows) > ITEMS_PER_PAGE:
+        rows = rows[:ITEMS_PER_PAGE]
+        next_cursor = encode_cursor([rows[-1].id])
+
+    requested = Group.requested_items(rows, item_ids, include_items)
+    with timed('serialize'):
+        groups = Group.format_listing(rows, requested, fields)
+        for row, group in zip(rows, groups):
+            group['id'] = row.id
+
+    return {
+        'success': True,
+        'groups': groups,
+        'next_cursor': next_cursor,
+    }
+
+
+@api_blueprint.route('/stats')
+@admitted('read')
+def get_stats():
+    """
+    Retrieves the number of open requests grouped by category, county or
+    item, and the weekly number of requests made over recent weeks. On
+    Postgres the statistics are precomputed and at most
+    STATS_MAX_STALENESS_SECONDS old, unless stale is true.
+
+    Request arguments are by (category, county or item, default
+    category), weeks of trend (default 12, at most 104), and county and
+    category_id to only count requests of groups in a county or items in
+    a category.
+
+    :returns: 200, totals, trend, refreshed_at and staleness bound. 400 if
+    the arguments are not valid.
+    """
+    by = request.args.get('by', 'category')
+    weeks = request.args.get('weeks', 12, type=int)
+    county = request.args.get('county') or None
+    category_id = request.args.get('category_id', type=int)
+
+    if by not in DIMENSIONS or not 1 <= weeks <= MAX_STATS_WEEKS:
+        raise BadRequest('Request is not valid')
+
+    stats = current_demand(by, weeks, county, category_id)
+
+    with timed('serialize'):
+        return jsonify(
+            {
+                'success': True,
+                'by': by,
+                'totals': stats['totals'],
+                'trend': stats['trend'],
+                'refreshed_at': stats['refreshed_at'],
+                'stale': stats['stale'],
+                'max_staleness_seconds': current_app.config.get(
+                    'STATS_MAX_STALENESS_SECONDS', 300),
+            }
+        )
+
+
+@api_blueprint.route('/changes')
+@admitted('read')
+@replica_read
+def get_changes():
+    """
+    Retrieves the inserts, updates and deletes of groups and requested
+    items after a token, oldest first, so a client can keep a copy of the
+    directory in sync. Without since, only the latest token is returned:
+    take it before fetching everything, then ask for the changes since it.
+
+    Request arguments are since, the next_token of the previous response,
+    and limit (default 100, at most 1000).
+
+    :returns: 200, changes, next_token and has_more. 400 if the arguments
+    are not valid, 410 if changes after since have been compacted away and
+    the client has to fetch everything again.
+    """
+    since = request.args.get('since')
+    limit = request.args.get('limit', CHANGES_LIMIT, type=int)
+
+    if not 1 <= limit <= MAX_CHANGES_LIMIT:
+        raise BadRequest('Request is not valid')
+
+    if since is None:
+        return jsonify(
+            {
+                'success': True,
+                'changes': [],
+                'next_token': latest_token(),
+                'has_more': False,
+            }
+        )
+
     try:
-        group = Group.query.get(id)
-        formatted_group = group.format()
+        since = int(since)
+        if since < 0:
+            raise ValueError('Negative token')
+    except ValueError as e:
+        print(e)
+        raise BadRequest('Request is not valid')
 
+    if since < compacted_through():
+        raise Gone('Changes since the token are no longer available')
+
+    changes, has_more = changes_since(since, limit)
+
+    with timed('serialize'):
         return jsonify(
             {
                 'success': True,
-                'group': formatted_group,
+                'changes': [change.format() for change in changes],
+                'next_token': changes[-1].id if changes else since,
+                'has_more': has_more,
             }
         )
 
-    except Exception as e:
+
+@api_blueprint.route('/events')
+@admitted('events')
+def stream_item_request_events():
+    """
+    Streams requested items as they are created and deleted, as
+    Server-Sent Events whose ids are change tokens. A client reconnecting
+    with a Last-Event-ID header (or last_event_id argument) first receives
+    the events it missed.
+
+    Request arguments are group_id, county and category_id, to only
+    receive events of that group, county or item category.
+
+    :returns: 200 and the event stream, 400 if the arguments are not
+    valid, 410 if events after Last-Event-ID have been compacted away.
+    """
+    filters = {}
+    try:
+        for name in ('group_id', 'category_id'):
+            if request.args.get(name) is not None:
+                filters[name] = int(request.args[name])
+        if request.args.get('county'):
+            filters['county'] = request.args['county']
+
+        since = request.headers.get('Last-Event-ID',
+                                    request.args.get('last_event_id'))
+        if since is not None:
+            since = int(since)
+    except ValueError as e:
         print(e)
-        raise NotFound('Group not found')
+        raise BadRequest('Request is not valid')
+
+    if since is not None and since < compacted_through():
+        raise Gone('Events since the last event id are no longer available')
+
+    broadcaster = current_app.extensions['change_events']
+    subscriber = broadcaster.subscribe(filters)
+
+    return current_app.response_class(
+        stream_with_context(events.stream(broadcaster, subscriber, since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 #######  UPDATE/PATCH Group contact details - Logged in Admin only ######
 
 # Update a group's email.
 @api_blueprint.route('/groups/<int:id>', methods=['PATCH'])
+@admitted('write')
 @requires_auth('patch:group_email')
 def update_group_by_id(jwt, id):
     """
@@ -90,22 +670,19 @@ def update_group_by_id(jwt, id):
     try:
         # body should contain details to change email
         body = request.get_json()
-
-        update_group = Group.query.get(id)
-
-        # update the email address
-        update_group.email = body.get('email')
+        email = body.get('email')
 
         # add further validation here if time
-        if body.get('email') == "":
+        if email == "":
             raise ValueError('Empty email')
 
-        # commit changes
-        update_group.update()
+        # update the email address, without loading the group
+        if not Group.update_email(id, email):
+            raise LookupError('No such group')
 
         return jsonify(
             {
-                'id': update_group.id,
+                'id': id,
                 'success': True
             }
         )
@@ -116,6 +693,7 @@ def update_group_by_id(jwt, id):
 
     except Exception as e:
         print(e)
+        db.session.rollback()
         raise NotFound('Group not found')
 
 
@@ -124,6 +702,7 @@ def update_group_by_id(jwt, id):
 # change this to delete a requested item
 @api_blueprint.route('/groups/<int:id>/items/<int:item_id>', methods=[
     'DELETE'])
+@admitted('write')
 @requires_auth('delete:item_requested')
 def delete_requested_item_by_id(jwt, id, item_id):
     """
@@ -139,13 +718,9 @@ def delete_requested_item_by_id(jwt, id, item_id):
     """
     try:
 
-        # need both id's to retrieve the correct item_requested record
-        item_requested = ItemRequested.query.filter_by(group_id=id, item_id=
-        item_id).one_or_none()
-        print(f"item: {item_requested}")
-
-        # delete item and commit
-        item_requested.delete()
+        # need both id's to find the correct item_requested record
+        if not ItemRequested.delete_one(id, item_id):
+            raise LookupError('No such requested item')
 
         return jsonify(
             {
@@ -156,6 +731,7 @@ def delete_requested_item_by_id(jwt, id, item_id):
 
     except Exception as e:
         print(e)
+        db.session.rollback()
         raise NotFound('Item not found')
 
 
@@ -164,6 +740,7 @@ def delete_requested_item_by_id(jwt, id, item_id):
 # - admin will perform checks and create account details for Group
 
 @api_blueprint.route('/groups', methods=['POST'])
+@admitted('write')
 @requires_auth('post:group')
 def create_item(jwt):
     """
@@ -211,40 +788,143 @@ def create_item(jwt):
 ###### CREATE/POST item_requested - add item to group's requested items -
 # logged in group only ######
 @api_blueprint.route('/groups/<int:id>/items', methods=['POST'])
+@admitted('write')
 @requires_auth('post:item_requested')  # must have group owner role
 def update_items(jwt, id):
     """
-    Adds an item to the specified group. Requires an item_id in the request
-    body.
+    Adds an item to the specified group, unless it is already requested.
+    Requires an item_id in the request body, or a list of item_ids to add
+    several items in one transaction.
 
     :param jwt: Jwt must have post:group_items permission.
     :param id: Group Id
 
     :returns:
-        201 and item_id, 404 if item not found, 400 if bad request
+        201 and item_id (and the result for each item when item_ids is
+        given), 404 if item not found, 400 if bad request
     """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and 'item_ids' in body:
+        item_ids = get_bulk_item_ids(body)
+
+        try:
+            results = ItemRequested.add_many(id, item_ids)
+
+        except (IntegrityError, LookupError) as e:
+            print(e)
+            db.session.rollback()
+            raise NotFound('Group not found')
+
+        return jsonify(
+            {
+                'success': True,
+                'group_id': id,
+                'results': [{'item_id': item_id, 'status': status}
+                            for item_id, status in results.items()],
+            }
+        ), 201
+
     try:
         body = request.get_json()
 
         item_id = body.get('item_id')
 
-        item_requested = ItemRequested(group_id=id, item_id=item_id)
-
-        # add item and commit
-        item_requested.add()
+        # add item, unless the group already requested it
+        created = ItemRequested.add_one(id, item_id)
 
         return jsonify(
             {
                 'success': True,
                 'group_id': id,
+                'status': 'created' if created else 'already_requested',
             }
         ), 201
 
     except Exception as e:
         print(e)
+        db.session.rollback()
         raise BadRequest('Request is not valid')
 
 
+# Remove several items from a group's requested items
+@api_blueprint.route('/groups/<int:id>/items', methods=['DELETE'])
+@admitted('write')
+@requires_auth('delete:item_requested')
+def delete_requested_items(jwt, id):
+    """
+    Deletes several of the specified group's requested items in one
+    statement. Requires a list of item_ids in the request body.
+
+    :param jwt: Jwt must have delete:group_items permission.
+    :param id: Group Id
+
+    :returns: 200 OK and the result for each item, 400 if request is not
+    valid.
+    """
+    item_ids = get_bulk_item_ids(request.get_json(silent=True))
+
+    results = ItemRequested.delete_many(id, item_ids)
+
+    return jsonify(
+        {
+            'success': True,
+            'group_id': id,
+            'results': [{'item_id': item_id, 'status': status}
+                        for item_id, status in results.items()],
+        }
+    )
+
+
+def get_bulk_item_ids(body):
+    """
+    Validates the item_ids of a bulk request body.
+
+    :returns: the item ids, without duplicates, in request order
+    :raises BadRequest: if item_ids is not a list of 1 to MAX_BULK_ITEMS
+    integers
+    """
+    item_ids = body.get('item_ids') if isinstance(body, dict) else None
+
+    if (not isinstance(item_ids, list)
+            or not 0 < len(item_ids) <= MAX_BULK_ITEMS
+            or not all(type(item_id) is int for item_id in item_ids)):
+        raise BadRequest('Request is not valid')
+
+    return list(dict.fromkeys(item_ids))
+
+
+def get_representation(args):
+    """
+    Reads the fields and include arguments of a group endpoint. fields is
+    a comma separated list of Group.FIELDS and include may name
+    items_requested. Without either the full groups are returned; with
+    fields alone the requested items are left out.
+
+    :param args: the request arguments
+    :returns: (fields, whether to include the requested items)
+    :raises BadRequest: if a field or include is not known
+    """
+    fields = args.get('fields')
+    include = args.get('include')
+
+    if fields is None and include is None:
+        return Group.DEFAULT_FIELDS, True
+
+    includes = {name.strip() for name in (include or '').split(',')
+                if name.strip()}
+    if fields is None:
+        fields = Group.DEFAULT_FIELDS
+    else:
+        fields = tuple(dict.fromkeys(name.strip() for name in
+                                     fields.split(',') if name.strip()))
+
+    if not fields or not set(fields) <= set(Group.FIELDS) \
+            or not includes <= {'items_requested'}:
+        raise BadRequest('Request is not valid')
+
+    return fields, 'items_requested' in includes
+
+
 ################## ERROR HANDLING  ############################
 
 
@@ -273,6 +953,35 @@ def bad_request(e):
     }), 400
 
 
+@api_blueprint.errorhandler(Gone)
+def gone(e):
+    """
+    Receives the gone error and propagates the response
+    """
+    return jsonify({
+        "success": False,
+        "error": Gone.code,
+        "message": e.description
+    }), 410
+
+
+@api_blueprint.errorhandler(TooManyRequests)
+@api_blueprint.errorhandler(ServiceUnavailable)
+def shed_load(e):
+    """
+    Receives the rate limit and busy errors and propagates the response,
+    telling the client when to retry
+    """
+    response = jsonify({
+        "success": False,
+        "error": e.code,
+        "message": e.description
+    })
+    response.status_code = e.code
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
 @api_blueprint.errorhandler(UnprocessableEntity)
 def unprocessable(e):
     """
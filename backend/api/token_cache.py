@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of decoded JWT payloads, keyed by a hash of the token.
+
+    A payload is kept until the token's exp claim, so a repeat caller skips
+    the RSA signature check. Entries are dropped when the key that signed
+    them is no longer published in the JWKS.
+    """
+
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        """
+        Returns the cached payload for the token, or None if it has not been
+        verified or has since expired.
+        """
+        key = self._key(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] <= self.clock():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, token):
+        """
+        Like get(), without counting a hit or miss or refreshing the entry.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(token))
+            if entry is None or entry[1] <= self.clock():
+                return None
+            return entry[0]
+
+    def put(self, token, payload, kid):
+        """
+        Caches a verified payload. Tokens without an exp claim are not
+        cached.
+        """
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+
+        key = self._key(token)
+
+        with self._lock:
+            self._entries[key] = (payload, exp, kid)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def retain_kids(self, kids):
+        """Evicts every entry signed by a key that is not in kids."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry[2] not in kids:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+from backend import db
+from backend.models import CHANGED_GROUPS
+from backend.replica import reads_from_primary
+
+
+class MemoryBackend:
+    """
+    In-process LRU store. Each worker has its own copy, so invalidations
+    made by one gunicorn worker are not seen by the others.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._bumped_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def generations(self, scopes):
+        return [self._generations.get(scope, 0) for scope in scopes]
+
+    def bumped_at(self, scopes):
+        """Unix time of the latest bump of any of the scopes, or 0."""
+        return max((self._bumped_at.get(scope, 0) for scope in scopes),
+                   default=0)
+
+    def bump(self, scopes):
+        with self._lock:
+            now = time.time()
+            for scope in scopes:
+                self._generations[scope] = \
+                    self._generations.get(scope, 0) + 1
+                self._bumped_at[scope] = now
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._bumped_at.clear()
+
+
+class RedisBackend:
+    """
+    Store shared by all workers. Entries expire after their ttl; the size
+    bound is left to the server's maxmemory and allkeys-lru eviction policy.
+    Requires the redis package.
+    """
+
+    def __init__(self, url, prefix='chipin:cache:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def generations(self, scopes):
+        values = self.client.mget([self.prefix + 'gen:' + scope
+                                   for scope in scopes])
+        return [int(value or 0) for value in values]
+
+    def bumped_at(self, scopes):
+        values = self.client.mget([self.prefix + 'bumped:' + scope
+                                   for scope in scopes])
+        return max((float(value or 0) for value in values), default=0)
+
+    def bump(self, scopes):
+        now = time.time()
+        pipeline = self.client.pipeline()
+        for scope in scopes:
+            pipeline.incr(self.prefix + 'gen:' + scope)
+            pipeline.set(self.prefix + 'bumped:' + scope, now)
+        pipeline.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    """
+    Caches the JSON body of successful responses, keyed by endpoint and
+    request arguments.
+
+    Every cached response belongs to one or more scopes, e.g. 'groups' for
+    the group listings or 'group:<id>' for a single group. A scope's
+    generation number is part of the key, so bumping it after a commit makes
+    all of its entries unreachable, and they age out of the LRU.
+
+    A body read from the replica may predate the write that bumped its
+    scopes, so it is only stored once the replica has had time to catch
+    up, see replica_lag_window.
+    """
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+
+    def respond(self, view, scopes, args, kwargs):
+        key = self._key(scopes)
+
+        cached = self.backend.get(key)
+        if cached is not None:
+            response = self._unpack(cached)
+            response.headers['X-Cache'] = 'HIT'
+            return response.make_conditional(request)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and self._storable(scopes):
+            self.backend.set(key, self._pack(response), self.ttl)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    def _storable(self, scopes):
+        if not g.get('read_from_replica'):
+            return True
+        return self.backend.bumped_at(scopes) \
+            < time.time() - replica_lag_window()
+
+    @staticmethod
+    def _pack(response):
+        """
+        The body of a response preceded by its ETag and Last-Modified
+        headers, one per line.
+        """
+        return b'\n'.join([
+            response.headers.get('ETag', '').encode(),
+            response.headers.get('Last-Modified', '').encode(),
+            response.get_data()])
+
+    @staticmethod
+    def _unpack(cached):
+        etag, last_modified, body = cached.split(b'\n', 2)
+        response = current_app.response_class(body,
+                                              mimetype='application/json')
+        if etag:
+            response.headers['ETag'] = etag.decode()
+            response.cache_control.no_cache = True
+        if last_modified:
+            response.headers['Last-Modified'] = last_modified.decode()
+        return response
+
+    def invalidate_groups(self, group_ids):
+        """
+        Drops the group listings and the cached responses of each group.
+        """
+        self.backend.bump(['groups'] + [f'group:{id}' for id in group_ids])
+
+    def clear(self):
+        self.backend.clear()
+
+    def _key(self, scopes):
+        generations = self.backend.generations(scopes)
+        args = '&'.join(f'{name}={value}' for name, value
+                        in sorted(request.args.items(multi=True)))
+        # v2 entries start with the validators, see _pack
+        return '|'.join(['v2', request.endpoint, request.path, args]
+                        + [f'{scope}@{generation}' for scope, generation
+                           in zip(scopes, generations)])
+
+
+def replica_lag_window():
+    """
+    Most seconds a replica read may be behind the primary: the replica is
+    only used while it lags by at most REPLICA_MAX_LAG_SECONDS, checked
+    every REPLICA_CHECK_INTERVAL.
+    """
+    monitor = current_app.extensions['replica_monitor']
+    return monitor.max_lag + monitor.check_interval
+
+
+def init_app(app):
+    """
+    Creates the response cache configured by RESPONSE_CACHE_BACKEND:
+    memory (default), redis, or none to disable caching.
+    """
+    backend_name = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+
+    if backend_name == 'none':
+        return
+    if backend_name == 'redis':
+        backend = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'])
+    else:
+        backend = MemoryBackend(app.config.get('RESPONSE_CACHE_SIZE', 1024))
+
+    app.extensions['response_cache'] = ResponseCache(
+        backend, app.config.get('RESPONSE_CACHE_TTL', 300))
+
+
+def cached_response(*scopes):
+    """
+    Decorator for read-only views. Scopes may use the view arguments, e.g.
+    'group:{id}'. Clients within their read-your-writes window bypass the
+    cache, which may still hold what they read before writing.
+    """
+    def cached_response_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or reads_from_primary():
+                return f(*args, **kwargs)
+
+            view_scopes = [scope.format(**kwargs) for scope in scopes]
+            return cache.respond(f, view_scopes, args, kwargs)
+
+        return wrapper
+    return cached_response_decorator
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_after_commit(session):
+    group_ids = session.info.pop(CHANGED_GROUPS, None)
+    if not group_ids:
+        return
+
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.invalidate_groups(group_ids)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def forget_after_rollback(session, previous_transaction):
+    session.info.pop(CHANGED_GROUPS, None)
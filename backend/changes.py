@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select
+
+from backend import db
+from backend.models import SNAPSHOT_XMIN, ChangeLog, ChangeLogCompaction, \
+    ChangeLogHorizon, utcnow
+
+# changes returned per request, by default and at most
+CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
+
+
+def visible_through():
+    """
+    The newest token before which no change can still commit. On Postgres
+    writers do not wait for each other, so a change can commit after one
+    with a greater token; a change is only read once every transaction
+    that was running when it took its token has ended (see
+    write_change_log). None if every committed change can be read.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return None
+
+    unsettled = db.session.execute(
+        select(func.min(ChangeLog.id))
+        .join(ChangeLogHorizon, ChangeLogHorizon.txid == ChangeLog.txid)
+        .where(ChangeLogHorizon.visible_after > SNAPSHOT_XMIN)).scalar()
+    return None if unsettled is None else unsettled - 1
+
+
+def changes_after(since):
+    """
+    Condition selecting the changes after a token that can be read, see
+    visible_through.
+    """
+    condition = ChangeLog.id > since
+    through = visible_through()
+    if through is not None:
+        condition &= ChangeLog.id <= through
+    return condition
+
+
+def latest_token():
+    """
+    The token of the newest change that can be read, or of the newest
+    compacted one if the log has been emptied. 0 if nothing has changed.
+    """
+    newest = db.session.execute(
+        select(func.max(ChangeLog.id)).where(changes_after(0))).scalar()
+    return newest or compacted_through()
+
+
+def compacted_through():
+    """
+    The newest token removed by compaction. Clients holding an older token
+    may have missed changes.
+    """
+    return db.session.execute(
+        select(func.max(ChangeLogCompaction.compacted_through))
+    ).scalar() or 0
+
+
+def changes_since(since, limit):
+    """
+    Reads the changes after a token that can be read, oldest first,
+    through the primary key.
+
+    :returns: (list of ChangeLog, whether there are more)
+    """
+    changes = db.session.execute(
+        select(ChangeLog)
+        .where(changes_after(since))
+        .order_by(ChangeLog.id)
+        .limit(limit + 1)).scalars().all()
+    return changes[:limit], len(changes) > limit
+
+
+def compact(before):
+    """
+    Removes the changes made before a time, and records the newest token
+    removed so clients behind it are told to fetch everything again.
+
+    :returns: number of changes removed
+    """
+    through = db.session.execute(
+        select(func.max(ChangeLog.id))
+        .where(changes_after(0), ChangeLog.changed_at < before)).scalar()
+    if through is None:
+        return 0
+
+    # by token, so what is left is always every change after one
+    removed = db.session.execute(
+        delete(ChangeLog).where(ChangeLog.id <= through)).rowcount
+    db.session.add(ChangeLogCompaction(compacted_through=through))
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # the horizons every open transaction is past are no longer needed
+        db.session.execute(delete(ChangeLogHorizon).where(
+            ChangeLogHorizon.visible_after <= SNAPSHOT_XMIN))
+    db.session.commit()
+    return removed
+
+
+@click.command('compact-changes')
+@click.option('--days', type=int,
+              help='Keep the changes of this many days. Defaults to '
+                   'CHANGE_LOG_RETENTION_DAYS.')
+@with_appcontext
+def compact_changes_command(days):
+    """
+    Removes old entries of the change log served by GET /api/changes. Run
+    it daily, e.g. from cron, to keep the log small.
+    """
+    if days is None:
+        days = current_app.config.get('CHANGE_LOG_RETENTION_DAYS', 30)
+
+    removed = compact(utcnow() - timedelta(days=days))
+    click.echo(f'Removed {removed} changes older than {days} days')
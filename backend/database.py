@@ -0,0 +1,124 @@
+import time
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from backend.instrumentation import POOL_CHECKOUT_WAIT
+
+# bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA = 'replica'
+
+# session.info key set while a read-only view may use the replica
+USE_REPLICA = 'use_replica'
+
+
+class RoutingSession(Session):
+    """
+    Session sending statements to the read replica while USE_REPLICA is set
+    in its info, and to the primary otherwise. Flushes always go to the
+    primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(USE_REPLICA) \
+                and not self._flushing:
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def timeout_settings(config):
+    """
+    The server-side timeouts configured for each connection, as
+    (setting, milliseconds) pairs.
+    """
+    settings = [
+        ('statement_timeout', config.get('DB_STATEMENT_TIMEOUT_MS')),
+        ('idle_in_transaction_session_timeout',
+         config.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS')),
+    ]
+    return [(name, int(value)) for name, value in settings if value]
+
+
+def engine_options(config, url=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a Postgres database: the configured pool
+    options, a pool that reports checkout wait time and the connection
+    timeouts.
+
+    :param url: database the options are for, by default
+    SQLALCHEMY_DATABASE_URI
+
+    Timeouts are normally sent as startup options of each connection.
+    PgBouncer in transaction pooling mode rejects those, and a session level
+    SET would leak to other clients, so with DB_PGBOUNCER they are applied
+    with SET LOCAL at the start of each transaction instead (see init_app).
+    psycopg2 never uses server-side prepared statements, so no further
+    change is needed for transaction pooling.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+    if make_url(url or config['SQLALCHEMY_DATABASE_URI']) \
+            .get_backend_name() != 'postgresql':
+        return options
+
+    options.setdefault('poolclass', TimedQueuePool)
+
+    settings = timeout_settings(config)
+    if settings and not config.get('DB_PGBOUNCER'):
+        connect_args = dict(options.get('connect_args', {}))
+        connect_args['options'] = ' '.join(
+            [connect_args.get('options', '')]
+            + [f'-c {name}={value}' for name, value in settings]).strip()
+        options['connect_args'] = connect_args
+
+    return options
+
+
+def configure(app):
+    """
+    Sets the engine options, of the primary and of the replica, which
+    Flask-SQLAlchemy would otherwise create with the defaults. Must run
+    before db.init_app.
+    """
+    if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+        return
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    if isinstance(binds.get(REPLICA), str):
+        binds[REPLICA] = {'url': binds[REPLICA],
+                          **engine_options(app.config, binds[REPLICA])}
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def init_app(app, engine):
+    """Applies the timeouts per transaction in PgBouncer mode."""
+    settings = timeout_settings(app.config)
+    if not (app.config.get('DB_PGBOUNCER') and settings
+            and engine.dialect.name == 'postgresql'):
+        return
+
+    statement = '; '.join(f'SET LOCAL {name} = {value}'
+                          for name, value in settings)
+
+    @event.listens_for(engine, 'begin')
+    def set_transaction_timeouts(conn):
+        conn.exec_driver_sql(statement)
@@ -0,0 +1,240 @@
+import queue
+import selectors
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+
+from backend import db
+from backend.changes import MAX_CHANGES_LIMIT, changes_after, latest_token
+from backend.models import CHANGE_LOG_CHANNEL, ChangeLog, Group, Item
+
+# most seconds between two reads of the change log while listening, in
+# case a notification was missed
+LISTEN_TIMEOUT = 30
+
+# milliseconds a client waits before reconnecting
+RETRY_MS = 3000
+
+
+def item_request_events(since, limit=MAX_CHANGES_LIMIT):
+    """
+    Reads the requested items created and deleted after a token, as far
+    as the change log can be read (see visible_through), with the
+    county of the group and the category of the item to filter them by.
+
+    :returns: (list of events, token of the last change read, whether
+    there are more changes)
+    """
+    rows = db.session.execute(
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.operation,
+               ChangeLog.group_id, ChangeLog.item_id, ChangeLog.changed_at,
+               Group.county, Item.category_id)
+        .outerjoin(Group, Group.id == ChangeLog.group_id)
+        .outerjoin(Item, Item.id == ChangeLog.item_id)
+        .where(changes_after(since))
+        .order_by(ChangeLog.id)
+        .limit(limit + 1)).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    events = [{'token': row.id,
+               'operation': row.operation,
+               'group_id': row.group_id,
+               'item_id': row.item_id,
+               'county': row.county,
+               'category_id': row.category_id,
+               'changed_at': row.changed_at}
+              for row in rows
+              if row.entity == 'item_requested' and row.operation != 'update']
+    return events, rows[-1].id if rows else since, more
+
+
+class Subscriber:
+    """
+    Events for one client, held in a bounded buffer. A client that falls
+    further behind is marked overflowed and stops receiving events; it is
+    then disconnected, and catches up from the change log when it
+    reconnects with Last-Event-ID.
+    """
+
+    def __init__(self, filters, size=100):
+        self.filters = filters
+        self.events = queue.Queue(size)
+        self.overflowed = False
+        self.start = 0
+
+    def matches(self, event):
+        return all(event[name] == value
+                   for name, value in self.filters.items())
+
+    def put(self, event):
+        if self.overflowed or not self.matches(event):
+            return
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class ChangeBroadcaster:
+    """
+    Reads the changes committed by any worker and hands them to the
+    subscribers of this one. On Postgres it waits for the notification
+    sent with each commit (see write_change_log); elsewhere, or through
+    PgBouncer, which does not pass notifications on, it polls.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.buffer_size = app.config.get('SSE_BUFFER_SIZE', 100)
+        self.poll_seconds = app.config.get('CHANGE_POLL_SECONDS', 2)
+
+        self.last_token = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._background = None
+
+    def subscribe(self, filters):
+        """
+        Starts sending events to a new subscriber. It receives the changes
+        after its start token.
+        """
+        subscriber = Subscriber(filters, self.buffer_size)
+        with self._lock:
+            if self._background is None:
+                self.last_token = latest_token()
+                self._background = threading.Thread(target=self._run,
+                                                    daemon=True)
+                self._background.start()
+            subscriber.start = self.last_token
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stop(self):
+        self._stopped.set()
+        if self._background is not None:
+            self._background.join()
+
+    def publish(self):
+        """Hands the changes committed since the last call to subscribers."""
+        more = True
+        while more:
+            events, last_token, more = item_request_events(self.last_token)
+            with self._lock:
+                for event in events:
+                    for subscriber in self._subscribers:
+                        subscriber.put(event)
+                self.last_token = last_token
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    if self._can_listen():
+                        self._listen()
+                    else:
+                        self._poll()
+                except Exception as e:
+                    print(e)
+                    self._stopped.wait(self.poll_seconds)
+                finally:
+                    db.session.remove()
+
+    def _can_listen(self):
+        return (db.engine.dialect.name == 'postgresql'
+                and not self.app.config.get('DB_PGBOUNCER'))
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            self.publish()
+            db.session.remove()
+            self._stopped.wait(self.poll_seconds)
+
+    def _listen(self):
+        # a connection of its own, outside the pool
+        connection = db.engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT')
+        connection.detach()
+        try:
+            connection.exec_driver_sql(f'LISTEN {CHANGE_LOG_CHANNEL}')
+            dbapi_connection = connection.connection.dbapi_connection
+
+            with selectors.DefaultSelector() as selector:
+                selector.register(dbapi_connection, selectors.EVENT_READ)
+                # changes committed before LISTEN are read first
+                notified, next_read = True, 0
+
+                while not self._stopped.is_set():
+                    if notified or time.monotonic() >= next_read:
+                        self.publish()
+                        db.session.remove()
+                        next_read = time.monotonic() + LISTEN_TIMEOUT
+
+                    # wakes up every second to see if it was stopped
+                    notified = bool(selector.select(1))
+                    if notified:
+                        dbapi_connection.poll()
+                        dbapi_connection.notifies.clear()
+        finally:
+            connection.close()
+
+
+def init_app(app):
+    app.extensions['change_events'] = ChangeBroadcaster(app)
+
+
+def format_event(event):
+    data = current_app.json.dumps(event)
+    return f'id: {event["token"]}\nevent: {event["operation"]}\n' \
+           f'data: {data}\n\n'
+
+
+def stream(broadcaster, subscriber, since=None):
+    """
+    Yields the events of a subscriber as Server-Sent Events, preceded by
+    those after since read from the change log, with a comment every
+    SSE_HEARTBEAT_SECONDS so proxies keep the connection open. No database
+    connection is held while waiting.
+
+    :param since: token of the last event the client received
+    """
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    last_token = subscriber.start
+
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+
+        if since is not None:
+            last_token, more = since, True
+            while more:
+                events, last_token, more = item_request_events(last_token)
+                for event in events:
+                    if subscriber.matches(event):
+                        yield format_event(event)
+        db.session.remove()
+
+        while True:
+            try:
+                if subscriber.overflowed:
+                    event = subscriber.events.get_nowait()
+                else:
+                    event = subscriber.events.get(timeout=heartbeat)
+            except queue.Empty:
+                if subscriber.overflowed:
+                    # the client reconnects and catches up from the log
+                    return
+                yield ': heartbeat\n\n'
+                continue
+
+            if event['token'] > last_token:
+                yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscriber)
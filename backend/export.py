@@ -0,0 +1,83 @@
+import zlib
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from sqlalchemy import text
+
+from backend import db
+from backend.models import Group
+
+# groups read from the server-side cursor at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_groups(after=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every group after the given id, in id order, formatted as in
+    the listings plus id, latitude and longitude. One chunk of NDJSON lines
+    is yielded per batch.
+
+    Groups are read through a server-side cursor on Postgres, so memory use
+    does not grow with the number of groups, and the requested items are
+    read with one query per batch.
+
+    :param after: id of the last group already exported, to resume from
+    """
+    query = (Group.listing_select()
+             .add_columns(Group.latitude, Group.longitude)
+             .order_by(Group.id))
+    if after is not None:
+        query = query.where(Group.id > after)
+
+    result = db.session.execute(
+        query.execution_options(yield_per=batch_size))
+
+    for rows in result.partitions():
+        lines = []
+        for row, group in zip(rows, Group.format_rows(rows)):
+            group['id'] = row.id
+            group['latitude'] = row.latitude
+            group['longitude'] = row.longitude
+            lines.append(current_app.json.dumps(group) + '\n')
+
+        yield ''.join(lines).encode()
+
+
+def gzipped(chunks):
+    """Compresses a stream of byte chunks into a single gzip stream."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@click.command('export-groups')
+@click.argument('file', type=click.File('wb'), default='-')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--after', type=int,
+              help='Only export groups with a greater id, to resume an '
+                   'interrupted export.')
+@click.option('--batch-size', default=EXPORT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def export_command(file, compress, after, batch_size):
+    """
+    Writes every group with its requested items to FILE (default stdout) as
+    NDJSON, in id order and in constant memory. flask import groups loads
+    the groups of an uncompressed export, without their requested items.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # the export is one transaction, idle while FILE is slow to take
+        # the output
+        db.session.execute(text(
+            'SET LOCAL idle_in_transaction_session_timeout = 0'))
+
+    chunks = export_groups(after, batch_size)
+    if compress:
+        chunks = gzipped(chunks)
+
+    for chunk in chunks:
+        file.write(chunk)
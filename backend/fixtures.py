@@ -0,0 +1,58 @@
+# Seed data loaded by flask initdb, also used as the starting point of the
+# synthetic data generator. Ids are assigned in list order, starting at 1.
+
+GROUPS = [
+    dict(name='British Heart Foundation',
+         description='Your donations are hugely '
+                     'appreciated and help us fund '
+                     'life saving research. Please '
+                     'donate via the handy donation '
+                     'drop point in store.',
+         address='Guiness Trust, King\'s Road',
+         city='London',
+         county='Greater London',
+         postcode='SW10 0TT',
+         email='info@bhf.org.uk'),
+    dict(name='Trussel Trust Leeds',
+         description='Your foodbank relies on your '
+                     'goodwill and support.',
+         address='Unit 3, Burley Hill',
+         city='Leeds',
+         county='West Yorkshire',
+         postcode='LS4 2PU',
+         email='info@foodbank.or.uk'),
+    dict(name='Leeds Community Centre',
+         description='Our mission is to provide a hub '
+                     'for the whole community to take '
+                     'part in a range of positive '
+                     'activities.',
+         address='48 Bilton Lane',
+         city='Leeds',
+         county='West Yorkshire',
+         postcode='LS1 3DD',
+         email='info@community.org.uk'),
+]
+
+CATEGORIES = ['Books', 'Clothes', 'Food', 'Stationary']
+
+ITEMS = [
+    dict(name='Fiction', category_id=1),
+    dict(name='Non-Fiction', category_id=1),
+    dict(name='Wooly Jumpers', category_id=2),
+    dict(name='Tinned Fruit', category_id=3),
+    dict(name='UHT Milk', category_id=3),
+    dict(name='Dried Rice', category_id=3),
+    dict(name='Craft Materials', category_id=4),
+    dict(name='Whiteboard Pens', category_id=4),
+]
+
+ITEMS_REQUESTED = [
+    dict(item_id=1, group_id=1),
+    dict(item_id=2, group_id=1),
+    dict(item_id=3, group_id=1),
+    dict(item_id=4, group_id=2),
+    dict(item_id=5, group_id=2),
+    dict(item_id=6, group_id=2),
+    dict(item_id=7, group_id=3),
+    dict(item_id=2, group_id=3),
+]
@@ -0,0 +1,194 @@
+import random
+from datetime import datetime, time, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, text
+
+from backend import db, fixtures, geo
+from backend.importer import Progress, import_batches, import_copy
+from backend.models import Category, Item
+
+# Counties with their cities and postcode areas, roughly in order of
+# population. Groups are spread over them with a Zipf-like skew, so the
+# first few counties hold most of the groups.
+COUNTIES = [
+    ('Greater London', [('London', 'E'), ('London', 'N'), ('London', 'SE'),
+                        ('London', 'SW'), ('London', 'W')]),
+    ('West Midlands', [('Birmingham', 'B'), ('Coventry', 'CV'),
+                       ('Wolverhampton', 'WV')]),
+    ('Greater Manchester', [('Manchester', 'M'), ('Bolton', 'BL'),
+                            ('Oldham', 'OL')]),
+    ('West Yorkshire', [('Leeds', 'LS'), ('Bradford', 'BD'),
+                        ('Wakefield', 'WF'), ('Huddersfield', 'HD')]),
+    ('Merseyside', [('Liverpool', 'L'), ('Birkenhead', 'CH')]),
+    ('South Yorkshire', [('Sheffield', 'S'), ('Doncaster', 'DN')]),
+    ('Tyne and Wear', [('Newcastle upon Tyne', 'NE'), ('Sunderland', 'SR')]),
+    ('Kent', [('Maidstone', 'ME'), ('Canterbury', 'CT')]),
+    ('Essex', [('Chelmsford', 'CM'), ('Colchester', 'CO')]),
+    ('Hampshire', [('Southampton', 'SO'), ('Portsmouth', 'PO')]),
+    ('Lancashire', [('Preston', 'PR'), ('Blackpool', 'FY')]),
+    ('Bristol', [('Bristol', 'BS')]),
+    ('Nottinghamshire', [('Nottingham', 'NG')]),
+    ('Devon', [('Exeter', 'EX'), ('Plymouth', 'PL')]),
+    ('Norfolk', [('Norwich', 'NR')]),
+    ('North Yorkshire', [('York', 'YO'), ('Harrogate', 'HG')]),
+    ('Cumbria', [('Carlisle', 'CA')]),
+]
+
+# Catalog added to the fixture items. Items earlier in a list, and
+# categories earlier in the catalog, are requested more often.
+CATALOG = {
+    'Food': ['Pasta', 'Tinned Tomatoes', 'Cereal', 'Tea', 'Coffee',
+             'Baby Formula', 'Tinned Fish', 'Long Life Juice'],
+    'Toiletries': ['Toothpaste', 'Shampoo', 'Soap', 'Sanitary Products',
+                   'Nappies', 'Deodorant'],
+    'Clothes': ['Winter Coats', 'School Uniform', 'Children\'s Shoes',
+                'Socks', 'Hats and Gloves', 'Work Clothes'],
+    'Household': ['Bedding', 'Towels', 'Kitchen Utensils',
+                  'Cleaning Products', 'Light Bulbs'],
+    'Books': ['Children\'s Books', 'Textbooks', 'Large Print Books'],
+    'Toys': ['Board Games', 'Jigsaws', 'Soft Toys', 'Outdoor Toys'],
+    'Stationary': ['Notebooks', 'Pencils', 'Printer Paper'],
+    'Electronics': ['Laptops', 'Mobile Phones', 'Chargers'],
+}
+
+NAME_WORDS = ['Community', 'Foodbank', 'Hub', 'Trust', 'Pantry', 'Centre',
+              'Shelter', 'Project', 'Network', 'Kitchen', 'Library',
+              'Youth Club', 'Refuge', 'Hospice Shop', 'Collective']
+
+
+def zipf_weights(n, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def catalog_records(existing):
+    """
+    Category and item records for the fixture catalog plus CATALOG, leaving
+    out items already in the database.
+
+    :param existing: set of (item name, category name) already loaded
+    """
+    categories = list(dict.fromkeys(fixtures.CATEGORIES + list(CATALOG)))
+
+    items = [(item['name'], fixtures.CATEGORIES[item['category_id'] - 1])
+             for item in fixtures.ITEMS]
+    items += [(name, category) for category, names in CATALOG.items()
+              for name in names]
+
+    return ([{'name': name} for name in categories],
+            [{'name': name, 'category': category}
+             for name, category in items if (name, category) not in existing],
+            items)
+
+
+def group_records(rng, count, keys):
+    """
+    Yields count group records. The natural key of each group is appended
+    to keys so requests can refer to it.
+    """
+    weights = zipf_weights(len(COUNTIES))
+    templates = [group['description'] for group in fixtures.GROUPS]
+
+    for n in range(1, count + 1):
+        county, cities = rng.choices(COUNTIES, weights)[0]
+        city, area = rng.choice(cities)
+        postcode = (f'{area}{rng.randint(1, 20)} '
+                    f'{rng.randint(1, 9)}{rng.choice("ABDEFGHJLNPQRSTUWXYZ")}'
+                    f'{rng.choice("ABDEFGHJLNPQRSTUWXYZ")}')
+        name = f'{city} {rng.choice(NAME_WORDS)} {n}'
+        keys.append((name, postcode))
+        # scattered around the town of the postcode area, as if located
+        # with postcode-level centroids
+        lat, lng = geo.locate(area)
+
+        yield {'name': name,
+               'description': rng.choice(templates),
+               'address': f'{rng.randint(1, 250)} High Street',
+               'city': city,
+               'county': county,
+               'postcode': postcode,
+               'email': f'group{n}@example.org',
+               'latitude': round(lat + rng.gauss(0, 0.04), 5),
+               'longitude': round(lng + rng.gauss(0, 0.06), 5)}
+
+
+def request_records(rng, keys, total, items, until):
+    """
+    Yields about total item request records. The number of requests per
+    group is Pareto distributed, so a few groups have long wishlists, and
+    items are picked with a Zipf skew towards the first items.
+    """
+    weights = [rng.paretovariate(1.5) for _ in keys]
+    scale = total / sum(weights)
+    item_weights = zipf_weights(len(items))
+
+    for (name, postcode), weight in zip(keys, weights):
+        count = min(round(weight * scale), len(items))
+
+        chosen = list(dict.fromkeys(
+            rng.choices(range(len(items)), item_weights, k=count * 2)))
+        if len(chosen) < count:
+            remaining = [i for i in range(len(items)) if i not in chosen]
+            chosen += rng.sample(remaining, count - len(chosen))
+
+        for index in chosen[:count]:
+            item_name, category = items[index]
+            requested = until - timedelta(
+                minutes=min(rng.expovariate(1 / 60), 365) * 24 * 60)
+
+            yield {'group_name': name,
+                   'group_postcode': postcode,
+                   'item_name': item_name,
+                   'category': category,
+                   'date_requested': requested.isoformat(timespec='seconds')}
+
+
+@click.command('generate')
+@click.option('--groups', 'group_count', default=100000, show_default=True)
+@click.option('--requests', 'request_count', default=1000000,
+              show_default=True, help='Approximate number of item requests.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--method', type=click.Choice(['auto', 'copy', 'batch']),
+              default='auto', show_default=True)
+@click.option('--batch-size', default=5000, show_default=True,
+              type=click.IntRange(min=1))
+@with_appcontext
+def generate_command(group_count, request_count, seed, method, batch_size):
+    """
+    Adds a reproducible synthetic dataset for load testing: the fixture
+    catalog extended to a few dozen items, group_count groups skewed towards
+    the most populous counties, and about request_count item requests with
+    a long-tailed number per group. The same seed gives the same data.
+    """
+    if method == 'auto':
+        method = ('copy' if db.engine.dialect.name == 'postgresql'
+                  else 'batch')
+    load = import_copy if method == 'copy' else import_batches
+
+    rng = random.Random(seed)
+    # dates are relative to the start of today so reruns match
+    until = datetime.combine(datetime.now().date(), time())
+
+    existing = set(db.session.execute(
+        select(Item.name, Category.name).join(Category)).all())
+    categories, new_items, items = catalog_records(existing)
+
+    load('categories', categories, batch_size, Progress('categories'))
+    load('items', new_items, batch_size, Progress('items'))
+
+    keys = []
+    load('groups', group_records(rng, group_count, keys), batch_size,
+         Progress('groups'))
+    load('item_requests', request_records(rng, keys, request_count, items,
+                                          until),
+         batch_size, Progress('item_requests'))
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,137 @@
+import csv
+import math
+import os
+import re
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Coordinates of the principal town of each postcode area. Good to a few
+# kilometres near that town and tens of kilometres at the edges of large
+# areas, so groups in the same area share a location until finer
+# centroids are loaded.
+AREA_CENTROIDS_FILE = os.path.join(os.path.dirname(__file__), 'data',
+                                   'postcode_areas.csv')
+
+# Optional CSV of district (e.g. LS4) or full postcode (e.g. LS4 2PU)
+# centroids, such as an extract of the ONS Postcode Directory, taking
+# precedence over the area centroids
+CENTROIDS_FILE = os.getenv('POSTCODE_CENTROIDS_FILE')
+
+# Accepted names of the postcode, latitude and longitude columns
+POSTCODE_COLUMNS = ('postcode', 'pcds', 'pcd')
+LATITUDE_COLUMNS = ('latitude', 'lat')
+LONGITUDE_COLUMNS = ('longitude', 'long', 'lng')
+
+
+def normalise(postcode):
+    return re.sub(r'\s+', '', postcode or '').upper()
+
+
+def postcode_keys(postcode):
+    """
+    Keys to look a postcode up by, most precise first: the full postcode,
+    its district (outward code) and its area, e.g. LS42PU, LS4 and LS.
+    """
+    postcode = normalise(postcode)
+    if not postcode:
+        return []
+
+    keys = [postcode]
+    # the inward code is always a digit and two letters
+    if re.fullmatch(r'[A-Z0-9]+[0-9][A-Z]{2}', postcode) \
+            and len(postcode) > 4:
+        keys.append(postcode[:-3])
+
+    area = re.match(r'[A-Z]+', postcode)
+    if area and area.group() not in keys:
+        keys.append(area.group())
+    return keys
+
+
+class PostcodeCentroids:
+    """Maps postcodes, districts and areas to (latitude, longitude)."""
+
+    def __init__(self):
+        self._centroids = {}
+
+    def __len__(self):
+        return len(self._centroids)
+
+    def load(self, path):
+        """
+        Adds the centroids in a CSV file with postcode, latitude and
+        longitude columns, replacing any already loaded for the same keys.
+
+        :returns: number of centroids read
+        """
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            columns = {name.lower(): name for name in reader.fieldnames or []}
+            try:
+                postcode, latitude, longitude = (
+                    next(columns[name] for name in names if name in columns)
+                    for names in (POSTCODE_COLUMNS, LATITUDE_COLUMNS,
+                                  LONGITUDE_COLUMNS))
+            except StopIteration:
+                raise ValueError(f'{path} needs postcode, latitude and '
+                                 f'longitude columns')
+
+            count = 0
+            for row in reader:
+                try:
+                    self._centroids[normalise(row[postcode])] = (
+                        float(row[latitude]), float(row[longitude]))
+                    count += 1
+                except (TypeError, ValueError):
+                    # ONS rows for terminated postcodes have no location
+                    continue
+            return count
+
+    def locate(self, postcode):
+        """
+        :returns: (latitude, longitude) of the most precise centroid known
+        for the postcode, or None
+        """
+        for key in postcode_keys(postcode):
+            centroid = self._centroids.get(key)
+            if centroid is not None:
+                return centroid
+        return None
+
+
+_centroids = None
+
+
+def centroids():
+    """The bundled area centroids plus POSTCODE_CENTROIDS_FILE, if set."""
+    global _centroids
+    if _centroids is None:
+        loaded = PostcodeCentroids()
+        loaded.load(AREA_CENTROIDS_FILE)
+        if CENTROIDS_FILE:
+            loaded.load(CENTROIDS_FILE)
+        _centroids = loaded
+    return _centroids
+
+
+def locate(postcode):
+    return centroids().locate(postcode)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    :returns: (min_lat, max_lat, min_lng, max_lng) of a box containing every
+    point within radius_km of (lat, lng)
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # longitude degrees shrink towards the poles
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM
+                                     * max(math.cos(math.radians(lat)), 0.01)))
+    return lat - dlat, lat + dlat, max(lng - dlng, -180), min(lng + dlng, 180)
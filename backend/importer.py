@@ -0,0 +1,488 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import column, func, insert, literal, select, table, text, \
+    tuple_, update
+
+from backend import db, geo
+from backend.models import Category, Group, Item, ItemRequested, \
+    insert_ignoring_conflicts, record_changes, record_changes_from, utcnow
+
+# Input columns of each kind of record. Foreign keys are given by natural
+# key: a category by name, an item by name and category, and a group by
+# name and postcode.
+COLUMNS = {
+    'categories': ['name'],
+    'groups': ['name', 'description', 'address', 'city', 'county',
+               'postcode', 'email', 'latitude', 'longitude'],
+    'items': ['name', 'category'],
+    'item_requests': ['group_name', 'group_postcode', 'item_name',
+                      'category', 'date_requested'],
+}
+
+# a group without a location is placed at the centroid of its postcode
+OPTIONAL_COLUMNS = {'date_requested', 'latitude', 'longitude'}
+
+# Statements moving staged rows into the real tables for the copy method,
+# resolving natural keys with joins. As in the batch method, groups and
+# items already in the database, or earlier in the file, are skipped, and a
+# natural key matching several rows resolves to the lowest id.
+COPY_INSERTS = {
+    'categories': """
+        INSERT INTO category (name)
+        SELECT DISTINCT name FROM import_staging
+        ON CONFLICT (name) DO NOTHING
+    """,
+    'groups': """
+        INSERT INTO "group" (name, description, address, city, county,
+                             postcode, email, latitude, longitude)
+        SELECT DISTINCT ON (s.name, s.postcode)
+               s.name, s.description, s.address, s.city, s.county,
+               s.postcode, s.email, s.latitude::double precision,
+               s.longitude::double precision
+        FROM import_staging s
+        WHERE NOT EXISTS (SELECT FROM "group" g
+                          WHERE g.name = s.name AND g.postcode = s.postcode)
+        ORDER BY s.name, s.postcode, s.line
+    """,
+    'items': """
+        INSERT INTO item (name, category_id)
+        SELECT DISTINCT ON (s.name, c.id) s.name, c.id
+        FROM import_staging s JOIN category c ON c.name = s.category
+        WHERE NOT EXISTS (SELECT FROM item i
+                          WHERE i.name = s.name AND i.category_id = c.id)
+        ORDER BY s.name, c.id, s.line
+    """,
+    'item_requests': """
+        INSERT INTO item_requested (group_id, item_id, date_requested)
+        SELECT g.id, i.id,
+               COALESCE(s.date_requested::timestamp, CURRENT_TIMESTAMP)
+        FROM import_staging s
+        JOIN LATERAL (SELECT id FROM "group"
+                      WHERE name = s.group_name
+                        AND postcode = s.group_postcode
+                      ORDER BY id LIMIT 1) g ON true
+        JOIN category c ON c.name = s.category
+        JOIN LATERAL (SELECT id FROM item
+                      WHERE name = s.item_name AND category_id = c.id
+                      ORDER BY id LIMIT 1) i ON true
+        ORDER BY s.line
+        ON CONFLICT (group_id, item_id) DO NOTHING
+    """,
+}
+
+# entity logged in the change log for the rows inserted by COPY_INSERTS,
+# and the group_id and item_id they return, see copy_logged
+COPY_RETURNING = {
+    'groups': ('group', 'id, NULL::integer'),
+    'item_requests': ('item_requested', 'group_id, item_id'),
+}
+
+# temporary table of the groups and requested items inserted by COPY_INSERTS
+IMPORTED = table('import_inserted', column('group_id'), column('item_id'))
+
+# columns returned for each inserted row, see record_imported
+RETURNING = {
+    'categories': [Category.id],
+    'groups': [Group.id],
+    'items': [Item.id],
+    'item_requests': [ItemRequested.group_id, ItemRequested.item_id],
+}
+
+
+def read_records(file, file_format):
+    """
+    Streams the records of a CSV or NDJSON file as dicts, one at a time.
+    """
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+        return
+
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def batches(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+def clean(kind, record):
+    """
+    Returns the record with only the columns of its kind, as stripped
+    strings (None for empty optional columns).
+
+    :raises click.ClickException: if a required column is missing
+    """
+    row = {}
+    for column in COLUMNS[kind]:
+        value = record.get(column)
+        value = str(value).strip() if value is not None else ''
+
+        if not value and column not in OPTIONAL_COLUMNS:
+            raise click.ClickException(
+                f'{kind} record is missing {column}: {record}')
+
+        row[column] = value or None
+    return row
+
+
+def locate(row):
+    """
+    Sets the latitude and longitude of a cleaned group row, from the
+    centroid of its postcode unless the record gives them.
+
+    :raises click.ClickException: if the given location is not a number
+    """
+    if row['latitude'] is None or row['longitude'] is None:
+        row['latitude'], row['longitude'] = \
+            geo.locate(row['postcode']) or (None, None)
+        return row
+
+    try:
+        row['latitude'] = float(row['latitude'])
+        row['longitude'] = float(row['longitude'])
+    except ValueError:
+        raise click.ClickException(f'groups record has an invalid '
+                                   f'location: {row}')
+    return row
+
+
+def parse_date(row):
+    """
+    Parses the date_requested of a cleaned item_requests row, if given.
+
+    :raises click.ClickException: if it is not an ISO 8601 date
+    """
+    if row['date_requested'] is None:
+        return row
+
+    try:
+        row['date_requested'] = datetime.fromisoformat(row['date_requested'])
+    except ValueError:
+        raise click.ClickException(f'item_requests record has an invalid '
+                                   f'date_requested: {row}')
+    return row
+
+
+def without_existing(rows, model, columns):
+    """
+    Drops the rows whose natural key, the values of columns, is already in
+    the model's table or on an earlier row, so importing a file twice does
+    not duplicate groups or items.
+    """
+    keys = {tuple(row[column] for column in columns) for row in rows}
+    key_columns = [getattr(model, column) for column in columns]
+    seen = set(db.session.execute(
+        select(*key_columns).where(tuple_(*key_columns).in_(keys))).all())
+
+    new_rows = []
+    for row in rows:
+        key = tuple(row[column] for column in columns)
+        if key not in seen:
+            seen.add(key)
+            new_rows.append(row)
+    return new_rows
+
+
+class Progress:
+    """Reports rows read and inserted, and the rate they are read at."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.read = 0
+        self.inserted = 0
+        self.started = time.perf_counter()
+
+    def update(self, read, inserted=0):
+        self.read += read
+        self.inserted += inserted
+        click.echo(f'{self.kind}: {self.read} read, {self.inserted} inserted '
+                   f'({self.rate():.0f} rows/s)')
+
+    def rate(self):
+        return self.read / max(time.perf_counter() - self.started, 1e-9)
+
+
+def resolve_batch(kind, rows):
+    """
+    Turns a batch of cleaned rows into column values for the target table,
+    resolving natural keys with one query per referenced table. Rows whose
+    keys cannot be resolved are dropped, as are groups and items that
+    already exist (see without_existing). A natural key matching several
+    rows resolves to the lowest id.
+    """
+    if kind == 'categories':
+        return rows
+
+    if kind == 'groups':
+        return [locate(row) for row
+                in without_existing(rows, Group, ['name', 'postcode'])]
+
+    if kind == 'items':
+        names = {row['category'] for row in rows}
+        categories = dict(db.session.execute(
+            select(Category.name, Category.id)
+            .where(Category.name.in_(names))).all())
+
+        return without_existing(
+            [{'name': row['name'],
+              'category_id': categories[row['category']]}
+             for row in rows if row['category'] in categories],
+            Item, ['name', 'category_id'])
+
+    group_keys = {(row['group_name'], row['group_postcode']) for row in rows}
+    groups = {(name, postcode): id for id, name, postcode in
+              db.session.execute(
+                  select(func.min(Group.id), Group.name, Group.postcode)
+                  .where(tuple_(Group.name, Group.postcode)
+                         .in_(group_keys))
+                  .group_by(Group.name, Group.postcode)).all()}
+
+    item_keys = {(row['item_name'], row['category']) for row in rows}
+    items = {(name, category): id for id, name, category in
+             db.session.execute(
+                 select(func.min(Item.id), Item.name, Category.name)
+                 .join(Category)
+                 .where(tuple_(Item.name, Category.name)
+                        .in_(item_keys))
+                 .group_by(Item.name, Category.name)).all()}
+
+    resolved = []
+    for row in map(parse_date, rows):
+        group_id = groups.get((row['group_name'], row['group_postcode']))
+        item_id = items.get((row['item_name'], row['category']))
+        if group_id is None or item_id is None:
+            continue
+
+        values = {'group_id': group_id, 'item_id': item_id}
+        if row['date_requested']:
+            values['date_requested'] = row['date_requested']
+        resolved.append(values)
+
+    return resolved
+
+
+def record_imported(kind, rows):
+    """
+    Records the groups and requested items imported by a batch in the
+    change log, which also bumps the version of their groups on commit.
+
+    :param rows: the inserted rows, with the columns in RETURNING
+    """
+    if kind == 'groups':
+        for id, in rows:
+            record_changes(db.session, 'group', 'insert', id)
+
+    elif kind == 'item_requests':
+        item_ids = {}
+        for group_id, item_id in rows:
+            item_ids.setdefault(group_id, []).append(item_id)
+        for group_id, ids in item_ids.items():
+            record_changes(db.session, 'item_requested', 'insert', group_id,
+                           ids)
+
+
+def insert_statement(kind):
+    if kind == 'categories':
+        return insert_ignoring_conflicts(Category, ['name'])
+    if kind == 'item_requests':
+        return insert_ignoring_conflicts(ItemRequested,
+                                         ['group_id', 'item_id'])
+    return insert({'groups': Group, 'items': Item}[kind])
+
+
+def import_batches(kind, records, batch_size, progress):
+    """
+    Inserts each batch with an executemany, committing per batch.
+    Works on any database.
+    """
+    for batch in batches(records, batch_size):
+        rows = resolve_batch(kind, [clean(kind, record) for record in batch])
+
+        inserted = []
+        # rows are executed together only if they set the same columns
+        for columns in {tuple(row) for row in rows}:
+            group = [row for row in rows if tuple(row) == columns]
+            inserted += db.session.execute(
+                insert_statement(kind).returning(*RETURNING[kind]),
+                group).all()
+
+        record_imported(kind, inserted)
+        db.session.commit()
+        progress.update(len(batch), len(inserted))
+
+
+def import_copy(kind, records, batch_size, progress):
+    """
+    Streams the records into a temporary staging table with COPY, one batch
+    at a time, then inserts them into the real table with a single
+    statement joining the natural keys. Postgres only.
+    """
+    columns = COLUMNS[kind]
+    # line numbers the records in file order
+    db.session.execute(text(
+        'CREATE TEMP TABLE import_staging (line bigserial, '
+        + ', '.join(f'{column} text' for column in columns)
+        + ') ON COMMIT DROP'))
+
+    cursor = db.session.connection().connection.cursor()
+    copy_sql = (f'COPY import_staging ({", ".join(columns)}) '
+                f'FROM STDIN WITH (FORMAT csv)')
+
+    for batch in batches(records, batch_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in batch:
+            row = clean(kind, record)
+            if kind == 'groups':
+                row = locate(row)
+            elif kind == 'item_requests':
+                row = parse_date(row)
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+
+        cursor.copy_expert(copy_sql, buffer)
+        progress.update(len(batch))
+
+    if kind in COPY_RETURNING:
+        inserted = copy_logged(kind)
+    else:
+        inserted = db.session.execute(text(COPY_INSERTS[kind])).rowcount
+    db.session.commit()
+    progress.update(0, inserted)
+
+
+def copy_logged(kind):
+    """
+    Runs the COPY_INSERTS statement of groups or item_requests, keeping the
+    keys of the inserted rows in a temporary table rather than in memory.
+    The versions of their groups are bumped and their changes logged from
+    it in SQL.
+
+    :returns: number of rows inserted
+    """
+    entity, returning = COPY_RETURNING[kind]
+    db.session.execute(text(
+        'CREATE TEMP TABLE import_inserted (group_id integer, '
+        'item_id integer) ON COMMIT DROP'))
+    inserted = db.session.execute(text(
+        f'WITH inserted AS ({COPY_INSERTS[kind]} RETURNING {returning}) '
+        f'INSERT INTO import_inserted SELECT * FROM inserted')).rowcount
+
+    db.session.execute(
+        update(Group)
+        .where(Group.id.in_(select(IMPORTED.c.group_id)))
+        .values(version=Group.version + 1, updated_at=utcnow())
+        .execution_options(synchronize_session=False))
+    record_changes_from(db.session, select(
+        literal(entity), literal('insert'), IMPORTED.c.group_id,
+        IMPORTED.c.item_id))
+    return inserted
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(list(COLUMNS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the file extension, or csv.')
+@click.option('--method', type=click.Choice(['auto', 'copy', 'batch']),
+              default='auto', show_default=True,
+              help='copy (Postgres only) or batched executemany. auto uses '
+                   'copy on Postgres.')
+@click.option('--batch-size', default=5000, show_default=True,
+              type=click.IntRange(min=1))
+@with_appcontext
+def import_command(kind, file, file_format, method, batch_size):
+    """
+    Streams groups, categories, items or item_requests from a CSV or NDJSON
+    FILE (- for stdin) into the database, in constant memory.
+
+    Columns by KIND:
+
+    \b
+    categories:    name
+    groups:        name, description, address, city, county, postcode, email,
+                   latitude and longitude (optional, default to the
+                   centroid of the postcode)
+    items:         name, category
+    item_requests: group_name, group_postcode, item_name, category,
+                   date_requested (optional, ISO 8601)
+
+    Import categories before items, and groups and items before
+    item_requests. Categories, groups and items that already exist, and
+    requests a group already has, are skipped, so a file can be imported
+    again.
+    """
+    if file_format is None:
+        file_format = 'ndjson' if file.name.endswith(
+            ('.ndjson', '.jsonl')) else 'csv'
+
+    if method == 'auto':
+        method = ('copy' if db.engine.dialect.name == 'postgresql'
+                  else 'batch')
+    elif method == 'copy' and db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('The copy method needs Postgres')
+
+    progress = Progress(kind)
+    records = read_records(file, file_format)
+
+    if method == 'copy':
+        import_copy(kind, records, batch_size, progress)
+    else:
+        import_batches(kind, records, batch_size, progress)
+
+    # the import bypasses the write hooks that invalidate cached responses
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
+
+    click.echo(f'Imported {progress.inserted} of {progress.read} {kind} '
+               f'records ({progress.rate():.0f} rows/s)')
+
+
+@click.command('geocode-groups')
+@click.option('--all', 'all_groups', is_flag=True,
+              help='Relocate every group, e.g. after loading finer '
+                   'centroids, not only those without a location.')
+@click.option('--batch-size', default=5000, show_default=True,
+              type=click.IntRange(min=1))
+@with_appcontext
+def geocode_command(all_groups, batch_size):
+    """
+    Places groups at the centroid of their postcode. Uses the bundled
+    postcode area centroids, refined by POSTCODE_CENTROIDS_FILE if set.
+    """
+    query = select(Group.id, Group.postcode).order_by(Group.id)
+    if not all_groups:
+        query = query.where(Group.latitude.is_(None))
+
+    progress = Progress('groups')
+    for batch in batches(db.session.execute(query).all(), batch_size):
+        locations = [(id, geo.locate(postcode)) for id, postcode in batch]
+        values = [{'id': id, 'latitude': location[0],
+                   'longitude': location[1]}
+                  for id, location in locations if location is not None]
+
+        if values:
+            # bulk UPDATE by primary key
+            db.session.execute(update(Group), values)
+        for row in values:
+            record_changes(db.session, 'group', 'update', row['id'])
+        db.session.commit()
+        progress.update(len(batch), len(values))
+
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
+
+    click.echo(f'Located {progress.inserted} of {progress.read} groups')
@@ -0,0 +1,244 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram buckets for durations in seconds and for SQL statement counts
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                    0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class QueryCounter:
+    """Records the SQL statements executed while it is active."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        self.statements.append((statement, parameters))
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Counts the statements sent to the database through the engine within
+    the block.
+
+    :param engine: SQLAlchemy engine, e.g. db.engine
+    :return: QueryCounter
+    """
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute',
+                 counter.before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute',
+                     counter.before_cursor_execute)
+
+
+class Histogram:
+    """Prometheus style histogram, with one series per label set."""
+
+    def __init__(self, name, help, buckets, labels=('route', 'method')):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = \
+                    [[0] * len(self.buckets), 0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} histogram']
+
+        with self._lock:
+            for label_values, (buckets, total, count) in \
+                    sorted(self._series.items()):
+                labels = ','.join(f'{name}="{escape(value)}"' for name, value
+                                  in zip(self.labels, label_values))
+                prefix = labels + ',' if labels else ''
+
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}}'
+                                 f' {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} '
+                             f'{count}')
+                labels = f'{{{labels}}}' if labels else ''
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+
+        return '\n'.join(lines)
+
+
+def escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+REQUEST_DURATION = Histogram(
+    'chipin_request_duration_seconds',
+    'Time spent handling a request.', DURATION_BUCKETS)
+SQL_QUERIES = Histogram(
+    'chipin_request_sql_queries',
+    'SQL statements executed per request.', COUNT_BUCKETS)
+SQL_DURATION = Histogram(
+    'chipin_request_sql_duration_seconds',
+    'Time spent executing SQL statements per request.', DURATION_BUCKETS)
+AUTH_DURATION = Histogram(
+    'chipin_request_auth_duration_seconds',
+    'Time spent verifying the JWT per request.', DURATION_BUCKETS)
+SERIALIZATION_DURATION = Histogram(
+    'chipin_request_serialization_duration_seconds',
+    'Time spent formatting and encoding the response body per request.',
+    DURATION_BUCKETS)
+
+POOL_CHECKOUT_WAIT = Histogram(
+    'chipin_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a database connection from the pool.',
+    DURATION_BUCKETS, labels=())
+
+HISTOGRAMS = [REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, AUTH_DURATION,
+              SERIALIZATION_DURATION, POOL_CHECKOUT_WAIT]
+
+
+class RequestTimings:
+    """Time spent in each phase of the current request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_queries = 0
+        self.durations = {'sql': 0.0, 'auth': 0.0, 'serialize': 0.0}
+
+
+def current_timings():
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block to a phase ('auth' or 'serialize') of
+    the current request. Does nothing outside instrumented requests.
+    """
+    timings = current_timings()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.durations[phase] += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context,
+                    executemany):
+    # kept on the statement's execution context, which is dropped with it
+    # when the statement fails
+    if current_timings() is not None and context is not None:
+        context.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_sql_timer(conn, cursor, statement, parameters, context,
+                   executemany):
+    timings = current_timings()
+    started = getattr(context, 'query_started', None)
+    if timings is not None and started is not None:
+        timings.sql_queries += 1
+        timings.durations['sql'] += time.perf_counter() - started
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    from backend.api.auth import token_cache
+
+    stats = token_cache.stats()
+    lines = [histogram.render() for histogram in HISTOGRAMS]
+    lines += [
+        '# HELP chipin_token_cache_hits_total Verified-token cache hits.',
+        '# TYPE chipin_token_cache_hits_total counter',
+        f'chipin_token_cache_hits_total {stats["hits"]}',
+        '# HELP chipin_token_cache_misses_total Verified-token cache misses.',
+        '# TYPE chipin_token_cache_misses_total counter',
+        f'chipin_token_cache_misses_total {stats["misses"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """
+    Times every request when METRICS_ENABLED or SERVER_TIMING is set.
+    METRICS_ENABLED exposes the per-route histograms at /metrics, and
+    SERVER_TIMING adds a Server-Timing header to each response.
+
+    Metrics are kept per process, so with several workers each one reports
+    its own requests.
+    """
+    metrics_enabled = app.config.get('METRICS_ENABLED', False)
+    server_timing = app.config.get('SERVER_TIMING', False)
+
+    if not (metrics_enabled or server_timing):
+        return
+
+    @app.before_request
+    def start_timings():
+        g.timings = RequestTimings()
+
+    @app.after_request
+    def record_timings(response):
+        timings = g.pop('timings', None)
+        if timings is None:
+            return response
+
+        total = time.perf_counter() - timings.started
+        durations = timings.durations
+
+        if metrics_enabled and request.endpoint != 'metrics':
+            labels = (request.endpoint or 'unmatched', request.method)
+            REQUEST_DURATION.observe(total, *labels)
+            SQL_QUERIES.observe(timings.sql_queries, *labels)
+            SQL_DURATION.observe(durations['sql'], *labels)
+            AUTH_DURATION.observe(durations['auth'], *labels)
+            SERIALIZATION_DURATION.observe(durations['serialize'], *labels)
+
+        if server_timing:
+            response.headers['Server-Timing'] = ', '.join([
+                f'total;dur={total * 1000:.2f}',
+                f'sql;dur={durations["sql"] * 1000:.2f};'
+                f'desc="{timings.sql_queries} queries"',
+                f'auth;dur={durations["auth"] * 1000:.2f}',
+                f'serialize;dur={durations["serialize"] * 1000:.2f}',
+            ])
+
+        return response
+
+    if metrics_enabled:
+        @app.route('/metrics')
+        def metrics():
+            return render_metrics(), 200, {
+                'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -0,0 +1,56 @@
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider encoding with orjson. The output matches the default
+    provider: keys are sorted and dates use the HTTP date format, e.g.
+    "Thu, 06 Feb 2025 12:00:00 GMT", rather than orjson's ISO 8601. Only
+    non-ASCII characters differ, being sent as UTF-8 instead of escaped.
+    Calls passing json.dumps arguments fall back to the default provider.
+    Requires the orjson package.
+    """
+
+    def __init__(self, app):
+        import orjson
+
+        super().__init__(app)
+        self.orjson = orjson
+
+    def encode_default(self, o):
+        if isinstance(o, date):
+            return http_date(o)
+        return self.default(o)
+
+    def options(self, indent=False):
+        options = (self.orjson.OPT_PASSTHROUGH_DATETIME
+                   | self.orjson.OPT_NON_STR_KEYS)
+        if self.sort_keys:
+            options |= self.orjson.OPT_SORT_KEYS
+        if indent:
+            options |= self.orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.orjson.dumps(obj, default=self.encode_default,
+                                 option=self.options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self.orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None
+                                           and self._app.debug)
+
+        return self._app.response_class(
+            self.orjson.dumps(obj, default=self.encode_default,
+                              option=self.options(indent)) + b'\n',
+            mimetype=self.mimetype)
@@ -1,7 +1,116 @@
-from backend import db
+import heapq
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, delete, event, insert, literal, \
+    literal_column, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.orm import deferred, joinedload, lazyload, selectinload, \
+    validates
+
+from backend import db, geo
+
+# session.info key holding the ids of groups changed in the transaction
+CHANGED_GROUPS = 'changed_group_ids'
+
+# session.info key holding the changes to write to the change log
+PENDING_CHANGES = 'pending_changes'
+
+# session.info key holding queries reading more changes to write to it
+PENDING_CHANGE_QUERIES = 'pending_change_queries'
+
+# Postgres transaction ids of the current transaction, and the oldest
+# and the next one of the snapshot, see write_change_log
+CURRENT_TXID = literal_column('pg_current_xact_id()::text::bigint')
+SNAPSHOT_XMIN = literal_column(
+    'pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+SNAPSHOT_XMAX = literal_column(
+    'pg_snapshot_xmax(pg_current_snapshot())::text::bigint')
+
+# channel notified when changes are committed (see backend/events.py)
+CHANGE_LOG_CHANNEL = 'change_log'
+
+
+def mark_groups_changed(session, group_ids):
+    """
+    Records groups whose data (including their requested items) is changed
+    by the current transaction. Writes made through the ORM are recorded
+    automatically; Core statements call record_changes().
+    """
+    session.info.setdefault(CHANGED_GROUPS, set()).update(group_ids)
+
+
+def record_changes(session, entity, operation, group_id, item_ids=(None,)):
+    """
+    Records a change to a group or to its requested items for the change
+    log, and marks the group as changed. Writes made through the ORM are
+    recorded automatically; Core statements have to call this themselves.
+
+    :param entity: 'group' or 'item_requested'
+    :param operation: 'insert', 'update' or 'delete'
+    :param item_ids: ids of the requested items changed
+    """
+    session.info.setdefault(PENDING_CHANGES, []).extend(
+        (entity, operation, group_id, item_id) for item_id in item_ids)
+    mark_groups_changed(session, [group_id])
+
+
+def record_changes_from(session, query):
+    """
+    Records the changes read by a query for the change log, which copies
+    them in SQL on commit, so bulk writes do not hold them in memory. The
+    caller bumps the version of the groups changed.
+
+    :param query: select of entity, operation, group_id and item_id
+    """
+    session.info.setdefault(PENDING_CHANGE_QUERIES, []).append(query)
+
+
+def utcnow():
+    """The current UTC time as a naive datetime, as stored in the database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class utc_timestamp(FunctionElement):
+    """utcnow() in SQL, for server defaults."""
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_timestamp)
+def compile_utc_timestamp(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is in UTC
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utc_timestamp, 'postgresql')
+def compile_utc_timestamp_postgresql(element, compiler, **kw):
+    # CURRENT_TIMESTAMP would be stored in the session's time zone
+    return "timezone('utc', now())"
+
+
+def insert_ignoring_conflicts(model, index_elements, dialect_name=None):
+    """
+    INSERT statement that skips rows which would violate the unique index
+    on index_elements (ON CONFLICT DO NOTHING).
+
+    :param dialect_name: database the statement is for, by default the
+    one of db.engine
+    """
+    dialect_name = dialect_name or db.engine.dialect.name
+    dialect = sqlite if dialect_name == 'sqlite' else postgresql
+    return (dialect.insert(model)
+            .on_conflict_do_nothing(index_elements=index_elements))
 
 class Group(db.Model):
     __tablename__ = 'group'
+    __table_args__ = (
+        # covers the county, city ordering of the group listings
+        db.Index('ix_group_county_city_id', 'county', 'city', 'id'),
+        # the last change to any group, for Last-Modified of the listings
+        db.Index('ix_group_updated_at', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
     description = db.Column(db.String(), nullable=False)
@@ -10,11 +119,32 @@ class Group(db.Model):
     county = db.Column(db.String(), nullable=False)
     postcode = db.Column(db.String(), nullable=False)
     email = db.Column(db.String(), nullable=False)
+    # centroid of the postcode, set whenever the postcode is
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # bumped when a change to the group or its requested items is
+    # committed (see bump_changed_groups), for ETag and Last-Modified
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           server_default=utc_timestamp())
+    # search document of the group and its requested items, maintained by
+    # triggers on Postgres (see backend/search.py)
+    search_vector = deferred(db.Column(
+        db.Text().with_variant(postgresql.TSVECTOR(), 'postgresql')))
+    search_text = deferred(db.Column(db.Text))
+    # loaded only when asked for, see load_items_requested()
     items_requested = db.relationship('ItemRequested',
                                       backref='group',
-                                      lazy='joined',
-                                      innerjoin=True,
+                                      lazy='select',
                                       cascade='all, delete')
+
+    # fields a client can ask for with ?fields=, and those returned when
+    # it does not
+    FIELDS = ('id', 'name', 'description', 'address', 'city', 'county',
+              'postcode', 'email', 'latitude', 'longitude')
+    DEFAULT_FIELDS = ('name', 'description', 'address', 'city', 'county',
+                      'postcode', 'email')
     def add(self):
         db.session.add(self)
         db.session.commit()
@@ -22,6 +152,182 @@ class Group(db.Model):
     def update(self):
         db.session.commit()
 
+    @staticmethod
+    def update_email(id, email):
+        """
+        Sets the email of a group with a single UPDATE, without loading it.
+
+        :return: False if there is no such group
+        """
+        updated = db.session.execute(
+            update(Group)
+            .where(Group.id == id)
+            .values(email=email)
+            .returning(Group.id)).scalar()
+
+        if updated is None:
+            db.session.rollback()
+            return False
+
+        record_changes(db.session, 'group', 'update', id)
+        db.session.commit()
+        return True
+
+    @validates('postcode')
+    def locate(self, key, postcode):
+        self.latitude, self.longitude = geo.locate(postcode) or (None, None)
+        return postcode
+
+    @staticmethod
+    def load_items_requested():
+        """
+        Loader option for the data used by format(). The requested items,
+        their item and its category are fetched in one extra query for all
+        groups, instead of two lazy selects per requested item.
+        """
+        return (selectinload(Group.items_requested)
+                .joinedload(ItemRequested.item)
+                .options(joinedload(Item.category),
+                         lazyload(Item.groups_requesting)))
+
+    @staticmethod
+    def listing_select(fields=DEFAULT_FIELDS):
+        """
+        SELECT of the columns format_rows() needs, for listings that skip
+        loading ORM objects. The id, county and city are always selected,
+        as listings are paged by them.
+
+        :param fields: names from FIELDS
+        """
+        names = dict.fromkeys(('id', 'county', 'city') + tuple(fields))
+        return select(*(getattr(Group, name) for name in names))
+
+    @staticmethod
+    def format_rows(rows, item_ids=None, fields=DEFAULT_FIELDS,
+                    include_items=True):
+        """
+        Formats rows of listing_select() the same way as format(), with
+        requested items in item id order. The requested items of all the
+        groups are read in one query, as plain tuples.
+
+        :param item_ids: only include requests for these items
+        :param fields: fields of each group to return, from FIELDS
+        :param include_items: whether to add the requested items; if not,
+        no query is run
+        """
+        requested = Group.requested_items(rows, item_ids, include_items)
+        return Group.format_listing(rows, requested, fields)
+
+    @staticmethod
+    def requested_items(rows, item_ids=None, include_items=True):
+        """
+        Reads the requested items of rows of listing_select() for
+        format_listing(), in one query. Routes read them before timing
+        the serialization, so that only formatting is counted in it.
+
+        :param item_ids: only include requests for these items
+        :param include_items: whether to read them; if not, no query is
+        run and None is returned
+        """
+        if not include_items:
+            return None
+        if not rows:
+            return []
+        return db.session.execute(
+            Group.requested_items_select([row.id for row in rows],
+                                         item_ids)).all()
+
+    @staticmethod
+    def requested_items_select(group_ids, item_ids=None):
+        """
+        SELECT of the requested items format_listing() needs for the
+        groups, ordered by group and item id.
+
+        :param item_ids: only include requests for these items
+        """
+        query = (select(ItemRequested.group_id, ItemRequested.item_id,
+                        Item.name, Category.name,
+                        ItemRequested.date_requested)
+                 .join(Item, ItemRequested.item_id == Item.id)
+                 .join(Category, Item.category_id == Category.id)
+                 .where(ItemRequested.group_id.in_(group_ids))
+                 .order_by(ItemRequested.group_id, ItemRequested.item_id))
+        if item_ids is not None:
+            query = query.where(ItemRequested.item_id.in_(item_ids))
+        return query
+
+    @staticmethod
+    def format_listing(rows, requested, fields=DEFAULT_FIELDS):
+        """
+        Formats rows of listing_select() with the result of
+        requested_items_select() for them.
+
+        :param requested: the requested items, or None to leave them out
+        :param fields: fields of each group to return, from FIELDS
+        """
+        groups = [{name: getattr(row, name) for name in fields}
+                  for row in rows]
+        if requested is None:
+            return groups
+
+        items_requested = {row.id: [] for row in rows}
+
+        for group_id, item_id, item_name, category, date in requested:
+            items_requested[group_id].append({
+                'item_id': item_id,
+                'item_name': item_name,
+                'item_category': category,
+                'date_requested': date,
+            })
+
+        for row, group in zip(rows, groups):
+            group['items_requested'] = items_requested[row.id]
+        return groups
+
+    @staticmethod
+    def nearest(lat, lng, radius_km, limit):
+        """
+        Finds up to limit located groups within radius_km of a point,
+        nearest first. Postgres walks the earthdistance index in distance
+        order; other databases read the groups in growing bounding boxes
+        and measure the distances here.
+
+        :returns: list of (group id, distance in km)
+        """
+        if db.session.get_bind().dialect.name == 'postgresql':
+            origin = db.func.ll_to_earth(lat, lng)
+            location = db.func.ll_to_earth(Group.latitude, Group.longitude)
+            distance = db.func.earth_distance(origin, location)
+
+            return [tuple(row) for row in db.session.execute(
+                select(Group.id, distance / 1000)
+                .where(db.func.earth_box(origin, radius_km * 1000)
+                       .op('@>', is_comparison=True)(location))
+                .where(distance <= radius_km * 1000)
+                .order_by(location.op('<->')(origin))
+                .limit(limit))]
+
+        # every group within a box's radius is nearer than any group
+        # outside it, so stop at the first box holding enough of them
+        box_km = min(1, radius_km)
+        while True:
+            min_lat, max_lat, min_lng, max_lng = geo.bounding_box(
+                lat, lng, box_km)
+            candidates = db.session.execute(
+                select(Group.id, Group.latitude, Group.longitude)
+                .where(Group.latitude.between(min_lat, max_lat),
+                       Group.longitude.between(min_lng, max_lng)))
+
+            distances = ((geo.haversine_km(lat, lng, group_lat, group_lng),
+                          id) for id, group_lat, group_lng in candidates)
+            nearest = heapq.nsmallest(limit, (
+                (distance, id) for distance, id in distances
+                if distance <= box_km))
+
+            if len(nearest) == limit or box_km >= radius_km:
+                return [(id, distance) for distance, id in nearest]
+            box_km = min(box_km * 4, radius_km)
+
     def format(self):
 
         items_requested = []
@@ -49,6 +355,32 @@ class Group(db.Model):
     def __repr__(self):
         return f'<Group {self.name}, {self.id}>'
 
+# nearest-neighbour searches on Postgres, using the earthdistance extension
+event.listen(Group.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS cube')
+             .execute_if(dialect='postgresql'))
+event.listen(Group.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS earthdistance')
+             .execute_if(dialect='postgresql'))
+db.Index('ix_group_earth_location',
+         db.func.ll_to_earth(Group.latitude, Group.longitude),
+         postgresql_using='gist').ddl_if(dialect='postgresql')
+# bounding box searches elsewhere
+db.Index('ix_group_latitude_longitude',
+         Group.latitude, Group.longitude).ddl_if(dialect='sqlite')
+
+# full-text and trigram search on Postgres
+event.listen(Group.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+             .execute_if(dialect='postgresql'))
+db.Index('ix_group_search_vector', Group.search_vector,
+         postgresql_using='gin').ddl_if(dialect='postgresql')
+db.Index('ix_group_search_text_trgm', Group.search_text,
+         postgresql_using='gin',
+         postgresql_ops={'search_text': 'gin_trgm_ops'}
+         ).ddl_if(dialect='postgresql')
+
+
 class Category(db.Model):
     __tablename__ = 'category'
     id = db.Column(db.Integer, primary_key=True)
@@ -68,7 +400,8 @@ class Item(db.Model):
     __tablename__ = 'item'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'),
+                            nullable=False, index=True)
     groups_requesting = db.relationship('ItemRequested', backref=db.backref('item'), lazy='joined',)
 
     def format(self):
@@ -84,6 +417,14 @@ class Item(db.Model):
 # requested
 class ItemRequested(db.Model):
     __tablename__ = 'item_requested'
+    __table_args__ = (
+        # a group requests an item at most once; also serves lookups by
+        # group_id alone
+        db.Index('ix_item_requested_group_id_item_id', 'group_id', 'item_id',
+                 unique=True),
+        # the groups requesting an item, in group id order
+        db.Index('ix_item_requested_item_id_group_id', 'item_id', 'group_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
@@ -97,6 +438,124 @@ class ItemRequested(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @staticmethod
+    def add_one(group_id, item_id):
+        """
+        Adds an item to a group's requested items with a single INSERT,
+        unless the group already requested it.
+
+        :return: False if the item was already requested
+        """
+        created = db.session.execute(
+            insert_ignoring_conflicts(ItemRequested, ['group_id', 'item_id'])
+            .values(group_id=group_id, item_id=item_id)
+            .returning(ItemRequested.item_id)).scalar()
+
+        if created is not None:
+            record_changes(db.session, 'item_requested', 'insert', group_id,
+                           [item_id])
+        db.session.commit()
+        return created is not None
+
+    @staticmethod
+    def delete_one(group_id, item_id):
+        """
+        Removes an item from a group's requested items with a single
+        DELETE.
+
+        :return: False if the group did not request the item
+        """
+        deleted = db.session.execute(
+            delete(ItemRequested)
+            .where(ItemRequested.group_id == group_id,
+                   ItemRequested.item_id == item_id)
+            .returning(ItemRequested.item_id)).scalar()
+
+        if deleted is not None:
+            record_changes(db.session, 'item_requested', 'delete', group_id,
+                           [item_id])
+        db.session.commit()
+        return deleted is not None
+
+    @staticmethod
+    def known_items_select(group_id, item_ids):
+        """
+        Reads the group with each of the items that exist, in one query: no
+        rows if the group does not exist, else one per item found (or a
+        single one with a null item id if none are).
+        """
+        return (select(Group.id, Item.id)
+                .outerjoin(Item, Item.id.in_(item_ids))
+                .where(Group.id == group_id))
+
+    @staticmethod
+    def known_items(rows):
+        """
+        The item ids read by known_items_select().
+
+        :raises LookupError: if the group does not exist
+        """
+        if not rows:
+            raise LookupError('Group not found')
+        return {item_id for _, item_id in rows if item_id is not None}
+
+    @staticmethod
+    def add_many(group_id, item_ids):
+        """
+        Adds several items to a group's requested items in one transaction,
+        with a single multi-row INSERT. Items the group already requested
+        are left as they are.
+
+        :return: dict of item_id to 'created', 'already_requested' or
+        'not_found'
+        :raises LookupError: if the group does not exist
+        """
+        known = ItemRequested.known_items(
+            db.session.execute(ItemRequested.known_items_select(
+                group_id, item_ids)).all())
+        rows = [{'group_id': group_id, 'item_id': item_id}
+                for item_id in item_ids if item_id in known]
+
+        created = set()
+        if rows:
+            created = set(db.session.execute(
+                insert_ignoring_conflicts(ItemRequested,
+                                          ['group_id', 'item_id'])
+                .values(rows)
+                .returning(ItemRequested.item_id)).scalars())
+
+        if created:
+            record_changes(db.session, 'item_requested', 'insert', group_id,
+                           sorted(created))
+        db.session.commit()
+
+        return {item_id: 'created' if item_id in created
+                else 'already_requested' if item_id in known
+                else 'not_found'
+                for item_id in item_ids}
+
+    @staticmethod
+    def delete_many(group_id, item_ids):
+        """
+        Removes several items from a group's requested items with a single
+        DELETE.
+
+        :return: dict of item_id to 'deleted' or 'not_found'
+        """
+        deleted = set(db.session.execute(
+            delete(ItemRequested)
+            .where(ItemRequested.group_id == group_id,
+                   ItemRequested.item_id.in_(item_ids))
+            .returning(ItemRequested.item_id)).scalars())
+
+        if deleted:
+            record_changes(db.session, 'item_requested', 'delete', group_id,
+                           sorted(deleted))
+        db.session.commit()
+
+        return {item_id: 'deleted' if item_id in deleted else 'not_found'
+                for item_id in item_ids}
+
     def format(self):
         return {
             'group_id': self.group_id,
@@ -108,4 +567,167 @@ class ItemRequested(db.Model):
         return f'<ItemRequested {self.date_requested}, {self.id}>'
 
 
+# when each precomputed view was last refreshed (see backend/stats.py)
+class StatsRefresh(db.Model):
+    __tablename__ = 'stats_refresh'
+    name = db.Column(db.String(), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<StatsRefresh {self.name}, {self.refreshed_at}>'
+
+
+# inserts, updates and deletes of groups and requested items, in commit
+# order, for clients syncing their copy of the directory (see
+# backend/changes.py). The id is the token clients resume from.
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    # ids are never reused, even after the newest entries are compacted
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'),
+                   primary_key=True)
+    entity = db.Column(db.String(), nullable=False)
+    operation = db.Column(db.String(), nullable=False)
+    # not foreign keys, as entries outlive what they describe
+    group_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           index=True)
+    # Postgres transaction that wrote the entry
+    txid = db.Column(db.BigInteger, index=True)
+
+    def format(self):
+        return {
+            'token': self.id,
+            'entity': self.entity,
+            'operation': self.operation,
+            'group_id': self.group_id,
+            'item_id': self.item_id,
+            'changed_at': self.changed_at,
+        }
+
+    def __repr__(self):
+        return f'<ChangeLog {self.operation} {self.entity}, {self.id}>'
+
+
+# Per Postgres transaction that wrote to the change log, the next
+# transaction id once its entries were written. Its entries are read once
+# every older transaction has ended, see backend.changes.visible_through.
+class ChangeLogHorizon(db.Model):
+    __tablename__ = 'change_log_horizon'
+    txid = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    visible_after = db.Column(db.BigInteger, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ChangeLogHorizon {self.txid}, {self.visible_after}>'
+
+
+# the newest change log entry removed by each compaction
+class ChangeLogCompaction(db.Model):
+    __tablename__ = 'change_log_compaction'
+    id = db.Column(db.Integer, primary_key=True)
+    compacted_through = db.Column(db.BigInteger, nullable=False)
+    compacted_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLogCompaction {self.compacted_through}, {self.id}>'
+
+
+def record_changed_groups(session, flush_context):
+    operations = (('insert', session.new), ('update', session.dirty),
+                  ('delete', session.deleted))
+
+    for operation, objs in operations:
+        for obj in objs:
+            # e.g. a group whose requested items were appended to
+            if (operation == 'update'
+                    and not session.is_modified(obj,
+                                                include_collections=False)):
+                continue
+            if isinstance(obj, Group):
+                record_changes(session, 'group', operation, obj.id)
+            elif isinstance(obj, ItemRequested):
+                record_changes(session, 'item_requested', operation,
+                               obj.group_id, [obj.item_id])
+
+
+def bump_changed_groups(session):
+    """
+    Bumps the version and updated_at of the groups changed by the
+    transaction, as its last statement before the commit.
+    """
+    # the changes still pending are only recorded once flushed
+    session.flush()
+
+    group_ids = session.info.get(CHANGED_GROUPS)
+    if group_ids:
+        session.execute(
+            update(Group)
+            .where(Group.id.in_(group_ids))
+            .values(version=Group.version + 1, updated_at=utcnow())
+            .execution_options(synchronize_session=False))
+
+
+def write_change_log(session):
+    """
+    Writes the changes recorded in the transaction to the change log, in
+    the same transaction, and notifies listeners on commit.
+
+    Writers do not wait for each other, so on Postgres an entry can commit
+    after one with a greater id. Each entry records its transaction, and
+    each transaction the next transaction id once its entries have their
+    ids. Readers only go as far as the entries of transactions whose
+    horizon every open transaction is past, see visible_through.
+    """
+    session.flush()
+
+    changes = session.info.pop(PENDING_CHANGES, None)
+    queries = session.info.pop(PENDING_CHANGE_QUERIES, None)
+    if not changes and not queries:
+        return
+
+    txid = None
+    postgres = session.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        # assigns the transaction id before any entry takes its id
+        txid = session.execute(
+            select(CURRENT_TXID, db.func.pg_notify(CHANGE_LOG_CHANNEL, None))
+        ).scalar()
+
+    changed_at = utcnow()
+    if changes:
+        session.execute(insert(ChangeLog), [
+            {'entity': entity, 'operation': operation, 'group_id': group_id,
+             'item_id': item_id, 'changed_at': changed_at, 'txid': txid}
+            for entity, operation, group_id, item_id in changes])
+
+    for query in queries or ():
+        columns = query.subquery().c
+        session.execute(insert(ChangeLog).from_select(
+            ['entity', 'operation', 'group_id', 'item_id', 'changed_at',
+             'txid'],
+            select(*columns, literal(changed_at), literal(txid))))
+
+    if postgres:
+        # a statement of its own, so the snapshot is taken after the ids
+        session.execute(insert(ChangeLogHorizon).values(
+            txid=txid, visible_after=SNAPSHOT_XMAX))
+
+
+def forget_changes(session, previous_transaction):
+    session.info.pop(PENDING_CHANGES, None)
+    session.info.pop(PENDING_CHANGE_QUERIES, None)
+
+
+def track_group_changes(target):
+    """
+    Registers the listeners recording, versioning and logging changed
+    groups on a session, sessionmaker or Session class.
+    """
+    event.listen(target, 'after_flush', record_changed_groups)
+    event.listen(target, 'before_commit', bump_changed_groups)
+    event.listen(target, 'before_commit', write_change_log)
+    event.listen(target, 'after_soft_rollback', forget_changes)
+
 
+track_group_changes(db.session)
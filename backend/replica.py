@@ -0,0 +1,200 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from jose import exceptions, jwt
+from sqlalchemy import event, text
+
+from backend import db
+from backend.database import REPLICA, USE_REPLICA
+
+# cookie holding the time until which the client reads from the primary
+PRIMARY_UNTIL_COOKIE = 'chipin_primary_until'
+
+# prefix of the keys pinning a JWT sub to the primary, for clients that
+# do not send cookies back (other origins, API clients)
+PRIMARY_PIN_PREFIX = 'chipin:primary:'
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# seconds the replica is behind the primary; 0 when it has replayed all
+# the WAL it received, as replay timestamps stop moving on an idle primary
+REPLICATION_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+          OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaMonitor:
+    """
+    Tells whether the replica can serve reads: it must be reachable and no
+    further behind the primary than max_lag seconds. The result is cached
+    for check_interval seconds.
+    """
+
+    def __init__(self, engine, max_lag=5, check_interval=5):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self._usable = False
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def usable(self):
+        if time.monotonic() >= self._next_check:
+            with self._lock:
+                if time.monotonic() >= self._next_check:
+                    self._usable = self._check()
+                    self._next_check = time.monotonic() + self.check_interval
+        return self._usable
+
+    def mark_failed(self):
+        self._usable = False
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _check(self):
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name != 'postgresql':
+                    connection.execute(text('SELECT 1'))
+                    return True
+
+                lag = connection.execute(REPLICATION_LAG).scalar()
+                if lag > self.max_lag:
+                    print(f'Replica is {lag:.1f}s behind, reading from '
+                          f'the primary')
+                    return False
+                return True
+
+        except Exception as e:
+            print(e)
+            return False
+
+
+def token_sub(verified=True):
+    """
+    The sub claim of the caller's bearer token, or None.
+
+    :param verified: only read tokens this worker has verified. Reads take
+    the claim unverified, as a forged one can do no more than send its
+    sender's reads to the primary.
+    """
+    from backend.api import auth
+
+    try:
+        token = auth.parse_auth_header(request.headers.get('Authorization'))
+        if verified:
+            payload = auth.token_cache.peek(token)
+        else:
+            payload = jwt.get_unverified_claims(token)
+    except (auth.AuthError, exceptions.JOSEError):
+        return None
+
+    sub = payload.get('sub') if isinstance(payload, dict) else None
+    return sub if isinstance(sub, str) and sub else None
+
+
+def reads_from_primary():
+    """
+    True while the client is within its read-your-writes window, by its
+    cookie, or failing that by the sub of its bearer token.
+    """
+    try:
+        if float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+
+    pins = current_app.extensions.get('primary_pins')
+    if pins is None or 'Authorization' not in request.headers:
+        return False
+    sub = token_sub(verified=False)
+    return sub is not None and pins.get(sub) is not None
+
+
+def replica_read(f):
+    """
+    Decorator for read-only views, running them against the read replica
+    when one is configured and usable. Falls back to the primary for
+    clients that wrote recently, when the replica is down or lagging, and
+    re-runs the view on the primary if the replica fails mid-request.
+    Sets g.read_from_replica when the response was read from the replica.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        monitor = current_app.extensions.get('replica_monitor')
+        if monitor is None or reads_from_primary() or not monitor.usable():
+            return f(*args, **kwargs)
+
+        g.replica_failed = False
+        db.session.info[USE_REPLICA] = True
+        try:
+            response = f(*args, **kwargs)
+        except Exception:
+            # views turn most errors into 404s, so a replica failure may
+            # surface as one
+            if not g.replica_failed:
+                raise
+        finally:
+            db.session.info.pop(USE_REPLICA, None)
+
+        if g.replica_failed:
+            monitor.mark_failed()
+            db.session.rollback()
+            return f(*args, **kwargs)
+
+        g.read_from_replica = True
+        return response
+
+    return wrapper
+
+
+def init_app(app):
+    """
+    Enables replica reads when SQLALCHEMY_BINDS has a 'replica' entry.
+    Successful writes start a read-your-writes window of
+    READ_YOUR_WRITES_SECONDS, during which the client reads from the
+    primary. The window is kept in a cookie, and for the sub of the JWT
+    in the RESPONSE_CACHE_BACKEND store: redis, shared by all workers, or
+    else memory, per worker.
+    """
+    from backend.cache import MemoryBackend, RedisBackend
+
+    with app.app_context():
+        engine = db.engines.get(REPLICA)
+
+    if engine is None:
+        return
+
+    if app.config.get('RESPONSE_CACHE_BACKEND') == 'redis':
+        pins = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'],
+                            prefix=PRIMARY_PIN_PREFIX)
+    else:
+        pins = MemoryBackend(app.config.get('RESPONSE_CACHE_SIZE', 1024))
+    app.extensions['primary_pins'] = pins
+
+    app.extensions['replica_monitor'] = ReplicaMonitor(
+        engine, app.config.get('REPLICA_MAX_LAG_SECONDS', 5),
+        app.config.get('REPLICA_CHECK_INTERVAL', 5))
+    window = app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+
+    @event.listens_for(engine, 'handle_error')
+    def record_replica_failure(context):
+        if has_request_context():
+            g.replica_failed = True
+
+    @app.after_request
+    def pin_to_primary_after_write(response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PRIMARY_UNTIL_COOKIE,
+                                str(time.time() + window), max_age=window,
+                                httponly=True, samesite='Lax')
+            sub = token_sub()
+            if sub is not None:
+                pins.set(sub, b'1', window)
+        return response
@@ -0,0 +1,209 @@
+import re
+
+from sqlalchemy import DDL, BigInteger, and_, case, cast, event, exists, \
+    func, literal, or_, select
+from sqlalchemy.dialects.postgresql import TSQUERY
+
+from backend import db
+from backend.models import Category, Group, Item, ItemRequested
+
+# Most words of a query that are searched for
+MAX_QUERY_WORDS = 10
+
+# Postgres ranks are rounded to integer multiples of 1 / RANK_SCALE, so
+# the rank held by a search cursor compares equal to the one it came from
+RANK_SCALE = 1000000
+
+# Postgres keeps group.search_vector and group.search_text up to date with
+# triggers. Changes to requested items, or to the names of requested items
+# and their categories, touch search_text on the groups concerned, which
+# makes the group trigger rebuild both columns.
+SEARCH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION group_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        items text;
+        categories text;
+    BEGIN
+        SELECT string_agg(i.name, ' '), string_agg(DISTINCT c.name, ' ')
+        INTO items, categories
+        FROM item_requested r
+        JOIN item i ON i.id = r.item_id
+        JOIN category c ON c.id = i.category_id
+        WHERE r.group_id = NEW.id;
+
+        NEW.search_text := concat_ws(' ', NEW.name, NEW.city, NEW.county,
+                                     items, categories);
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('english',
+                                     concat_ws(' ', NEW.city, NEW.county,
+                                               items)), 'B')
+            || setweight(to_tsvector('english', coalesce(categories, '')),
+                         'C')
+            || setweight(to_tsvector('english',
+                                     coalesce(NEW.description, '')), 'D');
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION item_requested_search_trigger()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (SELECT group_id FROM new_rows);
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (SELECT group_id FROM old_rows);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION catalog_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'item' THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (
+                SELECT r.group_id FROM item_requested r
+                JOIN new_rows n ON n.id = r.item_id
+                JOIN old_rows o ON o.id = n.id
+                WHERE (o.name, o.category_id)
+                      IS DISTINCT FROM (n.name, n.category_id));
+        ELSE
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (
+                SELECT r.group_id FROM item_requested r
+                JOIN item i ON i.id = r.item_id
+                JOIN new_rows n ON n.id = i.category_id
+                JOIN old_rows o ON o.id = n.id
+                WHERE o.name IS DISTINCT FROM n.name);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    'DROP TRIGGER IF EXISTS group_search ON "group"',
+    """
+    CREATE TRIGGER group_search
+    BEFORE INSERT OR UPDATE OF name, description, city, county, search_text
+    ON "group" FOR EACH ROW EXECUTE FUNCTION group_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_insert ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_insert
+    AFTER INSERT ON item_requested REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_update ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_update
+    AFTER UPDATE ON item_requested
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_delete ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_delete
+    AFTER DELETE ON item_requested REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_search ON item',
+    """
+    CREATE TRIGGER item_search
+    AFTER UPDATE ON item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS category_search ON category',
+    """
+    CREATE TRIGGER category_search
+    AFTER UPDATE ON category
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_search_trigger()
+    """,
+]
+
+for statement in SEARCH_DDL:
+    event.listen(db.metadata, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+
+
+def query_words(q):
+    return re.findall(r'\w+', q.lower())[:MAX_QUERY_WORDS]
+
+
+def search_rank(q):
+    """
+    Returns (match condition, rank) of groups for the query. Groups match
+    any of its words, and rank higher the more of them they match.
+
+    On Postgres words are matched against the search_vector full-text
+    index, weighting group names above places and requested items, then
+    categories, then descriptions. A trigram match on search_text adds
+    prefixes and misspellings. Other databases fall back to counting the
+    words found with LIKE. Either way the rank is an integer.
+    """
+    words = query_words(q)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # any of the words, rather than plainto_tsquery's all of them
+        tsquery = func.plainto_tsquery('english', words[0])
+        for word in words[1:]:
+            tsquery = tsquery.op('||', return_type=TSQUERY)(
+                func.plainto_tsquery('english', word))
+
+        phrase = ' '.join(words)
+        condition = or_(Group.search_vector.op('@@')(tsquery),
+                        literal(phrase).op('<%')(Group.search_text))
+        rank = (func.ts_rank_cd(Group.search_vector, tsquery)
+                + func.word_similarity(phrase, Group.search_text))
+        return condition, cast(func.round(rank * RANK_SCALE), BigInteger)
+
+    rank = 0
+    for word in words:
+        pattern = f'%{word}%'
+        requested = exists(
+            select(ItemRequested.id)
+            .join(Item, ItemRequested.item_id == Item.id)
+            .join(Category, Item.category_id == Category.id)
+            .where(ItemRequested.group_id == Group.id,
+                   or_(Item.name.ilike(pattern),
+                       Category.name.ilike(pattern))))
+        rank += case((or_(Group.name.ilike(pattern),
+                          Group.description.ilike(pattern),
+                          Group.city.ilike(pattern),
+                          Group.county.ilike(pattern),
+                          requested), 1), else_=0)
+
+    return rank > 0, rank
+
+
+def search_groups(q, after, limit, fields=Group.DEFAULT_FIELDS):
+    """
+    Finds groups matching the query, best match first, then by id.
+
+    :param after: (rank, id) of the last group of the previous page, or
+    None for the first page
+    :param fields: fields to select, from Group.FIELDS
+    :returns: up to limit rows of Group.listing_select() plus their rank
+    """
+    condition, rank = search_rank(q)
+    rank = rank.label('rank')
+
+    query = (Group.listing_select(fields)
+             .add_columns(rank)
+             .where(condition)
+             .order_by(rank.desc(), Group.id)
+             .limit(limit))
+
+    if after is not None:
+        after_rank, after_id = after
+        query = query.where(or_(rank < after_rank,
+                                and_(rank == after_rank,
+                                     Group.id > after_id)))
+
+    return db.session.execute(query).all()
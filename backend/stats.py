@@ -0,0 +1,215 @@
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, column, event, func, select, table, text
+from sqlalchemy.dialects.postgresql import insert
+
+from backend import db
+from backend.models import Category, Group, Item, ItemRequested, \
+    StatsRefresh
+
+VIEW = 'demand_stats'
+
+# key of the advisory lock held while the view is refreshed
+REFRESH_LOCK = 0x63686970
+
+# Open requests per item, county and week, with the item's category so
+# category totals need no join. The unique index allows concurrent
+# refreshes, which do not block readers.
+VIEW_DDL = [
+    f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW} AS
+    SELECT r.item_id, i.category_id, g.county,
+           date_trunc('week', coalesce(r.date_requested, 'epoch'))::date
+               AS week,
+           count(*) AS requests
+    FROM item_requested r
+    JOIN item i ON i.id = r.item_id
+    JOIN "group" g ON g.id = r.group_id
+    GROUP BY 1, 2, 3, 4
+    """,
+    f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_{VIEW}_item_id_county_week
+    ON {VIEW} (item_id, county, week)
+    """,
+]
+
+for statement in VIEW_DDL:
+    event.listen(db.metadata, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop',
+             DDL(f'DROP MATERIALIZED VIEW IF EXISTS {VIEW}')
+             .execute_if(dialect='postgresql'))
+
+demand_stats = table(VIEW, column('item_id'), column('category_id'),
+                     column('county'), column('week'), column('requests'))
+
+# dimensions the totals can be grouped by
+DIMENSIONS = ('category', 'county', 'item')
+
+
+def precomputed():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def live_stats():
+    """
+    The rows of the view computed from the tables, for databases without
+    materialized views. Weeks start on Monday, as in Postgres.
+    """
+    week = func.date(ItemRequested.date_requested, 'weekday 0', '-6 days')
+    return (select(ItemRequested.item_id, Item.category_id, Group.county,
+                   week.label('week'), func.count().label('requests'))
+            .join(Item, ItemRequested.item_id == Item.id)
+            .join(Group, ItemRequested.group_id == Group.id)
+            .group_by(ItemRequested.item_id, Item.category_id, Group.county,
+                      week)
+            .subquery(VIEW))
+
+
+def refresh(wait=True):
+    """
+    Refreshes the view concurrently, holding an advisory lock so only one
+    refresh runs at a time, and records when it was done.
+
+    :param wait: wait for a refresh already running instead of giving up
+    :returns: False if another refresh was running and wait is False
+    """
+    if wait:
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                           {'key': REFRESH_LOCK})
+    elif not db.session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'),
+                                {'key': REFRESH_LOCK}).scalar():
+        db.session.rollback()
+        return False
+
+    db.session.execute(text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW}'))
+    db.session.execute(
+        insert(StatsRefresh)
+        .values(name=VIEW, refreshed_at=func.now())
+        .on_conflict_do_update(index_elements=['name'],
+                               set_={'refreshed_at': func.now()}))
+    db.session.commit()
+    return True
+
+
+def freshness():
+    """
+    :returns: (time of the last refresh, seconds since then), or
+    (None, None) if the view has not been refreshed
+    """
+    row = db.session.execute(
+        select(StatsRefresh.refreshed_at,
+               func.extract('epoch', func.now() - StatsRefresh.refreshed_at))
+        .where(StatsRefresh.name == VIEW)).one_or_none()
+    return (row[0], float(row[1])) if row is not None else (None, None)
+
+
+def demand(by, weeks, county=None, category_id=None):
+    """
+    Totals of open requests grouped by category, county or item, and the
+    weekly trend over the last weeks weeks, optionally only for a county
+    or category.
+    """
+    source = demand_stats if precomputed() else live_stats()
+    requests = func.sum(source.c.requests).label('requests')
+
+    filters = []
+    if county is not None:
+        filters.append(source.c.county == county)
+    if category_id is not None:
+        filters.append(source.c.category_id == category_id)
+
+    if by == 'category':
+        query = (select(source.c.category_id, Category.name, requests)
+                 .join(Category, Category.id == source.c.category_id)
+                 .group_by(source.c.category_id, Category.name))
+        keys = ('category_id', 'category')
+    elif by == 'county':
+        query = select(source.c.county, requests).group_by(source.c.county)
+        keys = ('county',)
+    else:
+        query = (select(source.c.item_id, Item.name, source.c.category_id,
+                        requests)
+                 .join(Item, Item.id == source.c.item_id)
+                 .group_by(source.c.item_id, Item.name,
+                           source.c.category_id))
+        keys = ('item_id', 'item', 'category_id')
+
+    totals = db.session.execute(
+        query.where(*filters)
+        .order_by(requests.desc(), query.selected_columns[0])).all()
+
+    # weeks start on Monday
+    today = date.today()
+    first_week = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    trend = db.session.execute(
+        select(source.c.week, requests)
+        .where(source.c.week >= first_week.isoformat(), *filters)
+        .group_by(source.c.week)
+        .order_by(source.c.week)).all()
+
+    return (
+        [dict(zip(keys, row[:-1]), requests=int(row[-1])) for row in totals],
+        [{'week': str(week), 'requests': int(count)}
+         for week, count in trend],
+    )
+
+
+@click.command('refresh-stats')
+@with_appcontext
+def refresh_stats_command():
+    """
+    Refreshes the demand statistics served by GET /api/stats. Run it more
+    often than STATS_MAX_STALENESS_SECONDS, e.g. from cron, so requests
+    never have to.
+    """
+    if not precomputed():
+        click.echo('Statistics are computed live on this database')
+        return
+
+    # a refresh can take longer than the statement timeout of requests
+    db.session.execute(text('SET LOCAL statement_timeout = 0'))
+    refresh()
+    click.echo(f'Refreshed {VIEW}')
+
+
+def current_demand(by, weeks, county=None, category_id=None):
+    """
+    demand() from a view at most STATS_MAX_STALENESS_SECONDS old. An older
+    view is refreshed first, unless another refresh is running, in which
+    case its data is returned marked stale.
+
+    :returns: dict of totals, trend, refreshed_at (None when computed
+    live) and stale
+    """
+    refreshed_at, stale = None, False
+
+    if precomputed():
+        max_staleness = current_app.config.get('STATS_MAX_STALENESS_SECONDS',
+                                               300)
+        refreshed_at, age = freshness()
+
+        if age is None or age > max_staleness:
+            try:
+                refreshed = refresh(wait=False)
+            except Exception as e:
+                # e.g. cancelled by the statement timeout
+                print(e)
+                db.session.rollback()
+                refreshed = False
+
+            if refreshed:
+                refreshed_at, age = freshness()
+            else:
+                stale = True
+
+    totals, trend = demand(by, weeks, county, category_id)
+    return {
+        'totals': totals,
+        'trend': trend,
+        'refreshed_at': refreshed_at,
+        'stale': stale,
+    }
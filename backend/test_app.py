@@ -1,16 +1,58 @@
+import base64
+import gzip
+import importlib.util
 import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
 
-from flask import request
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from flask import g, request
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.serving import make_server
+from sqlalchemy import literal, select, text
 
-from backend import create_app, db
+from backend import create_app, db, geo, models, stats
+from backend.api import admission, auth, routes
+from backend.api.jwks import JWKSKeyStore, JWKSUnavailable
+from backend.api.pagination import encode_cursor
+from backend.api.token_cache import VerifiedTokenCache
+from backend.cache import MemoryBackend, ResponseCache
+from backend.database import TimedQueuePool, engine_options
+from backend.events import Subscriber
+from backend.instrumentation import RequestTimings, count_queries
 from backend.models import Group, Category, Item, ItemRequested
-from config import config_dict, Config, TestingConfig, DevelopmentConfig
+from config import config_dict, Config, TestingConfig, DevelopmentConfig, \
+    ProductionConfig
+
+
+class QueryBudgetMixin:
+    """Fails a test when a block runs more SQL statements than budgeted"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        with self.app.app_context():
+            engine = db.engine
+
+        with count_queries(engine) as counter:
+            yield counter
 
+        self.assertLessEqual(
+            counter.count, budget,
+            f'{counter.count} queries run, budget is {budget}:\n'
+            + '\n'.join(statement for statement, _ in counter.statements))
 
-class GroupTestCase(unittest.TestCase):
+
+class GroupTestCase(QueryBudgetMixin, unittest.TestCase):
     """Testing the Group resource"""
 
     def setUp(self):
@@ -132,9 +174,17 @@ class GroupTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Executed after each test"""
+        self.app.extensions['change_events'].stop()
         with self.app.app_context():
             db.drop_all()
 
+    def local_auth_header(self, *permissions):
+        """Authorization header signed by a LocalAuth key"""
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        return local_auth.header(*permissions)
+
     ################# GET endpoints #################################
 
     def test_get_paginated_groups(self):
@@ -154,6 +204,50 @@ class GroupTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Groups not found')
 
+    def test_get_groups_by_cursor(self):
+        names = []
+        cursor = ''
+        with mock.patch.object(routes, 'ITEMS_PER_PAGE', 2):
+            while cursor is not None:
+                response = self.client().get(f'api/groups?cursor={cursor}')
+                data = json.loads(response.data)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('total_groups', data)
+                names += [group['name'] for group in data['groups']]
+                cursor = data['next_cursor']
+
+        self.assertEqual(names, ['British Heart Foundation',
+                                 'Trussel Trust Leeds',
+                                 'Leeds Community Centre'])
+
+    def test_400_malformed_cursor(self):
+        for cursor in ['not-a-cursor',
+                       encode_cursor([{'a': 1}, 'b', 1]),
+                       encode_cursor(['a', 'b', True]),
+                       encode_cursor(['a', 'b', '1'])]:
+            with self.subTest(cursor=cursor):
+                response = self.client().get(f'api/groups?cursor={cursor}')
+                data = json.loads(response.data)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(data['success'], False)
+
+    def test_get_groups_without_total(self):
+        # page of groups and requested items, no COUNT(*)
+        with self.assertQueryBudget(2):
+            response = self.client().get('api/groups?page=1&total=none')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(data['total_groups'])
+
+    def test_get_groups_with_estimated_total(self):
+        response = self.client().get('api/groups?cursor=&total=estimate')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['total_groups'], 3)
+
     def test_get_group_by_id(self):
         response = self.client().get('api/groups/1')
         data = json.loads(response.data)
@@ -163,6 +257,478 @@ class GroupTestCase(unittest.TestCase):
         self.assertEqual(data['group']['name'],
                          'British Heart Foundation')
 
+    def test_get_groups_query_budget(self):
+        # count, page of groups, requested items with item and category
+        with self.assertQueryBudget(3):
+            response = self.client().get('api/groups')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['groups'][0]['items_requested'][0]
+                         ['item_category'], 'Books')
+
+    def test_format_rows_matches_format(self):
+        with self.app.app_context():
+            groups = (Group.query.options(Group.load_items_requested())
+                      .order_by(Group.id).all())
+            rows = db.session.execute(
+                Group.listing_select().order_by(Group.id)).all()
+
+            expected = [group.format() for group in groups]
+            for group in expected:
+                group['items_requested'].sort(key=lambda item: item['item_id'])
+
+            self.assertEqual(Group.format_rows(rows), expected)
+
+    def test_orjson_provider_matches_default(self):
+        try:
+            import orjson  # noqa: F401
+        except ImportError:
+            self.skipTest('orjson is not installed')
+
+        app = create_app(type('OrjsonConfig', (TestingConfig,),
+                              {'JSON_PROVIDER': 'orjson'}))
+
+        with self.app.app_context():
+            expected = self.client().get('api/groups').data
+        with app.app_context():
+            response = app.test_client().get('api/groups')
+
+        self.assertEqual(response.data, expected)
+        self.assertIn('GMT', json.loads(response.data)['groups'][0]
+                      ['items_requested'][0]['date_requested'])
+
+    def test_get_nearby_groups(self):
+        # Leeds city centre
+        response = self.client().get('api/groups/nearby?lat=53.7997'
+                                     '&lng=-1.5492&radius=5')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(group['name'] for group in data['groups']),
+                         ['Leeds Community Centre', 'Trussel Trust Leeds'])
+        self.assertLess(data['groups'][0]['distance_km'], 1)
+
+    def test_get_nearby_groups_fields(self):
+        response = self.client().get('api/groups/nearby?lat=53.7997'
+                                     '&lng=-1.5492&radius=5&fields=name')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(data['groups'][0]), {'name', 'distance_km'})
+
+        response = self.client().get('api/groups/nearby?lat=53.7997'
+                                     '&lng=-1.5492&radius=5'
+                                     '&fields=name,latitude')
+        group = json.loads(response.data)['groups'][0]
+        self.assertEqual(set(group), {'name', 'latitude', 'distance_km'})
+
+    def test_get_nearby_groups_nearest_first(self):
+        # Westminster, with Leeds about 270km away
+        response = self.client().get('api/groups/nearby?lat=51.4975'
+                                     '&lng=-0.1357&radius=200&limit=2')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['name'] for group in data['groups']],
+                         ['British Heart Foundation'])
+
+    def test_get_nearby_groups_limit(self):
+        response = self.client().get('api/groups/nearby?lat=53.7997'
+                                     '&lng=-1.5492&limit=1')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['groups']), 1)
+
+    def test_get_nearby_groups_invalid_arguments(self):
+        for args in ['lng=-1.5', 'lat=91&lng=0', 'lat=53&lng=-1&radius=500',
+                     'lat=53&lng=-1&limit=0', 'lat=nan&lng=-1']:
+            response = self.client().get(f'api/groups/nearby?{args}')
+            self.assertEqual(response.status_code, 400, args)
+
+    def test_search_ranks_groups_matching_more_words_first(self):
+        response = self.client().get('api/search?q=Leeds%20rice')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['name'] for group in data['groups']],
+                         ['Trussel Trust Leeds', 'Leeds Community Centre'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_search_requested_items_and_categories(self):
+        response = self.client().get('api/search?q=stationary')
+        data = json.loads(response.data)
+
+        self.assertEqual([group['name'] for group in data['groups']],
+                         ['Leeds Community Centre'])
+
+    def test_search_cursor_pagination(self):
+        with self.app.app_context():
+            for n in range(6):
+                db.session.add(Group(name=f'Book Bank {n}',
+                                     description='Books for schools',
+                                     address='1 Road', city='York',
+                                     county='North Yorkshire',
+                                     postcode='YO1 7HH',
+                                     email='books@email.com'))
+            db.session.commit()
+
+        names = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client().get(f'api/search?q=book&cursor={cursor}')
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 200)
+            names += [group['name'] for group in data['groups']]
+            cursor = data['next_cursor']
+
+        # the fixture groups requesting Fiction and Non-Fiction are found
+        # through the Books category
+        self.assertEqual(len(names), 8)
+        self.assertEqual(len(set(names)), 8)
+
+    def test_search_cursor_pagination_with_equal_ranks(self):
+        with self.app.app_context():
+            for n in range(7):
+                db.session.add(Group(name='Toy Library',
+                                     description='Toys for families',
+                                     address='1 Road', city='York',
+                                     county='North Yorkshire',
+                                     postcode='YO1 7HH',
+                                     email='toys@email.com'))
+            db.session.commit()
+
+        ids, pages = [], 0
+        cursor = ''
+        while cursor is not None:
+            response = self.client().get('api/search?q=toy&fields=id'
+                                         f'&cursor={cursor}')
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 200)
+            ids += [group['id'] for group in data['groups']]
+            cursor, pages = data['next_cursor'], pages + 1
+
+        # ties are broken by id, across pages
+        self.assertEqual(pages, 2)
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_search_invalid_arguments(self):
+        for args in ['', 'q=', 'q=%20!', 'q=' + 'a' * 201,
+                     'q=leeds&cursor=abc',
+                     f'q=leeds&cursor={encode_cursor(["x", 1])}',
+                     f'q=leeds&cursor={encode_cursor([0.5, 1])}']:
+            response = self.client().get(f'api/search?{args}')
+            self.assertEqual(response.status_code, 400, args)
+
+    def test_get_groups_requesting_item(self):
+        # item, page of groups, their requests for the item
+        with self.assertQueryBudget(3):
+            response = self.client().get('api/items/2/groups')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['item']['name'], 'Non-Fiction')
+        self.assertEqual([group['id'] for group in data['groups']], [1, 3])
+        self.assertEqual([[item['item_name'] for item
+                           in group['items_requested']]
+                          for group in data['groups']],
+                         [['Non-Fiction'], ['Non-Fiction']])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_groups_requesting_item_filtered(self):
+        response = self.client().get('api/items/2/groups?city=Leeds')
+        data = json.loads(response.data)
+
+        self.assertEqual([group['name'] for group in data['groups']],
+                         ['Leeds Community Centre'])
+
+    def test_get_groups_requesting_category_cursor(self):
+        with self.app.app_context():
+            for n in range(5):
+                group = Group(name=f'Reading Group {n}', description='Books',
+                              address='1 Road', city='York',
+                              county='North Yorkshire', postcode='YO1 7HH',
+                              email='books@email.com')
+                db.session.add(group)
+                db.session.flush()
+                db.session.add(ItemRequested(group_id=group.id, item_id=1))
+            db.session.commit()
+
+        response = self.client().get('api/categories/1/groups')
+        data = json.loads(response.data)
+        self.assertEqual(data['category']['name'], 'Books')
+        self.assertEqual([group['id'] for group in data['groups']],
+                         [1, 3, 4, 5, 6])
+        self.assertEqual(len(data['groups'][0]['items_requested']), 2)
+
+        response = self.client().get(
+            f'api/categories/1/groups?cursor={data["next_cursor"]}')
+        data = json.loads(response.data)
+        self.assertEqual([group['id'] for group in data['groups']], [7, 8])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_groups_requesting_unknown_item_or_category(self):
+        self.assertEqual(self.client().get('api/items/1000/groups')
+                         .status_code, 404)
+        self.assertEqual(self.client().get('api/categories/1000/groups')
+                         .status_code, 404)
+        self.assertEqual(self.client().get('api/items/1/groups?cursor=abc')
+                         .status_code, 400)
+
+    def test_get_stats_by_category(self):
+        response = self.client().get('api/stats')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['category'], row['requests'])
+                          for row in data['totals']],
+                         [('Books', 3), ('Food', 3), ('Clothes', 1),
+                          ('Stationary', 1)])
+        self.assertEqual(sum(week['requests'] for week in data['trend']), 8)
+        self.assertFalse(data['stale'])
+
+    def test_get_stats_filtered_by_county(self):
+        response = self.client().get('api/stats?by=item&category_id=1'
+                                     '&county=West%20Yorkshire')
+        data = json.loads(response.data)
+
+        self.assertEqual([(row['item'], row['requests'])
+                          for row in data['totals']], [('Non-Fiction', 1)])
+
+    def test_get_stats_invalid_arguments(self):
+        for args in ['by=postcode', 'weeks=0', 'weeks=105']:
+            response = self.client().get(f'api/stats?{args}')
+            self.assertEqual(response.status_code, 400, args)
+
+    def test_get_changes(self):
+        response = self.client().get('api/changes')
+        token = json.loads(response.data)['next_token']
+        # the three groups and eight requested items of setUp
+        self.assertEqual(token, 11)
+
+        self.client().patch('api/groups/1', json={'email': 'new@bhf.org.uk'},
+                            headers=self.local_auth_header(
+                                'patch:group_email'))
+        self.client().post('/api/groups/2/items', json={'item_ids': [1, 7]},
+                           headers=self.local_auth_header(
+                               'post:item_requested'))
+        self.client().delete('/api/groups/3/items', json={'item_ids': [7]},
+                             headers=self.local_auth_header(
+                                 'delete:item_requested'))
+        self.client().delete('/api/groups/1/items/2',
+                             headers=self.local_auth_header(
+                                 'delete:item_requested'))
+        self.client().post('/api/groups', json=self.new_group.format(),
+                           headers=self.local_auth_header('post:group'))
+
+        response = self.client().get(f'api/changes?since={token}')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(change['entity'], change['operation'],
+                           change['group_id'], change['item_id'])
+                          for change in data['changes']],
+                         [('group', 'update', 1, None),
+                          ('item_requested', 'insert', 2, 1),
+                          ('item_requested', 'insert', 2, 7),
+                          ('item_requested', 'delete', 3, 7),
+                          ('item_requested', 'delete', 1, 2),
+                          ('group', 'insert', 4, None)])
+        self.assertEqual([change['token'] for change in data['changes']],
+                         list(range(token + 1, token + 7)))
+        self.assertEqual(data['next_token'], token + 6)
+        self.assertFalse(data['has_more'])
+
+        response = self.client().get(f'api/changes?since={token + 6}')
+        data = json.loads(response.data)
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['next_token'], token + 6)
+
+    def test_get_changes_in_pages(self):
+        tokens, since, has_more = [], 0, True
+        while has_more:
+            response = self.client().get(f'api/changes?since={since}&limit=4')
+            data = json.loads(response.data)
+            tokens += [change['token'] for change in data['changes']]
+            since, has_more = data['next_token'], data['has_more']
+
+        self.assertEqual(tokens, list(range(1, 12)))
+
+    def test_get_changes_after_compaction(self):
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['compact-changes', '--days', '0'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Removed 11 changes', result.output)
+
+        response = self.client().get('api/changes?since=3')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(data['success'], False)
+
+        # the latest token is still served, and never handed out again
+        response = self.client().get('api/changes')
+        self.assertEqual(json.loads(response.data)['next_token'], 11)
+        response = self.client().get('api/changes?since=11')
+        self.assertEqual(response.status_code, 200)
+
+        self.client().post('/api/groups/2/items', json={'item_ids': [1]},
+                           headers=self.local_auth_header(
+                               'post:item_requested'))
+        response = self.client().get('api/changes?since=11')
+        data = json.loads(response.data)
+        self.assertEqual([change['token'] for change in data['changes']],
+                         [12])
+
+    def test_get_changes_invalid_arguments(self):
+        for args in ['since=-1', 'since=x', 'since=0&limit=0',
+                     'since=0&limit=1001']:
+            response = self.client().get(f'api/changes?{args}')
+            self.assertEqual(response.status_code, 400, args)
+
+    def read_events(self, response, count):
+        """The first count events of a stream, skipping heartbeats"""
+        events = []
+        for chunk in response.response:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('id:'):
+                fields = dict(line.split(': ', 1)
+                              for line in chunk.strip().split('\n'))
+                events.append((fields['event'], json.loads(fields['data'])))
+            if len(events) == count:
+                break
+        response.close()
+        return events
+
+    def test_stream_events_replays_missed_events(self):
+        self.client().post('/api/groups/2/items', json={'item_ids': [1, 7]},
+                           headers=self.local_auth_header(
+                               'post:item_requested'))
+        self.client().delete('/api/groups/3/items', json={'item_ids': [7]},
+                             headers=self.local_auth_header(
+                                 'delete:item_requested'))
+        self.client().patch('api/groups/1', json={'email': 'new@bhf.org.uk'},
+                            headers=self.local_auth_header(
+                                'patch:group_email'))
+        self.client().post('/api/groups/1/items', json={'item_ids': [4]},
+                           headers=self.local_auth_header(
+                               'post:item_requested'))
+
+        response = self.client().get('api/events?county=West%20Yorkshire',
+                                     headers={'Last-Event-ID': '11'},
+                                     buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = self.read_events(response, 3)
+        self.assertEqual([(name, event['token'], event['group_id'],
+                           event['item_id']) for name, event in events],
+                         [('insert', 12, 2, 1), ('insert', 13, 2, 7),
+                          ('delete', 14, 3, 7)])
+        self.assertEqual(events[0][1]['category_id'], 1)
+
+        response = self.client().get('api/events?category_id=3'
+                                     '&last_event_id=11', buffered=False)
+        events = self.read_events(response, 1)
+        self.assertEqual([(event['group_id'], event['item_id'])
+                          for name, event in events], [(1, 4)])
+
+    def test_stream_events_as_they_are_committed(self):
+        broadcaster = self.app.extensions['change_events']
+        broadcaster.poll_seconds = 0.05
+        self.app.config['SSE_HEARTBEAT_SECONDS'] = 0.05
+
+        response = self.client().get('api/events?group_id=2', buffered=False)
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+
+        for group_id in (1, 2):
+            self.client().post(f'/api/groups/{group_id}/items',
+                               json={'item_ids': [8]},
+                               headers=self.local_auth_header(
+                                   'post:item_requested'))
+
+        events = self.read_events(response, 1)
+        self.assertEqual([(name, event['group_id'], event['item_id'])
+                          for name, event in events], [('insert', 2, 8)])
+        self.assertEqual(broadcaster._subscribers, set())
+
+    def test_stream_events_invalid_arguments(self):
+        for url, headers in [('api/events?group_id=x', {}),
+                             ('api/events', {'Last-Event-ID': 'x'})]:
+            response = self.client().get(url, headers=headers)
+            self.assertEqual(response.status_code, 400, url)
+
+        self.app.test_cli_runner().invoke(args=['compact-changes',
+                                                '--days', '0'])
+        response = self.client().get('api/events',
+                                     headers={'Last-Event-ID': '3'})
+        self.assertEqual(response.status_code, 410)
+
+    def test_event_subscriber_buffer_is_bounded(self):
+        subscriber = Subscriber({'group_id': 1}, size=2)
+        for token in range(1, 5):
+            subscriber.put({'token': token, 'group_id': 1})
+        subscriber.put({'token': 5, 'group_id': 2})
+
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual(subscriber.events.qsize(), 2)
+
+    def test_get_group_by_id_query_budget(self):
+        with self.assertQueryBudget(2):
+            response = self.client().get('api/groups/2')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['group']['items_requested']), 3)
+
+    def test_get_groups_with_fields(self):
+        with self.assertQueryBudget(1):
+            response = self.client().get('api/groups?fields=id,name,city'
+                                         '&total=none')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['groups'][0],
+                         {'id': 1, 'name': 'British Heart Foundation',
+                          'city': 'London'})
+
+        response = self.client().get('api/groups?cursor=&fields=name'
+                                     '&include=items_requested')
+        data = json.loads(response.data)
+        self.assertEqual(set(data['groups'][0]), {'name', 'items_requested'})
+        self.assertEqual(len(data['groups'][0]['items_requested']), 3)
+
+    def test_get_group_by_id_without_items(self):
+        response = self.client().get('api/groups/3?include=')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('items_requested', data['group'])
+        self.assertEqual(data['group']['postcode'], 'LS1 3DD')
+
+    def test_group_without_requests_is_found(self):
+        with self.app.app_context():
+            self.new_group.add()
+
+        response = self.client().get('api/groups/4')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['group']['items_requested'], [])
+
+        response = self.client().patch(
+            'api/groups/4', json={'email': 'new@email.com'},
+            headers=self.local_auth_header('patch:group_email'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_fields_or_include(self):
+        for args in ['fields=name,password', 'fields=',
+                     'include=items', 'fields=name&include=group']:
+            for path in ['api/groups', 'api/groups/1', 'api/items/2/groups']:
+                response = self.client().get(f'{path}?{args}')
+                self.assertEqual(response.status_code, 400, (path, args))
+
     def test_get_group_by_wrong_id(self):
         response = self.client().get('api/groups/1000')
         data = json.loads(response.data)
@@ -171,6 +737,158 @@ class GroupTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Group not found')
 
+    def test_get_group_by_id_not_modified(self):
+        with self.app.app_context():
+            versions = [db.session.get(Group, id).version for id in (1, 2)]
+
+        response = self.client().get('api/groups/2')
+        etag = response.headers['ETag']
+        self.assertTrue(response.last_modified)
+
+        # cached response, then the view itself
+        for cache in (True, False):
+            if not cache:
+                self.app.extensions['response_cache'].clear()
+            with self.assertQueryBudget(1 if not cache else 0):
+                response = self.client().get(
+                    'api/groups/2', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+
+        self.client().post('/api/groups/2/items', json={'item_ids': [1]},
+                           headers=self.local_auth_header(
+                               'post:item_requested'))
+
+        response = self.client().get('api/groups/2',
+                                     headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        with self.app.app_context():
+            self.assertEqual([db.session.get(Group, id).version
+                              for id in (1, 2)],
+                             [versions[0], versions[1] + 1])
+
+    def test_get_groups_not_modified(self):
+        self.app.extensions.pop('response_cache')
+
+        for path in ['api/groups?page=1', 'api/groups?cursor=']:
+            response = self.client().get(path)
+            etag = response.headers['ETag']
+            last_modified = response.headers['Last-Modified']
+
+            with self.assertQueryBudget(2 if 'page' in path else 1):
+                response = self.client().get(
+                    path, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+            response = self.client().get(
+                path, headers={'If-Modified-Since': last_modified})
+            self.assertEqual(response.status_code, 304)
+
+        with self.app.app_context():
+            self.new_group.add()
+
+        response = self.client().get('api/groups?page=1',
+                                     headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeat_get_served_from_cache(self):
+        self.client().get('api/groups/1')
+        with self.assertQueryBudget(0):
+            response = self.client().get('api/groups/1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+
+    def test_cache_invalidated_on_commit(self):
+        self.client().get('api/groups')
+        self.client().get('api/groups/1')
+        self.client().get('api/groups/2')
+
+        with self.app.app_context():
+            ItemRequested(item_id=8, group_id=1).add()
+
+        response = self.client().get('api/groups/1')
+        data = json.loads(response.data)
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(data['group']['items_requested']), 4)
+
+        self.assertEqual(self.client().get('api/groups')
+                         .headers['X-Cache'], 'MISS')
+        self.assertEqual(self.client().get('api/groups/2')
+                         .headers['X-Cache'], 'HIT')
+
+    def test_cache_evicts_least_recently_used(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+        backend.get('a')
+        backend.set('c', b'3', 60)
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), b'1')
+
+    def test_metrics_and_server_timing(self):
+        app = create_app(type('MetricsConfig', (TestingConfig,),
+                              {'METRICS_ENABLED': True,
+                               'SERVER_TIMING': True}))
+        client = app.test_client()
+
+        response = client.get('api/groups/1')
+        self.assertIn('sql;dur=', response.headers['Server-Timing'])
+        self.assertIn('desc="2 queries"', response.headers['Server-Timing'])
+
+        response = client.get('metrics')
+        metrics = response.data.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('chipin_request_sql_queries_count{route="api_blueprint.'
+                      'get_group_by_id",method="GET"}', metrics)
+        self.assertIn('chipin_request_duration_seconds_bucket{route="api_'
+                      'blueprint.get_group_by_id",method="GET",le="+Inf"}',
+                      metrics)
+
+    def test_serialization_timed_without_queries(self):
+        app = create_app(type('TimingConfig', (TestingConfig,),
+                              {'SERVER_TIMING': True}))
+        client = app.test_client()
+
+        queries = []
+        serialize = routes.timed
+
+        @contextmanager
+        def counted(phase):
+            before = g.timings.sql_queries
+            with serialize(phase):
+                yield
+            queries.append(g.timings.sql_queries - before)
+
+        with mock.patch.object(routes, 'timed', counted):
+            for url in ['api/groups', 'api/groups?cursor=',
+                        'api/groups/nearby?lat=53.8&lng=-1.5',
+                        'api/search?q=leeds', 'api/groups/1',
+                        'api/items/2/groups']:
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+
+        # the requested items are read before the serialization is timed
+        self.assertEqual(len(queries), 7)
+        self.assertEqual(queries, [0] * 7)
+
+    def test_failed_statements_not_timed(self):
+        with self.app.test_request_context():
+            g.timings = RequestTimings()
+            with db.engine.connect() as connection:
+                with self.assertRaises(Exception):
+                    connection.execute(text('SELECT * FROM missing_table'))
+                connection.execute(text('SELECT 1'))
+
+                self.assertEqual(g.timings.sql_queries, 1)
+                self.assertNotIn('query_started', connection.info)
+
+    def test_metrics_endpoint_is_opt_in(self):
+        response = self.client().get('metrics')
+        self.assertEqual(response.status_code, 404)
+
     ################### PATCH endpoint ##############################
 
     def test_update_group(self):
@@ -280,15 +998,1463 @@ class GroupTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Request is not valid')
 
-    def test_no_headers(self):
+    def test_create_item_request_in_one_statement(self):
+        headers = self.local_auth_header('post:item_requested')
+        # one insert, the version bump and the change log entry, with its
+        # transaction id and horizon on Postgres
+        for status in ('created', 'already_requested'):
+            with self.assertQueryBudget(5):
+                response = self.client().post("/api/groups/1/items",
+                                              headers=headers,
+                                              json={"item_id": 4})
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(data['status'], status)
+
+        with self.app.app_context():
+            self.assertEqual(ItemRequested.query.filter_by(
+                group_id=1, item_id=4).count(), 1)
+
         response = self.client().post("/api/groups/1/items",
-                                      headers=None,
-                                      json={"item_id": 4, })
+                                      headers=headers, json={})
+        self.assertEqual(response.status_code, 400)
 
+    def test_delete_item_requested_in_one_statement(self):
+        headers = self.local_auth_header('delete:item_requested')
+        # one delete, the version bump and the change log entry, with its
+        # transaction id and horizon on Postgres
+        with self.assertQueryBudget(5):
+            response = self.client().delete("/api/groups/1/items/2",
+                                            headers=headers)
         data = json.loads(response.data)
-        self.assertEqual(response.status_code, 401)
-        self.assertEqual(data['code'], 'authorization_header_missing')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['deleted_item'], 2)
+
+        response = self.client().delete("/api/groups/1/items/2",
+                                        headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_group_in_one_statement(self):
+        headers = self.local_auth_header('patch:group_email')
+        # one update, the version bump and the change log entry, with its
+        # transaction id and horizon on Postgres
+        with self.assertQueryBudget(5):
+            response = self.client().patch('api/groups/1', headers=headers,
+                                           json={"email": "new@bhf.org.uk"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['id'], 1)
+
+        response = self.client().get('api/groups/1?fields=email')
+        self.assertEqual(json.loads(response.data)['group']['email'],
+                         'new@bhf.org.uk')
+
+        for id, email, status in [(1, '', 422), (1, None, 404),
+                                  (999, 'new@bhf.org.uk', 404)]:
+            response = self.client().patch(f'api/groups/{id}',
+                                           headers=headers,
+                                           json={"email": email})
+            self.assertEqual(response.status_code, status, (id, email))
+
+    def test_create_item_requests_in_bulk(self):
+        headers = self.local_auth_header('post:item_requested')
+        # group and known item lookup, one multi-row insert, the version
+        # bump and the change log entries, with their transaction id and
+        # horizon on Postgres
+        with self.assertQueryBudget(6):
+            response = self.client().post("/api/groups/1/items",
+                                          headers=headers,
+                                          json={"item_ids": [4, 1, 999, 4]})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['results'],
+                         [{'item_id': 4, 'status': 'created'},
+                          {'item_id': 1, 'status': 'already_requested'},
+                          {'item_id': 999, 'status': 'not_found'}])
+
+        response = self.client().get('api/groups/1')
+        data = json.loads(response.data)
+        self.assertEqual(len(data['group']['items_requested']), 4)
+
+    def test_404_bulk_item_requests_for_missing_group(self):
+        headers = self.local_auth_header('post:item_requested')
+        for item_ids in [[999], [1, 999]]:
+            response = self.client().post("/api/groups/1000/items",
+                                          headers=headers,
+                                          json={"item_ids": item_ids})
+            data = json.loads(response.data)
+
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(data['message'], 'Group not found')
+
+    def test_delete_item_requests_in_bulk(self):
+        headers = self.local_auth_header('delete:item_requested')
+        # one delete, the version bump and the change log entries, with
+        # their transaction id and horizon on Postgres
+        with self.assertQueryBudget(5):
+            response = self.client().delete("/api/groups/1/items",
+                                            headers=headers,
+                                            json={"item_ids": [1, 2, 999]})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['deleted', 'deleted', 'not_found'])
+
+    def test_bulk_item_requests_with_invalid_ids(self):
+        headers = self.local_auth_header('post:item_requested')
+        response = self.client().post("/api/groups/1/items",
+                                      headers=headers,
+                                      json={"item_ids": ["1"]})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['message'], 'Request is not valid')
+
+    def test_import_by_natural_key(self):
+        groups = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        groups.write('name,description,address,city,county,postcode,email\n'
+                     'Imported Group,desc,1 Road,York,North Yorkshire,'
+                     'YO1 7HH,imported@email.com\n')
+        groups.close()
+        self.addCleanup(os.remove, groups.name)
+
+        requests = tempfile.NamedTemporaryFile('w', suffix='.ndjson',
+                                               delete=False)
+        for item, category in [('Dried Rice', 'Food'), ('Fiction', 'Books'),
+                               ('Unknown', 'Food')]:
+            requests.write(json.dumps({'group_name': 'Imported Group',
+                                       'group_postcode': 'YO1 7HH',
+                                       'item_name': item,
+                                       'category': category}) + '\n')
+        requests.close()
+        self.addCleanup(os.remove, requests.name)
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['import', 'groups', groups.name])
+        self.assertEqual(result.exit_code, 0, result.output)
+        result = runner.invoke(args=['import', 'item_requests',
+                                     requests.name, '--batch-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 2 of 3 item_requests', result.output)
+
+        # logged in the change feed, after the changes of setUp
+        response = self.client().get('api/changes?since=11')
+        self.assertEqual([(change['entity'], change['operation'],
+                           change['group_id']) for change
+                          in json.loads(response.data)['changes']],
+                         [('group', 'insert', 4),
+                          ('item_requested', 'insert', 4),
+                          ('item_requested', 'insert', 4)])
+
+        response = self.client().get('api/groups/4')
+        data = json.loads(response.data)
+        self.assertEqual(sorted(item['item_name'] for item
+                                in data['group']['items_requested']),
+                         ['Dried Rice', 'Fiction'])
+
+        with self.app.app_context():
+            # placed at the centroid of the YO postcode area
+            self.assertEqual((db.session.get(Group, 4).latitude,
+                              db.session.get(Group, 4).longitude),
+                             geo.locate('YO'))
+
+    def test_import_skips_existing_rows(self):
+        records = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                              delete=False)
+        records.write('name,category\nFiction,Books\nPoetry,Books\n'
+                      'Poetry,Books\n')
+        records.close()
+        self.addCleanup(os.remove, records.name)
+
+        runner = self.app.test_cli_runner()
+        for imported in [1, 0]:
+            result = runner.invoke(args=['import', 'items', records.name])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn(f'Imported {imported} of 3 items', result.output)
+
+        with self.app.app_context():
+            # a second group with the name and postcode of group 2
+            db.session.add(Group(name='Trussel Trust Leeds',
+                                 description='A foodbank', address='Unit 4',
+                                 city='Leeds', county='West Yorkshire',
+                                 postcode='LS4 2PU', email='a@b.org'))
+            db.session.commit()
+
+        requests = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                               delete=False)
+        requests.write('group_name,group_postcode,item_name,category\n'
+                       'Trussel Trust Leeds,LS4 2PU,Poetry,Books\n')
+        requests.close()
+        self.addCleanup(os.remove, requests.name)
+
+        result = runner.invoke(args=['import', 'item_requests',
+                                     requests.name])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            self.assertEqual(
+                [(request.group_id, request.item.name) for request
+                 in ItemRequested.query.filter_by(item_id=9)],
+                [(2, 'Poetry')])
+
+    def test_import_invalid_arguments(self):
+        requests = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                               delete=False)
+        requests.write('group_name,group_postcode,item_name,category,'
+                       'date_requested\n'
+                       'Trussel Trust Leeds,LS4 2PU,Fiction,Books,'
+                       'last week\n')
+        requests.close()
+        self.addCleanup(os.remove, requests.name)
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['import', 'item_requests',
+                                     requests.name])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('invalid date_requested', result.output)
+
+        result = runner.invoke(args=['import', 'item_requests',
+                                     requests.name, '--batch-size', '0'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_copy_import_logged_in_sql(self):
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('the copy method needs Postgres')
+
+        requests = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                               delete=False)
+        requests.write('group_name,group_postcode,item_name,category\n'
+                       'Trussel Trust Leeds,LS4 2PU,Fiction,Books\n'
+                       'Trussel Trust Leeds,LS4 2PU,Poetry,Books\n')
+        requests.close()
+        self.addCleanup(os.remove, requests.name)
+
+        result = self.app.test_cli_runner().invoke(
+            args=['import', 'item_requests', requests.name,
+                  '--method', 'copy'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        response = self.client().get('api/changes?since=11')
+        self.assertEqual([(change['entity'], change['group_id'],
+                           change['item_id']) for change
+                          in json.loads(response.data)['changes']],
+                         [('item_requested', 2, 1)])
+
+    def test_changes_recorded_from_query(self):
+        with self.app.app_context():
+            models.record_changes_from(db.session, select(
+                literal('item_requested'), literal('insert'),
+                ItemRequested.group_id, ItemRequested.item_id)
+                .where(ItemRequested.group_id == 3))
+            db.session.commit()
+
+        response = self.client().get('api/changes?since=11')
+        self.assertEqual(sorted((change['group_id'], change['item_id'])
+                                for change
+                                in json.loads(response.data)['changes']),
+                         [(3, 2), (3, 7)])
+
+    def test_changes_wait_for_older_transactions(self):
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('only Postgres writers run concurrently')
+
+        headers = self.local_auth_header('post:item_requested')
+        with self.app.app_context():
+            # takes token 12 and stays open
+            models.record_changes(db.session, 'group', 'update', 1)
+            db.session.flush()
+            models.write_change_log(db.session)
+
+            # takes token 13 and commits first
+            response = self.client().post('/api/groups/2/items',
+                                          headers=headers,
+                                          json={'item_id': 1})
+            self.assertEqual(response.status_code, 201)
+
+            response = self.client().get('api/changes?since=11')
+            data = json.loads(response.data)
+            self.assertEqual(data['changes'], [])
+            self.assertEqual(data['next_token'], 11)
+
+            db.session.commit()
+
+        response = self.client().get('api/changes?since=11')
+        self.assertEqual([change['token'] for change
+                          in json.loads(response.data)['changes']],
+                         [12, 13])
+
+    def test_updated_at_defaults_to_utc(self):
+        with self.app.app_context():
+            # without the model's default, as in migrations and raw SQL
+            db.session.execute(text(
+                'INSERT INTO "group" (name, description, address, city, '
+                "county, postcode, email) VALUES ('Raw Group', 'A hub', "
+                "'1 Road', 'York', 'North Yorkshire', 'YO1 7HH', "
+                "'raw@email.com')"))
+            updated_at = db.session.execute(
+                select(Group.updated_at)
+                .where(Group.name == 'Raw Group')).scalar()
+            db.session.commit()
+
+        self.assertLess(abs((updated_at - models.utcnow()).total_seconds()),
+                        60)
+
+    def test_import_changes_group_etag(self):
+        # the view itself answers, from the group's version
+        self.app.extensions.pop('response_cache')
+        etag = self.client().get('api/groups/2').headers['ETag']
+
+        requests = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                               delete=False)
+        requests.write('group_name,group_postcode,item_name,category\n'
+                       'Trussel Trust Leeds,LS4 2PU,Fiction,Books\n')
+        requests.close()
+        self.addCleanup(os.remove, requests.name)
+
+        result = self.app.test_cli_runner().invoke(
+            args=['import', 'item_requests', requests.name])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        response = self.client().get('api/groups/2',
+                                     headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Fiction', [item['item_name'] for item in json.loads(
+            response.data)['group']['items_requested']])
+
+    def test_export_groups(self):
+        response = self.client().get('api/groups/export')
+        groups = [json.loads(line) for line in response.data.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([group['id'] for group in groups], [1, 2, 3])
+        self.assertEqual([item['item_name'] for item
+                          in groups[2]['items_requested']],
+                         ['Non-Fiction', 'Craft Materials'])
+        self.assertEqual((groups[2]['latitude'], groups[2]['longitude']),
+                         geo.locate('LS1 3DD'))
+
+    def test_export_groups_gzipped_and_resumed(self):
+        plain = self.client().get('api/groups/export?after=1')
+        response = self.client().get('api/groups/export?after=1',
+                                     headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertEqual([json.loads(line)['id'] for line
+                          in plain.data.splitlines()], [2, 3])
+
+        response = self.client().get('api/groups/export?after=first')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_groups_command(self):
+        export = tempfile.NamedTemporaryFile(suffix='.ndjson.gz',
+                                             delete=False)
+        export.close()
+        self.addCleanup(os.remove, export.name)
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['export-groups', export.name, '--gzip',
+                                     '--batch-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        with gzip.open(export.name) as f:
+            self.assertEqual(f.read(),
+                             self.client().get('api/groups/export').data)
+
+    def test_route_benchmark_not_rate_limited(self):
+        from benchmarks import routes as benchmark
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['generate', '--groups', '60',
+                                     '--requests', '600'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.addCleanup(os.remove, output.name)
+
+        # more requests than the burst of the rate limit; the auth module
+        # is restored after the benchmark signs its own tokens
+        argv = ['benchmarks.routes', '--config', 'testing', '--requests',
+                '60', '--warmup', '2', '--output', output.name]
+        with mock.patch('sys.argv', argv), \
+                mock.patch.multiple(auth, AUTH0_DOMAIN=auth.AUTH0_DOMAIN,
+                                    API_AUDIENCE=auth.API_AUDIENCE,
+                                    ALGORITHMS=auth.ALGORITHMS,
+                                    jwks_store=auth.jwks_store):
+            benchmark.main()
+
+        with open(output.name) as f:
+            routes = json.load(f)['routes']
+        self.assertIn('get_group_by_id', routes)
+        for name, summary in routes.items():
+            # a cursor after the last group finds no page
+            self.assertFalse(set(summary['status_codes'])
+                             - {'200', '201', '404'},
+                             (name, summary['status_codes']))
+
+    def serve(self, app):
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    def test_concurrency_benchmark_stops_on_cached_responses(self):
+        from benchmarks import concurrency as benchmark
+
+        url = self.serve(self.app)
+        argv = ['benchmarks.concurrency', '--sync-url', url, '--async-url',
+                url, '--concurrency', '1', '--duration', '0.2',
+                '--max-group-id', '3']
+        with mock.patch('sys.argv', argv), \
+                self.assertRaises(SystemExit) as raised:
+            benchmark.main()
+        self.assertIn('RESPONSE_CACHE_BACKEND=none', str(raised.exception))
+
+        url = self.serve(create_app(type('ComparableConfig', (TestingConfig,),
+                                         benchmark.SERVER_ENV)))
+        summary = benchmark.run_level(url, ['/api/groups/1'], 2, 0.2)
+        self.assertGreater(summary['requests'], 0)
+        self.assertEqual((summary['cached'], summary['shed']), (0, 0))
+
+    def test_generate_is_reproducible(self):
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['generate', '--groups', '50',
+                                     '--requests', '300', '--seed', '7'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        with self.app.app_context():
+            self.assertEqual(Group.query.count(), 53)
+            # fixture items are reused rather than duplicated
+            self.assertEqual(Item.query.filter_by(name='Dried Rice').count(),
+                             1)
+            first_run = [(group.name, group.postcode) for group
+                         in Group.query.order_by(Group.id).offset(3)]
+            # leaving out the requests of the three fixture groups
+            requested = ItemRequested.query.filter(
+                ItemRequested.group_id > 3).count()
+
+            db.drop_all()
+            db.create_all()
+
+        runner.invoke(args=['generate', '--groups', '50',
+                            '--requests', '300', '--seed', '7'])
+        with self.app.app_context():
+            self.assertEqual([(group.name, group.postcode) for group
+                              in Group.query.order_by(Group.id)], first_run)
+            self.assertEqual(ItemRequested.query.count(), requested)
+            self.assertGreater(requested, 200)
+
+    def test_no_headers(self):
+        response = self.client().post("/api/groups/1/items",
+                                      headers=None,
+                                      json={"item_id": 4, })
+
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['code'], 'authorization_header_missing')
+
+
+class JWKSStandIn(HTTPServer):
+    """Local stand-in for the Auth0 JWKS endpoint"""
+
+    def __init__(self):
+        self.keys = [{'kid': 'key-1', 'kty': 'RSA', 'use': 'sig',
+                      'n': 'n1', 'e': 'AQAB'}]
+        self.max_age = 600
+        self.failing = False
+        self.fetches = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                if server.failing:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({'keys': server.keys}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control',
+                                 f'public, max-age={server.max_age}')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server_port}/jwks.json'
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """Testing the in-process JWKS cache"""
+
+    def setUp(self):
+        self.now = 0
+        self.jwks = JWKSStandIn()
+        self.store = JWKSKeyStore(self.jwks.url, min_refresh_interval=30,
+                                  refresh_ahead=0, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.jwks.shutdown()
+        self.jwks.server_close()
+
+    def test_keys_are_cached_until_max_age(self):
+        self.assertEqual(self.store.get_key('key-1')['n'], 'n1')
+        self.now = 599
+        self.store.get_key('key-1')
+        self.assertEqual(self.jwks.fetches, 1)
+
+        self.now = 600
+        self.store.get_key('key-1')
+        self.assertEqual(self.jwks.fetches, 2)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        self.store.get_key('key-1')
+        self.jwks.keys.append({'kid': 'key-2', 'kty': 'RSA', 'use': 'sig',
+                               'n': 'n2', 'e': 'AQAB'})
+
+        self.now = 10
+        self.assertIsNone(self.store.get_key('key-2'))
+        self.assertIsNone(self.store.get_key('unknown'))
+        self.assertEqual(self.jwks.fetches, 1)
+
+        self.now = 31
+        self.assertEqual(self.store.get_key('key-2')['n'], 'n2')
+        self.assertEqual(self.jwks.fetches, 2)
+
+    def test_stale_keys_served_when_refresh_fails(self):
+        self.store.get_key('key-1')
+        self.jwks.failing = True
+
+        self.now = 1000
+        self.assertEqual(self.store.get_key('key-1')['n'], 'n1')
+        self.assertEqual(self.jwks.fetches, 2)
+
+    def test_unavailable_without_keys(self):
+        self.jwks.failing = True
+        with self.assertRaises(JWKSUnavailable):
+            self.store.get_key('key-1')
+
+
+def b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class LocalAuth:
+    """
+    Signs tokens with a local RSA key published through a JWKSStandIn, and
+    points the auth module at it.
+    """
+
+    def __init__(self, kid='local-key'):
+        private_key = rsa.generate_private_key(public_exponent=65537,
+                                               key_size=2048)
+        numbers = private_key.public_key().public_numbers()
+        self.kid = kid
+        self.pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+        self.jwks = JWKSStandIn()
+        self.jwks.keys = [{'kid': kid, 'kty': 'RSA', 'use': 'sig',
+                           'n': b64_uint(numbers.n),
+                           'e': b64_uint(numbers.e)}]
+
+        self.patches = [
+            mock.patch.object(auth, 'AUTH0_DOMAIN', 'chipin.test'),
+            mock.patch.object(auth, 'API_AUDIENCE', 'chipin'),
+            mock.patch.object(auth, 'ALGORITHMS', ['RS256']),
+            mock.patch.object(auth, 'jwks_store',
+                              JWKSKeyStore(self.jwks.url)),
+            mock.patch.object(auth, 'token_cache', VerifiedTokenCache()),
+        ]
+
+    def start(self):
+        for patch in self.patches:
+            patch.start()
+        auth.jwks_store.add_listener(auth.token_cache.retain_kids)
+
+    def stop(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.jwks.shutdown()
+        self.jwks.server_close()
+
+    def token(self, permissions, sub='auth0|local', expires_in=3600):
+        claims = {'iss': 'https://chipin.test/', 'aud': 'chipin',
+                  'sub': sub, 'exp': int(time.time()) + expires_in,
+                  'permissions': permissions}
+        return jwt.encode(claims, self.pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+    def header(self, *permissions, **kwargs):
+        return {'Authorization':
+                f'Bearer {self.token(list(permissions), **kwargs)}'}
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    """Testing the rate and concurrency limits of the API"""
+
+    def setUp(self):
+        self.app = create_app(type('AdmissionConfig', (TestingConfig,), {
+            'RESPONSE_CACHE_BACKEND': 'none',
+            'RATE_LIMIT_PER_SECOND': 0.5,
+            'RATE_LIMIT_BURST': 3,
+            'ADMISSION_CONCURRENCY': {'read': 1, 'export': 1, 'events': 1},
+        }))
+        self.client = self.app.test_client()
+        self.limiter = self.app.extensions['admission']
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Group(name='Leeds Community Centre',
+                                 description='A hub',
+                                 address='48 Bilton Lane', city='Leeds',
+                                 county='West Yorkshire', postcode='LS1 3DD',
+                                 email='info@community.org.uk'))
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_client_over_rate_limit_gets_429(self):
+        statuses = [self.client.get('/api/groups').status_code
+                    for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+        response = self.client.get('/api/groups/1')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '2')
+        self.assertEqual(data['success'], False)
+
+        # other clients and the health check are still served
+        response = self.client.get('/api/groups', environ_base={
+            'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/health').status_code, 200)
+
+    def test_busy_route_class_gets_503(self):
+        handle = self.limiter.acquire('read', 1)
+
+        response = self.client.get('/api/groups')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+        self.limiter.release('read', handle)
+        self.assertEqual(self.client.get('/api/groups').status_code, 200)
+
+    def test_export_holds_its_slot_while_streaming(self):
+        export = self.client.get('/api/groups/export')
+        self.assertEqual(self.client.get('/api/groups/export').status_code,
+                         503)
+
+        self.assertEqual(len(export.data.splitlines()), 1)
+        self.assertEqual(self.client.get('/api/groups/export').status_code,
+                         200)
+
+    def test_event_stream_holds_its_slot_until_closed(self):
+        self.app.config['SSE_HEARTBEAT_SECONDS'] = 0.05
+        self.addCleanup(self.app.extensions['change_events'].stop)
+
+        stream = self.client.get('/api/events', buffered=False)
+        self.assertEqual(stream.status_code, 200)
+        self.assertEqual(next(iter(stream.response)), b'retry: 3000\n\n')
+
+        response = self.client.get('/api/events')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+        stream.close()
+        stream = self.client.get('/api/events', buffered=False)
+        self.assertEqual(stream.status_code, 200)
+        stream.close()
+
+    def test_cached_responses_skip_admission(self):
+        self.app.extensions['response_cache'] = ResponseCache(
+            MemoryBackend())
+        self.client.get('/api/groups/1')
+        self.limiter.acquire('read', 1)
+
+        # over both the concurrency and the rate limit
+        for _ in range(5):
+            response = self.client.get('/api/groups/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+
+    def test_clients_keyed_by_verified_sub(self):
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        headers = local_auth.header('post:item_requested', sub='auth0|one')
+
+        with self.app.test_request_context(headers=headers):
+            self.assertEqual(admission.client_key(), 'ip:None')
+
+        auth.verify_decode_jwt(headers['Authorization'].split()[1])
+        with self.app.test_request_context(headers=headers):
+            self.assertEqual(admission.client_key(), 'sub:auth0|one')
+
+
+    def test_clients_keyed_by_forwarded_address(self):
+        app = create_app(type('ProxyConfig', (TestingConfig,), {
+            'RESPONSE_CACHE_BACKEND': 'none',
+            'RATE_LIMIT_PER_SECOND': 0.5,
+            'RATE_LIMIT_BURST': 1,
+            'PROXY_FIX_X_FOR': 1,
+        }))
+        client = app.test_client()
+
+        for address, status in [('203.0.113.1', 200), ('203.0.113.1', 429),
+                                 ('203.0.113.2', 200)]:
+            response = client.get('/api/groups', headers={
+                'X-Forwarded-For': address})
+            self.assertEqual(response.status_code, status)
+
+    def test_streamed_slot_refreshed(self):
+        refresh, release = mock.Mock(), mock.Mock()
+
+        with mock.patch.object(admission, 'SLOT_REFRESH', 0):
+            chunks = list(admission.released_after(iter('abc'), release,
+                                                   refresh))
+        self.assertEqual(chunks, ['a', 'b', 'c'])
+        self.assertEqual(refresh.call_count, 3)
+        release.assert_called_once_with()
+
+class PostcodeCentroidsTestCase(unittest.TestCase):
+    """Testing the postcode centroid lookup"""
+
+    def setUp(self):
+        self.centroids = geo.PostcodeCentroids()
+        self.centroids.load(geo.AREA_CENTROIDS_FILE)
+
+    def test_postcode_keys(self):
+        self.assertEqual(geo.postcode_keys('ls4 2pu'), ['LS42PU', 'LS4', 'LS'])
+        self.assertEqual(geo.postcode_keys('SW10'), ['SW10', 'SW'])
+        self.assertEqual(geo.postcode_keys(''), [])
+
+    def test_most_precise_centroid_used(self):
+        finer = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        finer.write('pcds,lat,long\nLS4 2PU,53.8135,-1.5833\n'
+                    'LS4,53.81,-1.58\nLS99 9ZZ,,\n')
+        finer.close()
+        self.addCleanup(os.remove, finer.name)
+
+        self.assertEqual(self.centroids.load(finer.name), 2)
+        self.assertEqual(self.centroids.locate('LS4 2PU'), (53.8135, -1.5833))
+        self.assertEqual(self.centroids.locate('LS4 1AA'), (53.81, -1.58))
+        self.assertEqual(self.centroids.locate('LS1 3DD'), (53.8, -1.549))
+        self.assertIsNone(self.centroids.locate('ZZ1 1ZZ'))
+
+    def test_haversine(self):
+        # Leeds to London
+        self.assertAlmostEqual(geo.haversine_km(53.7997, -1.5492,
+                                                51.5074, -0.1278), 272, -1)
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """Testing the verified-token cache used by requires_auth"""
+
+    def setUp(self):
+        self.now = 1000
+        self.cache = VerifiedTokenCache(maxsize=2, clock=lambda: self.now)
+
+    def test_payload_cached_until_exp(self):
+        self.cache.put('token', {'sub': 'a', 'exp': 1100}, 'key-1')
+        self.assertEqual(self.cache.get('token')['sub'], 'a')
+
+        self.now = 1100
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_least_recently_used_entry_evicted(self):
+        self.cache.put('a', {'exp': 2000}, 'key-1')
+        self.cache.put('b', {'exp': 2000}, 'key-1')
+        self.cache.get('a')
+        self.cache.put('c', {'exp': 2000}, 'key-1')
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_entries_evicted_when_key_rotated_out(self):
+        self.cache.put('a', {'exp': 2000}, 'key-1')
+        self.cache.put('b', {'exp': 2000}, 'key-2')
+        self.cache.retain_kids({'key-2'})
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+
+    def test_repeat_token_skips_verification(self):
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        token = local_auth.token(['post:group'])
+
+        with mock.patch.object(auth.jwt, 'decode',
+                               wraps=auth.jwt.decode) as decode:
+            auth.verify_decode_jwt(token)
+            payload = auth.verify_decode_jwt(token)
+
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(payload['permissions'], ['post:group'])
+        self.assertEqual(auth.token_cache.hits, 1)
+
+
+class DatabaseConfigTestCase(unittest.TestCase):
+    """Testing the production pool and timeout settings"""
+
+    def setUp(self):
+        self.config = {
+            'SQLALCHEMY_DATABASE_URI': 'postgresql://chipin@localhost/chipin',
+            'SQLALCHEMY_ENGINE_OPTIONS':
+                ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+            'DB_STATEMENT_TIMEOUT_MS': 15000,
+            'DB_IDLE_IN_TRANSACTION_TIMEOUT_MS': 60000,
+        }
+
+    def test_timeouts_sent_as_connection_options(self):
+        options = engine_options(self.config)
+
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args']['options'],
+                         '-c statement_timeout=15000 '
+                         '-c idle_in_transaction_session_timeout=60000')
+
+    def test_no_connection_options_through_pgbouncer(self):
+        options = engine_options(dict(self.config, DB_PGBOUNCER=True))
+        self.assertNotIn('connect_args', options)
+
+    def test_production_engine_uses_timed_pool(self):
+        app = create_app(type('PoolConfig', (ProductionConfig,), {
+            'SQLALCHEMY_DATABASE_URI': self.config['SQLALCHEMY_DATABASE_URI'],
+            'DB_PGBOUNCER': True}))
+
+        with app.app_context():
+            self.assertIsInstance(db.engine.pool, TimedQueuePool)
+            self.assertEqual(db.engine.pool.size(), 5)
+
+
+def installed(*modules):
+    return all(importlib.util.find_spec(module) for module in modules)
+
+
+@unittest.skipUnless(installed('quart'), 'the ASGI app needs quart')
+class AsyncEngineOptionsTestCase(unittest.TestCase):
+    """Testing the async engine settings of the ASGI app"""
+
+    def setUp(self):
+        self.config = {
+            'SQLALCHEMY_DATABASE_URI': 'postgresql://chipin@localhost/chipin',
+            'SQLALCHEMY_ENGINE_OPTIONS':
+                ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+            'DB_STATEMENT_TIMEOUT_MS': 15000,
+            'DB_IDLE_IN_TRANSACTION_TIMEOUT_MS': 60000,
+        }
+
+    def test_async_drivers(self):
+        from backend.aio.database import async_url
+
+        self.assertEqual(async_url('postgresql+psycopg2://chipin@db/chipin')
+                         .drivername, 'postgresql+asyncpg')
+        self.assertEqual(async_url('sqlite:////tmp/chipin.db').drivername,
+                         'sqlite+aiosqlite')
+
+    def test_timeouts_sent_as_server_settings(self):
+        from backend.aio.database import engine_options
+
+        url, options = engine_options(self.config)
+
+        self.assertEqual(options['pool_size'], 5)
+        self.assertNotIn('poolclass', options)
+        self.assertEqual(options['connect_args']['server_settings'],
+                         {'statement_timeout': '15000',
+                          'idle_in_transaction_session_timeout': '60000'})
+
+    def test_statement_caches_off_through_pgbouncer(self):
+        from backend.aio.database import engine_options
+
+        url, options = engine_options(dict(self.config, DB_PGBOUNCER=True))
+
+        self.assertEqual(url.query['prepared_statement_cache_size'], '0')
+        self.assertEqual(options['connect_args']['statement_cache_size'], 0)
+        self.assertNotIn('server_settings', options['connect_args'])
+        self.assertNotEqual(
+            options['connect_args']['prepared_statement_name_func'](),
+            options['connect_args']['prepared_statement_name_func']())
+
+
+@unittest.skipUnless(installed('quart', 'aiosqlite'),
+                     'the ASGI app needs quart and aiosqlite')
+class AsyncAppTestCase(unittest.IsolatedAsyncioTestCase):
+    """Testing the ASGI app against the responses of the sync app"""
+
+    def setUp(self):
+        from backend.aio import create_app as create_async_app
+
+        self.sync_app = create_app(TestingConfig)
+        with self.sync_app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Category(name='Food'),
+                Item(name='Dried Rice', category_id=1),
+                Item(name='UHT Milk', category_id=1),
+                Group(name='Leeds Community Centre', description='A hub',
+                      address='48 Bilton Lane', city='Leeds',
+                      county='West Yorkshire', postcode='LS1 3DD',
+                      email='info@community.org.uk'),
+                Group(name='Trussel Trust Leeds', description='A foodbank',
+                      address='Unit 3, Burley Hill', city='Leeds',
+                      county='West Yorkshire', postcode='LS4 2PU',
+                      email='info@foodbank.or.uk'),
+                ItemRequested(group_id=1, item_id=2),
+                ItemRequested(group_id=1, item_id=1)])
+            db.session.commit()
+
+        self.app = create_async_app(TestingConfig)
+        self.client = self.app.test_client()
+
+        self.local_auth = LocalAuth()
+        self.local_auth.start()
+
+    async def asyncTearDown(self):
+        await self.app.extensions['async_engine'].dispose()
+
+    def tearDown(self):
+        self.local_auth.stop()
+        with self.sync_app.app_context():
+            db.drop_all()
+
+    async def assertSameResponse(self, path):
+        response = await self.client.get(path)
+        expected = self.sync_app.test_client().get(path)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(await response.get_json(), expected.get_json())
+        self.assertEqual(response.headers.get('ETag'),
+                         expected.headers.get('ETag'))
+
+    async def test_reads_match_sync_app(self):
+        for path in ['/api/groups', '/api/groups?cursor=',
+                     '/api/groups?page=2', '/api/groups/1',
+                     '/api/groups/99', '/api/items/1/groups',
+                     '/api/categories/1/groups?city=Leeds']:
+            with self.subTest(path=path):
+                await self.assertSameResponse(path)
+
+    async def test_revalidation_answered_with_304(self):
+        for path in ['/api/groups', '/api/groups?cursor=', '/api/groups/1']:
+            response = await self.client.get(path)
+            response = await self.client.get(path, headers={
+                'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304, path)
+
+    async def test_rate_limited_like_sync_app(self):
+        from backend.aio import create_app as create_async_app
+
+        app = create_async_app(type('AdmissionConfig', (TestingConfig,), {
+            'RATE_LIMIT_PER_SECOND': 0.5,
+            'RATE_LIMIT_BURST': 2,
+        }))
+        self.addAsyncCleanup(app.extensions['async_engine'].dispose)
+        client = app.test_client()
+
+        statuses = [(await client.get('/api/groups/1')).status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = await client.get('/api/groups/1')
+        self.assertEqual(response.headers['Retry-After'], '2')
+
+    async def test_create_group(self):
+        body = {'name': 'Test Group', 'description': 'Test description',
+                'address': 'Test address', 'city': 'Test city',
+                'county': 'Test county', 'postcode': 'SW1 2BB',
+                'email': 'test@email.com'}
+
+        response = await self.client.post(
+            '/api/groups', json=body,
+            headers=self.local_auth.header('post:item_requested'))
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.client.post(
+            '/api/groups', json=body,
+            headers=self.local_auth.header('post:group'))
+        self.assertEqual(response.status_code, 201)
+
+        response = await self.client.get('/api/groups?page=1')
+        self.assertEqual((await response.get_json())['total_groups'], 3)
+
+    async def test_bulk_add_and_delete_items(self):
+        response = await self.client.post(
+            '/api/groups/2/items', json={'item_ids': [1, 1, 9]},
+            headers=self.local_auth.header('post:item_requested'))
+        data = await response.get_json()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['results'],
+                         [{'item_id': 1, 'status': 'created'},
+                          {'item_id': 9, 'status': 'not_found'}])
+
+        response = await self.client.post(
+            '/api/groups/99/items', json={'item_ids': [9]},
+            headers=self.local_auth.header('post:item_requested'))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.client.delete(
+            '/api/groups/1/items/2',
+            headers=self.local_auth.header('delete:item_requested'))
+        self.assertEqual(response.status_code, 200)
+
+        await self.assertSameResponse('/api/groups/1')
+
+
+    async def test_add_item_twice(self):
+        for status in ['created', 'already_requested']:
+            response = await self.client.post(
+                '/api/groups/2/items', json={'item_id': 1},
+                headers=self.local_auth.header('post:item_requested'))
+            data = await response.get_json()
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(data['status'], status)
+
+        await self.assertSameResponse('/api/groups/2')
+        # logged once, after the fixtures
+        changes = self.sync_app.test_client().get(
+            '/api/changes?since=0').get_json()['changes']
+        self.assertEqual([(change['group_id'], change['item_id'])
+                          for change in changes[-2:]], [(1, 1), (2, 1)])
+
+class ReplicaTestCase(unittest.TestCase):
+    """
+    Testing read routing with a second sqlite database standing in for the
+    replica. Both hold group 1 under different names.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.app = self.create_app(
+            f'sqlite:///{self.directory.name}/replica.db')
+
+        with self.app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica'])
+            with db.engines['replica'].begin() as connection:
+                connection.execute(Group.__table__.insert(), self.group(
+                    'Replica Group'))
+            db.session.add(Group(**self.group('Primary Group')))
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    @staticmethod
+    def create_app(replica_url, cache_backend='none'):
+        return create_app(type('ReplicaConfig', (TestingConfig,), {
+            'SQLALCHEMY_BINDS': {'replica': replica_url},
+            'RESPONSE_CACHE_BACKEND': cache_backend,
+        }))
+
+    @staticmethod
+    def group(name):
+        return {'id': 1, 'name': name, 'description': 'Test description',
+                'address': 'Test address', 'city': 'Leeds',
+                'county': 'West Yorkshire', 'postcode': 'LS1 1AA',
+                'email': 'test@email.com'}
+
+    def get_group_name(self, client):
+        response = client.get('/api/groups/1')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['group']['name']
+
+    def test_reads_go_to_replica(self):
+        client = self.app.test_client()
+        self.assertEqual(self.get_group_name(client), 'Replica Group')
+
+    def test_reads_pinned_to_primary_after_write(self):
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        client = self.app.test_client()
+
+        body = self.group('New Group')
+        del body['id']
+        response = client.post('/api/groups',
+                               headers=local_auth.header('post:group'),
+                               json=body)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('chipin_primary_until', response.headers['Set-Cookie'])
+        self.assertEqual(self.get_group_name(client), 'Primary Group')
+        self.assertEqual(self.get_group_name(self.app.test_client()),
+                         'Replica Group')
+
+    def test_reads_pinned_to_primary_by_token_without_cookie(self):
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        headers = local_auth.header('post:group')
+
+        body = self.group('New Group')
+        del body['id']
+        response = self.app.test_client().post('/api/groups',
+                                               headers=headers, json=body)
+        self.assertEqual(response.status_code, 201)
+
+        # a client that does not keep cookies, sending the same token
+        client = self.app.test_client(use_cookies=False)
+        response = client.get('/api/groups/1', headers=headers)
+        self.assertEqual(json.loads(response.data)['group']['name'],
+                         'Primary Group')
+        self.assertEqual(self.get_group_name(client), 'Replica Group')
+
+    def test_cache_not_filled_from_lagging_replica(self):
+        app = self.create_app(f'sqlite:///{self.directory.name}/replica.db',
+                              'memory')
+        local_auth = LocalAuth()
+        local_auth.start()
+        self.addCleanup(local_auth.stop)
+        writer, reader = app.test_client(), app.test_client()
+
+        # cached long after the last write
+        self.assertEqual(self.get_group_name(reader), 'Replica Group')
+        self.assertEqual(reader.get('/api/groups/1').headers['X-Cache'],
+                         'HIT')
+
+        response = writer.patch('/api/groups/1',
+                                headers=local_auth.header(
+                                    'patch:group_email'),
+                                json={'email': 'new@email.com'})
+        self.assertEqual(response.status_code, 200)
+
+        # the replica has not seen the write, so its body is not stored
+        for _ in range(2):
+            response = reader.get('/api/groups/1')
+            self.assertEqual(response.headers['X-Cache'], 'MISS')
+            self.assertEqual(json.loads(response.data)['group']['email'],
+                             'test@email.com')
+
+        # the writer reads its own write from the primary, not the cache
+        response = writer.get('/api/groups/1')
+        self.assertNotIn('X-Cache', response.headers)
+        self.assertEqual(json.loads(response.data)['group']['email'],
+                         'new@email.com')
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        app = self.create_app(
+            f'sqlite:///{self.directory.name}/missing/replica.db')
+
+        self.assertEqual(self.get_group_name(app.test_client()),
+                         'Primary Group')
+        self.assertFalse(app.extensions['replica_monitor'].usable())
+
+    def test_replica_failure_during_request_retried_on_primary(self):
+        client = self.app.test_client()
+        self.assertEqual(self.get_group_name(client), 'Replica Group')
+
+        with self.app.app_context():
+            db.metadata.drop_all(db.engines['replica'])
+
+        self.assertEqual(self.get_group_name(client), 'Primary Group')
+        self.assertFalse(self.app.extensions['replica_monitor'].usable())
+
+    def test_replica_too_far_behind_not_used(self):
+        monitor = self.app.extensions['replica_monitor']
+        monitor.engine = mock.MagicMock()
+        monitor.engine.dialect.name = 'postgresql'
+        connection = monitor.engine.connect.return_value.__enter__.return_value
+        connection.execute.return_value.scalar.return_value = 30
+
+        self.assertEqual(self.get_group_name(self.app.test_client()),
+                         'Primary Group')
+
+    def test_replica_engine_uses_pool_and_timeouts(self):
+        app = create_app(type('ReplicaPoolConfig', (ProductionConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'postgresql://chipin@localhost/chipin',
+            'SQLALCHEMY_BINDS': {
+                'replica': 'postgresql://chipin@replica/chipin'}}))
+
+        with app.app_context():
+            replica = db.engines['replica']
+            self.assertIsInstance(replica.pool, TimedQueuePool)
+            self.assertEqual(replica.pool.size(), 5)
+        self.assertEqual(
+            app.config['SQLALCHEMY_BINDS']['replica']['connect_args'],
+            {'options': '-c statement_timeout=15000 '
+                        '-c idle_in_transaction_session_timeout=60000'})
+
+
+class SearchTriggerTestCase(unittest.TestCase):
+    """
+    Checks the Postgres triggers keep the search columns up to date. Needs
+    TEST_DATABASE_URL to point at Postgres.
+    """
+
+    def setUp(self):
+        self.app = create_app(type('SearchConfig', (TestingConfig,),
+                                   {'RESPONSE_CACHE_BACKEND': 'none'}))
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                raise unittest.SkipTest('search triggers need Postgres')
+
+            db.create_all()
+            db.session.add_all([
+                Category(name='Food'),
+                Item(name='Dried Rice', category_id=1),
+                Group(name='Leeds Community Centre', description='A hub',
+                      address='48 Bilton Lane', city='Leeds',
+                      county='West Yorkshire', postcode='LS1 3DD',
+                      email='info@community.org.uk')])
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def search(self, q):
+        response = self.client.get(f'/api/search?q={q}')
+        self.assertEqual(response.status_code, 200)
+        return [group['name'] for group in json.loads(response.data)['groups']]
+
+    def test_requested_items_indexed(self):
+        self.assertEqual(self.search('rice'), [])
+
+        with self.app.app_context():
+            ItemRequested.add_many(1, [1])
+        self.assertEqual(self.search('rice'), ['Leeds Community Centre'])
+
+        with self.app.app_context():
+            db.session.get(Item, 1).name = 'Basmati'
+            db.session.commit()
+        self.assertEqual(self.search('rice'), [])
+        self.assertEqual(self.search('basmati'), ['Leeds Community Centre'])
+
+        with self.app.app_context():
+            ItemRequested.delete_many(1, [1])
+        self.assertEqual(self.search('basmati'), [])
+
+    def test_misspelt_words_found_by_trigram(self):
+        self.assertEqual(self.search('comunity'), ['Leeds Community Centre'])
+
+
+class DemandStatsTestCase(unittest.TestCase):
+    """
+    Checks the demand statistics view is refreshed within its staleness
+    bound. Needs TEST_DATABASE_URL to point at Postgres.
+    """
+
+    def setUp(self):
+        self.app = create_app(type('StatsConfig', (TestingConfig,),
+                                   {'STATS_MAX_STALENESS_SECONDS': 60}))
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                raise unittest.SkipTest('demand statistics view needs '
+                                        'Postgres')
+
+            db.create_all()
+            db.session.add_all([
+                Category(name='Food'),
+                Item(name='Dried Rice', category_id=1),
+                Group(name='Leeds Community Centre', description='A hub',
+                      address='48 Bilton Lane', city='Leeds',
+                      county='West Yorkshire', postcode='LS1 3DD',
+                      email='info@community.org.uk')])
+            db.session.commit()
+            stats.refresh()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def total(self):
+        response = self.client.get('/api/stats')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        return sum(row['requests'] for row in data['totals']), data
+
+    def test_served_from_view_until_stale(self):
+        with self.app.app_context():
+            ItemRequested.add_many(1, [1])
+
+        total, data = self.total()
+        self.assertEqual(total, 0)
+        self.assertFalse(data['stale'])
+
+        with self.app.app_context():
+            db.session.execute(db.text(
+                "UPDATE stats_refresh SET refreshed_at = "
+                "now() - interval '2 minutes'"))
+            db.session.commit()
+
+        total, data = self.total()
+        self.assertEqual(total, 1)
+
+    def test_stale_view_served_while_another_refresh_runs(self):
+        with self.app.app_context():
+            db.session.execute(db.text(
+                "UPDATE stats_refresh SET refreshed_at = "
+                "now() - interval '2 minutes'"))
+            db.session.commit()
+            engine = db.engine
+
+        with engine.connect() as connection:
+            connection.execute(db.text('SELECT pg_advisory_lock(:key)'),
+                               {'key': stats.REFRESH_LOCK})
+            total, data = self.total()
+            connection.execute(db.text('SELECT pg_advisory_unlock(:key)'),
+                               {'key': stats.REFRESH_LOCK})
+
+        self.assertTrue(data['stale'])
+
+
+class ChangeNotificationTestCase(unittest.TestCase):
+    """
+    Checks change events are pushed on commit through LISTEN/NOTIFY rather
+    than by polling. Needs TEST_DATABASE_URL to point at Postgres.
+    """
+
+    def setUp(self):
+        self.app = create_app(type('EventsConfig', (TestingConfig,),
+                                   {'CHANGE_POLL_SECONDS': 60}))
+
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                raise unittest.SkipTest('notifications need Postgres')
+
+            db.create_all()
+            db.session.add_all([
+                Category(name='Food'),
+                Item(name='Dried Rice', category_id=1),
+                Group(name='Leeds Community Centre', description='A hub',
+                      address='48 Bilton Lane', city='Leeds',
+                      county='West Yorkshire', postcode='LS1 3DD',
+                      email='info@community.org.uk')])
+            db.session.commit()
+
+    def tearDown(self):
+        self.app.extensions['change_events'].stop()
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_event_pushed_on_commit(self):
+        broadcaster = self.app.extensions['change_events']
+        with self.app.app_context():
+            subscriber = broadcaster.subscribe({'county': 'West Yorkshire'})
+            # let the broadcaster start listening
+            time.sleep(0.5)
+            ItemRequested.add_many(1, [1])
+
+        event = subscriber.events.get(timeout=5)
+        self.assertEqual((event['group_id'], event['item_id']), (1, 1))
+
+
+class IndexUsageTestCase(unittest.TestCase):
+    """
+    Checks the endpoint queries are planned as index scans once the tables
+    are large. Needs TEST_DATABASE_URL to point at Postgres.
+    """
+
+    GROUPS = 100000
+    ITEMS = 200
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(TestingConfig)
+
+        with cls.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                raise unittest.SkipTest('EXPLAIN checks need Postgres')
+
+            db.create_all()
+            for statement in [
+                "INSERT INTO category (name) "
+                "SELECT 'Category ' || n FROM generate_series(1, 20) n",
+                f"INSERT INTO item (name, category_id) "
+                f"SELECT 'Item ' || n, 1 + n % 20 "
+                f"FROM generate_series(1, {cls.ITEMS}) n",
+                f"INSERT INTO \"group\" (name, description, address, city, "
+                f"county, postcode, email) "
+                f"SELECT 'Group ' || n, 'Description', 'Address', "
+                f"'City ' || n % 500, 'County ' || n % 50, 'LS1 1AA', "
+                f"'group' || n || '@example.org' "
+                f"FROM generate_series(1, {cls.GROUPS}) n",
+                f"INSERT INTO item_requested (group_id, item_id) "
+                f"SELECT g, 1 + (g + k * 37) % {cls.ITEMS} "
+                f"FROM generate_series(1, {cls.GROUPS}) g, "
+                f"generate_series(1, 3) k",
+                "ANALYZE",
+            ]:
+                db.session.execute(db.text(statement))
+                db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.local_auth = LocalAuth()
+        self.local_auth.start()
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        self.local_auth.stop()
+
+    def assertIndexScans(self, method, url, **kwargs):
+        """
+        Calls the endpoint, then EXPLAINs each SELECT/DELETE it ran and
+        checks none of them reads group or item_requested sequentially.
+        """
+        with self.app.app_context():
+            engine = db.engine
+
+        with count_queries(engine) as counter:
+            response = getattr(self.client(), method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+
+        with engine.connect() as connection:
+            for statement, parameters in counter.statements:
+                if not statement.lstrip().upper().startswith(
+                        ('SELECT', 'DELETE')):
+                    continue
+                plan = '\n'.join(row[0] for row in connection.exec_driver_sql(
+                    'EXPLAIN ' + statement, parameters))
+                self.assertNotIn('Seq Scan on "group"', plan, statement)
+                self.assertNotIn('Seq Scan on item_requested', plan,
+                                 statement)
+
+    def test_get_groups_uses_index(self):
+        cursor = encode_cursor(['County 25', 'City 275', 50275])
+        self.assertIndexScans('get', f'api/groups?cursor={cursor}')
+
+    def test_get_group_by_id_uses_index(self):
+        self.assertIndexScans('get', 'api/groups/4242')
+
+    def test_get_groups_requesting_item_uses_index(self):
+        self.assertIndexScans('get', 'api/items/42/groups')
 
+    def test_delete_requested_item_uses_index(self):
+        self.assertIndexScans(
+            'delete', f'api/groups/4242/items/{1 + (4242 + 37) % self.ITEMS}',
+            headers=self.local_auth.header('delete:item_requested'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,45 @@
+"""
+Compares two benchmark result files written by benchmarks.routes:
+
+    python -m benchmarks.compare OLD.json NEW.json
+"""
+import argparse
+import json
+
+METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request',
+           'throughput_rps']
+
+
+def change(old, new):
+    if not old:
+        return ''
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f'{old.get("git_revision")} -> {new.get("git_revision")}')
+    for route, new_summary in new['routes'].items():
+        old_summary = old['routes'].get(route)
+        if old_summary is None:
+            print(f'{route}: new route')
+            continue
+
+        print(route)
+        for metric in METRICS:
+            print(f'  {metric:>20} {old_summary[metric]:>10} '
+                  f'{new_summary[metric]:>10} '
+                  f'{change(old_summary[metric], new_summary[metric]):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Compares how many concurrent clients one worker of the sync app and one
+worker of the ASGI app can serve. With --start the script runs them
+itself, each with a single worker and with the response cache and
+admission control off:
+
+    python -m benchmarks.concurrency --start
+
+Otherwise start each the same way, e.g.
+
+    export RESPONSE_CACHE_BACKEND=none ADMISSION_BACKEND=none
+    gunicorn --workers 1 --bind 127.0.0.1:8000 app:app
+    hypercorn --workers 1 --bind 127.0.0.1:8001 asgi:app
+
+then
+
+    python -m benchmarks.concurrency --sync-url http://127.0.0.1:8000 \
+        --async-url http://127.0.0.1:8001
+
+Each level of concurrency runs that many clients, each on its own
+keep-alive connection, requesting group listing pages and single groups
+for --duration seconds. Throughput and latency percentiles per level are
+written as JSON to benchmarks/results/. The run stops if a server answers
+from its cache or sheds requests, as it would not be comparable.
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from .support import percentile, write_results
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# environment of the servers started with --start
+SERVER_ENV = {'RESPONSE_CACHE_BACKEND': 'none', 'ADMISSION_BACKEND': 'none'}
+
+# seconds a started server has to accept connections
+START_TIMEOUT = 30
+
+
+def start_server(name, url):
+    """
+    Starts one worker of the sync (gunicorn app:app) or async (hypercorn
+    asgi:app) app on the address of url, with SERVER_ENV, and waits until
+    it accepts connections.
+    """
+    parts = urlsplit(url)
+    bind = f'{parts.hostname}:{parts.port}'
+    command = {
+        'sync': ['gunicorn', '--workers', '1', '--bind', bind, 'app:app'],
+        'async': ['hypercorn', '--workers', '1', '--bind', bind,
+                  'asgi:app'],
+    }[name]
+    server = subprocess.Popen(command, env=dict(os.environ, **SERVER_ENV))
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f'{command[0]} exited with {server.returncode}')
+        try:
+            connection = http.client.HTTPConnection(parts.hostname,
+                                                    parts.port, timeout=1)
+            connection.request('GET', '/api/groups/1')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+
+    server.terminate()
+    sys.exit(f'{command[0]} did not start on {bind}')
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def client(url, paths, deadline, results, lock):
+    """
+    Requests random paths until the deadline, recording each latency, and
+    counting the responses served from a cache or shed by admission
+    control (429, or 503 with Retry-After).
+    """
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                            timeout=30)
+    latencies, errors, cached, shed = [], 0, 0, 0
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', random.choice(paths))
+            response = connection.getresponse()
+            response.read()
+            if response.getheader('X-Cache') is not None:
+                cached += 1
+            if response.status == 429 or (
+                    response.status == 503
+                    and response.getheader('Retry-After') is not None):
+                shed += 1
+            elif response.status >= 500:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+
+    connection.close()
+    with lock:
+        results['latencies'] += latencies
+        results['errors'] += errors
+        results['cached'] += cached
+        results['shed'] += shed
+
+
+def run_level(url, paths, concurrency, duration):
+    results = {'latencies': [], 'errors': 0, 'cached': 0, 'shed': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    threads = [threading.Thread(target=client, args=(url, paths, deadline,
+                                                     results, lock))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = results['latencies']
+    if not latencies:
+        return {'requests': 0, 'errors': results['errors'],
+                'cached': results['cached'], 'shed': results['shed']}
+
+    return {
+        'requests': len(latencies),
+        'errors': results['errors'],
+        'cached': results['cached'],
+        'shed': results['shed'],
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sync-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--async-url', default='http://127.0.0.1:8001')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16, 64, 256])
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds per level')
+    parser.add_argument('--max-group-id', type=int, default=1000,
+                        help='groups and pages are picked up to this number')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--start', action='store_true',
+                        help='start both servers, with the response cache '
+                             'and admission control off')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    paths = [rng.choice(['/api/groups/{}', '/api/groups?page={}']).format(
+        rng.randint(1, args.max_group_id)) for _ in range(1000)]
+
+    results = {'duration': args.duration, 'seed': args.seed, 'servers': {}}
+    for name, url in [('sync', args.sync_url), ('async', args.async_url)]:
+        results['servers'][name] = {'url': url, 'levels': {}}
+        server = start_server(name, url) if args.start else None
+
+        try:
+            for concurrency in args.concurrency:
+                summary = run_level(url, paths, concurrency, args.duration)
+                results['servers'][name]['levels'][str(concurrency)] = \
+                    summary
+                print(f'{name} x{concurrency}: '
+                      f'{summary.get("throughput_rps", 0)} req/s '
+                      f'p50 {summary.get("p50_ms")}ms '
+                      f'p99 {summary.get("p99_ms")}ms '
+                      f'{summary["errors"]} errors')
+
+                if summary['cached'] or summary['shed']:
+                    sys.exit(f'{name} served {summary["cached"]} cached '
+                             f'responses and shed {summary["shed"]} '
+                             f'requests; start it with '
+                             f'RESPONSE_CACHE_BACKEND=none and '
+                             f'ADMISSION_BACKEND=none, or use --start')
+        finally:
+            if server is not None:
+                stop_server(server)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'concurrency-{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_results(output, results)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
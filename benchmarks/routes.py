@@ -0,0 +1,214 @@
+"""
+Benchmarks each route in backend/api/routes.py against the database of the
+chosen config, usually after loading production-scale data with
+
+    flask generate --groups 100000 --requests 1000000
+
+then
+
+    python -m benchmarks.routes --config development --requests 500
+
+Latency percentiles, SQL statements per request and sequential throughput
+are written as JSON to benchmarks/results/, and two runs can be compared
+with python -m benchmarks.compare. Write routes restore the data they
+change, apart from group emails.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from backend import create_app, db
+from backend.api.pagination import encode_cursor
+from backend.instrumentation import count_queries
+from backend.models import Group, ItemRequested
+from config import config_dict
+from .support import LocalSigner, summarise, write_results
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+BENCHMARK_GROUP_NAME = 'Benchmark group'
+
+
+def sample_data(rng, requests):
+    """Picks the ids, cursors and requested items the scenarios use."""
+    groups = db.session.execute(
+        select(Group.id, Group.county, Group.city)
+        .order_by(func.random()).limit(requests)).all()
+    total_groups = db.session.execute(
+        select(func.count()).select_from(Group)).scalar()
+
+    # requested items, one per group, so each can be deleted and re-added
+    pairs = db.session.execute(
+        select(ItemRequested.group_id, func.min(ItemRequested.item_id))
+        .group_by(ItemRequested.group_id)
+        .order_by(func.random()).limit(requests)).all()
+
+    # groups with at least 10 requested items for the bulk routes
+    bulk = []
+    for group_id, in db.session.execute(
+            select(ItemRequested.group_id)
+            .group_by(ItemRequested.group_id)
+            .having(func.count() >= 10)
+            .order_by(func.random()).limit(requests)).all():
+        item_ids = db.session.execute(
+            select(ItemRequested.item_id)
+            .where(ItemRequested.group_id == group_id)
+            .limit(10)).scalars().all()
+        bulk.append((group_id, item_ids))
+
+    return {
+        'groups': groups,
+        'pages': [rng.randint(1, max(total_groups // 5, 1))
+                  for _ in range(requests)],
+        'pairs': pairs,
+        'bulk': bulk,
+        'total_groups': total_groups,
+        'total_item_requested': db.session.execute(
+            select(func.count()).select_from(ItemRequested)).scalar(),
+    }
+
+
+def scenarios(data, signer):
+    """
+    Returns (name, list of request callables) per route. Each callable
+    takes the test client.
+    """
+    patch = signer.header('patch:group_email')
+    post_group = signer.header('post:group')
+    post_item = signer.header('post:item_requested')
+    delete_item = signer.header('delete:item_requested')
+
+    group_body = {'name': BENCHMARK_GROUP_NAME, 'description': 'Benchmark',
+                  'address': '1 Benchmark Road', 'city': 'Leeds',
+                  'county': 'West Yorkshire', 'postcode': 'LS1 1AA',
+                  'email': 'benchmark@example.org'}
+
+    return [
+        ('get_groups?page', [
+            lambda client, page=page: client.get(f'/api/groups?page={page}')
+            for page in data['pages']]),
+        ('get_groups?cursor', [
+            lambda client, cursor=encode_cursor([county, city, id]):
+            client.get(f'/api/groups?cursor={cursor}')
+            for id, county, city in data['groups']]),
+        ('get_group_by_id', [
+            lambda client, id=id: client.get(f'/api/groups/{id}')
+            for id, _, _ in data['groups']]),
+        ('update_group_by_id', [
+            lambda client, id=id: client.patch(
+                f'/api/groups/{id}', headers=patch,
+                json={'email': f'benchmark{id}@example.org'})
+            for id, _, _ in data['groups']]),
+        ('create_item', [
+            lambda client: client.post('/api/groups', headers=post_group,
+                                       json=group_body)
+            for _ in data['groups']]),
+        # deletes then re-adds the same requested items
+        ('delete_requested_item_by_id', [
+            lambda client, group_id=group_id, item_id=item_id: client.delete(
+                f'/api/groups/{group_id}/items/{item_id}',
+                headers=delete_item)
+            for group_id, item_id in data['pairs']]),
+        ('update_items', [
+            lambda client, group_id=group_id, item_id=item_id: client.post(
+                f'/api/groups/{group_id}/items', headers=post_item,
+                json={'item_id': item_id})
+            for group_id, item_id in data['pairs']]),
+        ('delete_requested_items', [
+            lambda client, group_id=group_id, item_ids=item_ids:
+            client.delete(f'/api/groups/{group_id}/items',
+                          headers=delete_item, json={'item_ids': item_ids})
+            for group_id, item_ids in data['bulk']]),
+        ('update_items[bulk]', [
+            lambda client, group_id=group_id, item_ids=item_ids:
+            client.post(f'/api/groups/{group_id}/items',
+                        headers=post_item, json={'item_ids': item_ids})
+            for group_id, item_ids in data['bulk']]),
+    ]
+
+
+def run_scenario(client, engine, calls, warmup):
+    for call in calls[:warmup]:
+        call(client)
+
+    latencies, queries, status_codes = [], [], []
+    started = time.perf_counter()
+
+    for call in calls[warmup:]:
+        with count_queries(engine) as counter:
+            request_started = time.perf_counter()
+            response = call(client)
+            latencies.append(time.perf_counter() - request_started)
+        queries.append(counter.count)
+        status_codes.append(response.status_code)
+
+    return summarise(latencies, queries, status_codes,
+                     time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', choices=list(config_dict),
+                        default='development')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per route')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the response cache enabled')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    # one client sends every request, so the rate limit is lifted to time
+    # the routes rather than their 429s
+    config = type('BenchmarkConfig', (config_dict[args.config],), {
+        'SQLALCHEMY_ECHO': False,
+        'RESPONSE_CACHE_BACKEND': (config_dict[args.config]
+                                   .RESPONSE_CACHE_BACKEND
+                                   if args.cache else 'none'),
+        'ADMISSION_BACKEND': 'none',
+    })
+    app = create_app(config)
+    signer = LocalSigner()
+    signer.install()
+
+    results = {'config': args.config, 'requests_per_route': args.requests,
+               'seed': args.seed, 'response_cache': args.cache,
+               'routes': {}}
+
+    with app.app_context():
+        data = sample_data(random.Random(args.seed),
+                           args.requests + args.warmup)
+        results['dataset'] = {'groups': data['total_groups'],
+                              'item_requested': data['total_item_requested']}
+
+        client = app.test_client()
+        for name, calls in scenarios(data, signer):
+            if len(calls) <= args.warmup:
+                print(f'{name}: skipped, not enough data')
+                continue
+
+            summary = run_scenario(client, db.engine, calls, args.warmup)
+            results['routes'][name] = summary
+            print(f'{name}: p50 {summary["p50_ms"]}ms '
+                  f'p95 {summary["p95_ms"]}ms p99 {summary["p99_ms"]}ms '
+                  f'{summary["queries_per_request"]} queries '
+                  f'{summary["throughput_rps"]} req/s')
+
+        db.session.execute(delete(Group)
+                           .where(Group.name == BENCHMARK_GROUP_NAME))
+        db.session.commit()
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_results(output, results)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
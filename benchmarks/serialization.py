@@ -0,0 +1,118 @@
+"""
+Compares the two ways of building a page of the group listing: loading
+Group objects and calling format() on each, and selecting columns with
+Group.listing_select() and Group.format_rows(). Each is timed with the
+default JSON provider and, when orjson is installed, with OrjsonProvider,
+e.g.
+
+    python -m benchmarks.serialization --config development --page-size 100
+
+Timings cover the queries, building the dicts and encoding the response.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import func, select
+
+from backend import create_app, db
+from backend.instrumentation import count_queries
+from backend.models import Group
+from config import config_dict
+from .support import summarise, write_results
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def format_objects(offset, limit):
+    groups = (Group.query
+              .options(Group.load_items_requested())
+              .order_by(Group.county, Group.city, Group.id)
+              .offset(offset).limit(limit).all())
+    return [group.format() for group in groups]
+
+
+def format_columns(offset, limit):
+    rows = db.session.execute(
+        Group.listing_select()
+        .order_by(Group.county, Group.city, Group.id)
+        .offset(offset).limit(limit)).all()
+    return Group.format_rows(rows)
+
+
+def providers(app):
+    yield 'json', DefaultJSONProvider(app)
+    try:
+        from backend.json_provider import OrjsonProvider
+        yield 'orjson', OrjsonProvider(app)
+    except ImportError:
+        print('orjson is not installed, skipping OrjsonProvider')
+
+
+def run(provider, build, offsets, limit):
+    latencies, queries = [], []
+    started = time.perf_counter()
+
+    for offset in offsets:
+        with count_queries(db.engine) as counter:
+            request_started = time.perf_counter()
+            provider.response({'success': True,
+                               'groups': build(offset, limit)}).get_data()
+            latencies.append(time.perf_counter() - request_started)
+        queries.append(counter.count)
+        # start each page with an empty identity map, as a request would
+        db.session.remove()
+
+    return summarise(latencies, queries, [200] * len(latencies),
+                     time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', choices=list(config_dict),
+                        default='development')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    app = create_app(type('BenchmarkConfig', (config_dict[args.config],),
+                          {'SQLALCHEMY_ECHO': False}))
+    results = {'config': args.config, 'pages': args.pages,
+               'page_size': args.page_size, 'seed': args.seed, 'paths': {}}
+
+    with app.app_context():
+        total_groups = db.session.execute(
+            select(func.count()).select_from(Group)).scalar()
+        rng = random.Random(args.seed)
+        offsets = [rng.randrange(max(total_groups - args.page_size, 1))
+                   for _ in range(args.pages)]
+        results['dataset'] = {'groups': total_groups}
+
+        for provider_name, provider in providers(app):
+            for path_name, build in [('format', format_objects),
+                                     ('format_rows', format_columns)]:
+                name = f'{path_name}+{provider_name}'
+                # warm up the connection pool and statement caches
+                run(provider, build, offsets[:5], args.page_size)
+
+                summary = run(provider, build, offsets, args.page_size)
+                results['paths'][name] = summary
+                print(f'{name}: p50 {summary["p50_ms"]}ms '
+                      f'p95 {summary["p95_ms"]}ms '
+                      f'{summary["queries_per_request"]} queries '
+                      f'{summary["throughput_rps"]} pages/s')
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'serialization-{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_results(output, results)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
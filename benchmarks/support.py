@@ -0,0 +1,106 @@
+import base64
+import json
+import math
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from backend.api import auth
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarise(latencies, queries, status_codes, elapsed):
+    """
+    :param latencies: seconds per request
+    :param queries: SQL statements per request
+    :param status_codes: status code per request
+    :param elapsed: wall clock seconds for all the requests
+    """
+    codes = {}
+    for code in status_codes:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'status_codes': codes,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results):
+    results = dict(results, git_revision=git_revision(),
+                   recorded_at=datetime.now(timezone.utc).isoformat())
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+class StaticKeys:
+    """Stands in for the JWKS store with a single local key."""
+
+    def __init__(self, jwk):
+        self.jwk = jwk
+
+    def get_key(self, kid):
+        return self.jwk if kid == self.jwk['kid'] else None
+
+
+class LocalSigner:
+    """
+    Signs tokens with a local RSA key and points the auth module at it, so
+    the authenticated routes can be benchmarked without Auth0.
+    """
+
+    def __init__(self, kid='bench-key'):
+        self.private_key = rsa.generate_private_key(public_exponent=65537,
+                                                    key_size=2048)
+        numbers = self.private_key.public_key().public_numbers()
+        self.kid = kid
+        self.jwk = {'kid': kid, 'kty': 'RSA', 'use': 'sig',
+                    'n': self._b64_uint(numbers.n),
+                    'e': self._b64_uint(numbers.e)}
+
+    @staticmethod
+    def _b64_uint(value):
+        data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+    def install(self):
+        auth.AUTH0_DOMAIN = 'chipin.bench'
+        auth.API_AUDIENCE = 'chipin'
+        auth.ALGORITHMS = ['RS256']
+        auth.jwks_store = StaticKeys(self.jwk)
+
+    def header(self, *permissions):
+        pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+        claims = {'iss': 'https://chipin.bench/', 'aud': 'chipin',
+                  'sub': 'auth0|bench', 'exp': int(time.time()) + 3600,
+                  'permissions': list(permissions)}
+        token = jwt.encode(claims, pem, algorithm='RS256',
+                           headers={'kid': self.kid})
+        return {'Authorization': f'Bearer {token}'}
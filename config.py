@@ -6,6 +6,55 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # memory (per worker), redis (shared by all workers) or none
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_REDIS_URL = os.getenv('REDIS_URL')
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    # optional read replica for the anonymous read endpoints
+    REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = ({'replica': REPLICA_DATABASE_URL}
+                        if REPLICA_DATABASE_URL else {})
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+    READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 10))
+    # oldest precomputed statistics GET /api/stats serves, in seconds
+    STATS_MAX_STALENESS_SECONDS = int(os.getenv('STATS_MAX_STALENESS_SECONDS',
+                                                300))
+    # days of changes kept for GET /api/changes by flask compact-changes
+    CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS',
+                                              30))
+    # GET /api/events: seconds between heartbeats, events buffered per
+    # client before it is disconnected, and seconds between reads of the
+    # change log when not notified by Postgres
+    SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_BUFFER_SIZE = int(os.getenv('SSE_BUFFER_SIZE', 100))
+    CHANGE_POLL_SECONDS = float(os.getenv('CHANGE_POLL_SECONDS', 2))
+    # admission control: memory (limits per worker), redis (limits shared
+    # by all workers) or none
+    ADMISSION_BACKEND = os.getenv('ADMISSION_BACKEND', 'memory')
+    ADMISSION_REDIS_URL = os.getenv('REDIS_URL')
+    # requests of each class of routes running at once; more get a 503.
+    # Event streams stay open, each holding a worker thread
+    ADMISSION_CONCURRENCY = {
+        'read': int(os.getenv('ADMISSION_CONCURRENCY_READ', 6)),
+        'search': int(os.getenv('ADMISSION_CONCURRENCY_SEARCH', 2)),
+        'export': int(os.getenv('ADMISSION_CONCURRENCY_EXPORT', 2)),
+        'write': int(os.getenv('ADMISSION_CONCURRENCY_WRITE', 2)),
+        'events': int(os.getenv('ADMISSION_CONCURRENCY_EVENTS', 40)),
+    }
+    # requests per second each client (JWT sub or address) can make to
+    # those routes, and how many it can make at once; more get a 429
+    RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 10))
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 50))
+    # proxies in front of the app whose X-Forwarded-For is trusted for the
+    # client address; 0 when clients connect directly
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    # default (stdlib json) or orjson, which needs the orjson package
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'default')
+    # Prometheus metrics at /metrics, and a Server-Timing response header
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false') == 'true'
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'false') == 'true'
 
 
 class DevelopmentConfig(Config):
@@ -21,6 +70,25 @@ class ProductionConfig(Config):
     DEBUG = False
     FLASK_DEBUG = False
     FLASK_ENV = 'production'
+    # Heroku still hands out postgres:// urls, which SQLAlchemy rejects
+    SQLALCHEMY_DATABASE_URI = (os.getenv('DATABASE_URL') or '').replace(
+        'postgres://', 'postgresql://', 1) or None
+    # per worker: at most pool_size + max_overflow connections, waiting at
+    # most pool_timeout seconds for one
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 5)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(
+        os.getenv('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))
+    # set when connecting through PgBouncer in transaction pooling mode
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false') == 'true'
+    # Heroku's router
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 1))
 
 
 class TestingConfig(Config):
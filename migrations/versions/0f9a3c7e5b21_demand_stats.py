@@ -0,0 +1,53 @@
+"""demand stats
+
+Revision ID: 0f9a3c7e5b21
+Revises: b7d41e9c03f2
+Create Date: 2026-10-18 19:48:05.226871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0f9a3c7e5b21'
+down_revision = 'b7d41e9c03f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stats_refresh',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # as in backend/stats.py
+    op.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS demand_stats AS
+        SELECT r.item_id, i.category_id, g.county,
+               date_trunc('week', coalesce(r.date_requested, 'epoch'))::date
+                   AS week,
+               count(*) AS requests
+        FROM item_requested r
+        JOIN item i ON i.id = r.item_id
+        JOIN "group" g ON g.id = r.group_id
+        GROUP BY 1, 2, 3, 4
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_demand_stats_item_id_county_week
+        ON demand_stats (item_id, county, week)
+    """)
+    op.execute("INSERT INTO stats_refresh (name, refreshed_at) "
+               "VALUES ('demand_stats', now())")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP MATERIALIZED VIEW IF EXISTS demand_stats')
+
+    op.drop_table('stats_refresh')
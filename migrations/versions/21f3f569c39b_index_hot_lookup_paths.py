@@ -0,0 +1,43 @@
+"""index hot lookup paths
+
+Revision ID: 21f3f569c39b
+Revises: 8cd00f2faee6
+Create Date: 2026-10-18 16:23:57.708732
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '21f3f569c39b'
+down_revision = '8cd00f2faee6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # requests used to be inserted without a duplicate check - keep the
+    # earliest request of each (group_id, item_id) so the unique index can
+    # be built
+    op.execute('DELETE FROM item_requested WHERE id NOT IN '
+               '(SELECT min(id) FROM item_requested '
+               'GROUP BY group_id, item_id)')
+
+    # build the indexes without blocking writes on a live database
+    with op.get_context().autocommit_block():
+        op.create_index('ix_item_requested_group_id_item_id',
+                        'item_requested', ['group_id', 'item_id'],
+                        unique=True, postgresql_concurrently=True)
+        op.create_index('ix_group_county_city_id', 'group',
+                        ['county', 'city', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_item_category_id', 'item', ['category_id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_item_category_id', table_name='item')
+    op.drop_index('ix_group_county_city_id', table_name='group')
+    op.drop_index('ix_item_requested_group_id_item_id',
+                  table_name='item_requested')
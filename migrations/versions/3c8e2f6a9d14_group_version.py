@@ -0,0 +1,45 @@
+"""group version and updated_at
+
+Revision ID: 3c8e2f6a9d14
+Revises: 0f9a3c7e5b21
+Create Date: 2026-10-18 21:40:17.208391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e2f6a9d14'
+down_revision = '0f9a3c7e5b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # updated_at is a naive UTC time. Postgres would store CURRENT_TIMESTAMP
+    # in the session's time zone; SQLite's is in UTC.
+    if op.get_bind().dialect.name == 'postgresql':
+        now = sa.text("timezone('utc', now())")
+    else:
+        now = sa.text('CURRENT_TIMESTAMP')
+
+    # defaults that are the same for every row, so Postgres adds the
+    # columns, and fills in the existing rows, without rewriting the table
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(),
+                                      server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(),
+                                      server_default=now, nullable=False))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_group_updated_at', 'group', ['updated_at'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_group_updated_at', table_name='group')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
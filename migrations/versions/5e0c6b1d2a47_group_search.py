@@ -0,0 +1,176 @@
+"""group search
+
+Revision ID: 5e0c6b1d2a47
+Revises: 853b7af5940e
+Create Date: 2026-10-18 18:41:37.102955
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c6b1d2a47'
+down_revision = '853b7af5940e'
+branch_labels = None
+depends_on = None
+
+# functions and triggers keeping the search columns up to date, as in
+# backend/search.py
+SEARCH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION group_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        items text;
+        categories text;
+    BEGIN
+        SELECT string_agg(i.name, ' '), string_agg(DISTINCT c.name, ' ')
+        INTO items, categories
+        FROM item_requested r
+        JOIN item i ON i.id = r.item_id
+        JOIN category c ON c.id = i.category_id
+        WHERE r.group_id = NEW.id;
+
+        NEW.search_text := concat_ws(' ', NEW.name, NEW.city, NEW.county,
+                                     items, categories);
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('english',
+                                     concat_ws(' ', NEW.city, NEW.county,
+                                               items)), 'B')
+            || setweight(to_tsvector('english', coalesce(categories, '')),
+                         'C')
+            || setweight(to_tsvector('english',
+                                     coalesce(NEW.description, '')), 'D');
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION item_requested_search_trigger()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (SELECT group_id FROM new_rows);
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (SELECT group_id FROM old_rows);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION catalog_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'item' THEN
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (
+                SELECT r.group_id FROM item_requested r
+                JOIN new_rows n ON n.id = r.item_id
+                JOIN old_rows o ON o.id = n.id
+                WHERE (o.name, o.category_id)
+                      IS DISTINCT FROM (n.name, n.category_id));
+        ELSE
+            UPDATE "group" SET search_text = search_text
+            WHERE id IN (
+                SELECT r.group_id FROM item_requested r
+                JOIN item i ON i.id = r.item_id
+                JOIN new_rows n ON n.id = i.category_id
+                JOIN old_rows o ON o.id = n.id
+                WHERE o.name IS DISTINCT FROM n.name);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    'DROP TRIGGER IF EXISTS group_search ON "group"',
+    """
+    CREATE TRIGGER group_search
+    BEFORE INSERT OR UPDATE OF name, description, city, county, search_text
+    ON "group" FOR EACH ROW EXECUTE FUNCTION group_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_insert ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_insert
+    AFTER INSERT ON item_requested REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_update ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_update
+    AFTER UPDATE ON item_requested
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_requested_search_delete ON item_requested',
+    """
+    CREATE TRIGGER item_requested_search_delete
+    AFTER DELETE ON item_requested REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION item_requested_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS item_search ON item',
+    """
+    CREATE TRIGGER item_search
+    AFTER UPDATE ON item
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_search_trigger()
+    """,
+    'DROP TRIGGER IF EXISTS category_search ON category',
+    """
+    CREATE TRIGGER category_search
+    AFTER UPDATE ON category
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_search_trigger()
+    """,
+]
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column(
+            'search_vector',
+            sa.Text().with_variant(postgresql.TSVECTOR(), 'postgresql'),
+            nullable=True))
+        batch_op.add_column(sa.Column('search_text', sa.Text(),
+                                      nullable=True))
+
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for statement in SEARCH_DDL:
+        op.execute(statement)
+
+    # fill in the search columns of existing groups through the trigger
+    op.execute('UPDATE "group" SET search_text = search_text')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_group_search_vector', 'group', ['search_vector'],
+                        postgresql_using='gin',
+                        postgresql_concurrently=True)
+        op.create_index('ix_group_search_text_trgm', 'group',
+                        ['search_text'], postgresql_using='gin',
+                        postgresql_ops={'search_text': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_group_search_text_trgm', table_name='group')
+        op.drop_index('ix_group_search_vector', table_name='group')
+        op.execute('DROP TRIGGER IF EXISTS category_search ON category')
+        op.execute('DROP TRIGGER IF EXISTS item_search ON item')
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f'DROP TRIGGER IF EXISTS item_requested_search_{event} '
+                       f'ON item_requested')
+        op.execute('DROP TRIGGER IF EXISTS group_search ON "group"')
+        op.execute('DROP FUNCTION IF EXISTS catalog_search_trigger()')
+        op.execute('DROP FUNCTION IF EXISTS item_requested_search_trigger()')
+        op.execute('DROP FUNCTION IF EXISTS group_search_trigger()')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('search_text')
+        batch_op.drop_column('search_vector')
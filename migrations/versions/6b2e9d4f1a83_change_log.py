@@ -0,0 +1,44 @@
+"""change log
+
+Revision ID: 6b2e9d4f1a83
+Revises: 3c8e2f6a9d14
+Create Date: 2026-10-18 22:31:48.604172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e9d4f1a83'
+down_revision = '3c8e2f6a9d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+              nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('operation', sa.String(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_change_log_changed_at', 'change_log', ['changed_at'])
+
+    op.create_table('change_log_compaction',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('compacted_through', sa.BigInteger(), nullable=False),
+    sa.Column('compacted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('change_log_compaction')
+    op.drop_index('ix_change_log_changed_at', table_name='change_log')
+    op.drop_table('change_log')
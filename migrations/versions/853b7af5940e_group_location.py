@@ -0,0 +1,48 @@
+"""group location
+
+Revision ID: 853b7af5940e
+Revises: 21f3f569c39b
+Create Date: 2026-10-18 18:02:11.415320
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '853b7af5940e'
+down_revision = '21f3f569c39b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(),
+                                      nullable=True))
+
+    # existing groups are located afterwards with flask geocode-groups
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+        op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+
+        with op.get_context().autocommit_block():
+            op.create_index('ix_group_earth_location', 'group',
+                            [sa.text('ll_to_earth(latitude, longitude)')],
+                            postgresql_using='gist',
+                            postgresql_concurrently=True)
+    else:
+        op.create_index('ix_group_latitude_longitude', 'group',
+                        ['latitude', 'longitude'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_group_earth_location', table_name='group')
+    else:
+        op.drop_index('ix_group_latitude_longitude', table_name='group')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,39 @@
+"""change log horizon
+
+Revision ID: 9d4a7c1e5f30
+Revises: 6b2e9d4f1a83
+Create Date: 2026-10-18 23:52:07.318214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a7c1e5f30'
+down_revision = '6b2e9d4f1a83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('change_log', sa.Column('txid', sa.BigInteger(),
+                                          nullable=True))
+    op.create_index('ix_change_log_txid', 'change_log', ['txid'])
+
+    op.create_table('change_log_horizon',
+    sa.Column('txid', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('visible_after', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('txid')
+    )
+    op.create_index('ix_change_log_horizon_visible_after',
+                    'change_log_horizon', ['visible_after'])
+
+
+def downgrade():
+    op.drop_index('ix_change_log_horizon_visible_after',
+                  table_name='change_log_horizon')
+    op.drop_table('change_log_horizon')
+    with op.batch_alter_table('change_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_change_log_txid')
+        batch_op.drop_column('txid')
@@ -0,0 +1,28 @@
+"""index item_requested item_id
+
+Revision ID: b7d41e9c03f2
+Revises: 5e0c6b1d2a47
+Create Date: 2026-10-18 19:12:48.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41e9c03f2'
+down_revision = '5e0c6b1d2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_item_requested_item_id_group_id',
+                        'item_requested', ['item_id', 'group_id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_item_requested_item_id_group_id',
+                  table_name='item_requested')